@@ -0,0 +1,341 @@
+import argparse
+import contextlib
+import html
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+for task in ("task1", "task2", "task3", "task4", "task5"):
+    sys.path.append(str(ROOT / task))
+from common.lemma_cache import get_lemma_cache  # noqa: E402
+from common.spacy_model import load_nlp  # noqa: E402
+from cleaning import process_all_pages  # noqa: E402
+from text_processing import normalize_text, process_corpus  # noqa: E402
+from build_inverted_index import collect_positions, collect_postings  # noqa: E402
+from index_format import open_index, write_binary_index, write_positional_index  # noqa: E402
+from boolean_query import OPERATORS, Evaluator, parse  # noqa: E402
+import tf_idf_count  # noqa: E402
+from vector_search import build_query_vector, load_matrix, search_taat  # noqa: E402
+
+# Бенчмарк всего стека на синтетическом корпусе: очистка, лемматизация, индекс, tf-idf,
+# булевы и ранжированные запросы.
+#
+# Корпус -- страницы, похожие на рецензии pitchfork (title/og:title, description, ld+json с
+# автором и reviewBody, info-slice, абзацы в article), чтобы очистка шла по тем же веткам,
+# что на настоящих страницах. Слова берутся по закону Ципфа из словаря: слова task1/cleaned
+# по убыванию частоты, дальше -- сгенерированные из слогов. Корпус определяется
+# размером и --seed, поэтому результаты разных коммитов можно сравнивать.
+#
+# Каждый этап идет в свежем процессе (spawn): время, пропускная способность и пиковый RSS
+# процесса (ru_maxrss, вместе с интерпретатором и импортами). Для запросов -- еще p50/p99
+# задержки одного запроса. Все пишется в JSON (по умолчанию bench/results/<коммит>.json),
+# --compare сравнивает два таких файла.
+
+CLEANED_DIR = ROOT / "task1/cleaned"
+RESULTS_DIR = ROOT / "bench/results"
+SIZES = [1000, 10000, 100000]
+STAGES = ("clean", "lemmatize", "index", "tfidf", "boolean_query", "ranked_query")
+VOCAB_SIZE = 50000
+ZIPF = 1.0
+DOC_LENGTH = 600  # слов в тексте рецензии в среднем
+QUERIES = 1000
+GENRES = ("Rock", "Pop/R&B", "Electronic", "Experimental", "Rap", "Jazz", "Folk/Country", "Metal", "Global")
+CONSONANTS = "bcdfghklmnprstvz"
+VOWELS = "aeiou"
+
+
+def base_vocabulary(cleaned_dir=CLEANED_DIR):
+    # слова настоящего корпуса по убыванию частоты (после той же нормализации, что в task2)
+    counts = Counter()
+    for path in Path(cleaned_dir).glob("*.txt"):
+        counts.update(normalize_text(path.read_text(encoding="utf-8")).split())
+    return [word for word, _ in counts.most_common()]
+
+
+def build_vocabulary(size, seed, cleaned_dir=CLEANED_DIR):
+    words = base_vocabulary(cleaned_dir)[:size]
+    known = set(words)
+    rng = random.Random(seed)
+    while len(words) < size:
+        word = "".join(rng.choice(CONSONANTS) + rng.choice(VOWELS) for _ in range(rng.randint(2, 4)))
+        if word not in known:
+            known.add(word)
+            words.append(word)
+    return words
+
+
+class CorpusGenerator:
+
+    def __init__(self, vocabulary, zipf=ZIPF, doc_length=DOC_LENGTH, seed=0):
+        self.vocabulary = vocabulary
+        weights = 1.0 / np.arange(1, len(vocabulary) + 1) ** zipf
+        self.cdf = np.cumsum(weights / weights.sum())  # выборка через searchsorted, без пересчета на каждый вызов
+        self.doc_length = doc_length
+        self.rng = np.random.default_rng(seed)
+        self.authors = [self.title(2) for _ in range(300)]
+        self.labels = [self.title(2) for _ in range(500)]
+
+    def words(self, n):
+        ids = np.minimum(np.searchsorted(self.cdf, self.rng.random(n)), len(self.vocabulary) - 1)
+        return [self.vocabulary[i] for i in ids.tolist()]
+
+    def title(self, n):
+        return " ".join(word.capitalize() for word in self.words(n))
+
+    def paragraphs(self, n_words):
+        words = self.words(n_words)
+        paragraphs = []
+        sentences = []
+        start = 0
+        while start < len(words):
+            end = start + int(self.rng.integers(8, 26))
+            sentence = words[start:end]
+            sentences.append(" ".join([sentence[0].capitalize()] + sentence[1:]) + ".")
+            start = end
+            if len(sentences) >= int(self.rng.integers(3, 7)) or start >= len(words):
+                paragraphs.append(" ".join(sentences))
+                sentences = []
+        return paragraphs
+
+    def page(self):
+        name = f"{self.title(int(self.rng.integers(1, 3)))}: {self.title(int(self.rng.integers(1, 4)))}"
+        description = " ".join(self.paragraphs(int(self.rng.integers(15, 35)))[:1])
+        author = self.authors[int(self.rng.integers(len(self.authors)))]
+        body = self.paragraphs(max(50, int(self.rng.normal(self.doc_length, self.doc_length / 3))))
+        info = [f"Genre: {GENRES[int(self.rng.integers(len(GENRES)))]}",
+                f"Label: {self.labels[int(self.rng.integers(len(self.labels)))]}",
+                f"Release Date: {int(self.rng.integers(1960, 2027))}"]
+        ld = {"@context": "https://schema.org", "@type": "Review", "name": name,
+              "author": [{"@type": "Person", "name": author}], "reviewBody": "\n\n".join(body)}
+        return "\n".join([
+            "<!DOCTYPE html><html><head>",
+            f"<title>{html.escape(name)} | Pitchfork</title>",
+            f'<meta property="og:title" content="{html.escape(name)}">',
+            f'<meta name="description" content="{html.escape(description)}">',
+            f'<script type="application/ld+json">{json.dumps(ld)}</script>',
+            "</head><body><main><article>",
+            f"<h1>{html.escape(name)}</h1>",
+            f'<div class="byline"><a href="/staff/{author.lower().replace(" ", "-")}/" rel="author">'
+            f"By {html.escape(author)}</a></div>",
+            '<div class="InfoSliceWrapper"><ul class="InfoSliceList">'
+            + "".join(f'<li class="InfoSliceListItem">{html.escape(item)}</li>' for item in info) + "</ul></div>",
+            '<div class="body__inner-container">' + "".join(f"<p>{html.escape(p)}</p>" for p in body) + "</div>",
+            "</article></main></body></html>",
+        ])
+
+
+def generate_corpus(pages_dir, n_docs, vocabulary, seed=0, doc_length=DOC_LENGTH, zipf=ZIPF):
+    pages_dir.mkdir(parents=True, exist_ok=True)
+    generator = CorpusGenerator(vocabulary, zipf, doc_length, seed)
+    for doc_id in range(1, n_docs + 1):
+        (pages_dir / f"{doc_id}.txt").write_text(generator.page(), encoding="utf-8")
+
+
+def random_queries(vocabulary, count, seed):
+    # слова запросов -- из частых, но не самых частых слов (там в основном стоп-слова), без операторов
+    rng = random.Random(seed)
+    pool = [word for word in vocabulary[100:5000] or vocabulary if word.isalpha() and word not in OPERATORS]
+    boolean_templates = ("{a}", "{a} and {b}", "{a} or {b}", "{a} and not {b}", "({a} or {b}) and {c}")
+    boolean = [rng.choice(boolean_templates).format(a=rng.choice(pool), b=rng.choice(pool), c=rng.choice(pool))
+               for _ in range(count)]
+    ranked = [" ".join(rng.choice(pool) for _ in range(rng.randint(1, 5))) for _ in range(count)]
+    return boolean, ranked
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # ru_maxrss в КБ (Linux)
+
+
+# Этапы: выполняются в отдельном процессе, возвращают (число обработанных элементов, задержки или None)
+
+def stage_clean(work, workers):
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        process_all_pages(work / "pages", work / "cleaned", workers=workers)
+    return len(list((work / "cleaned").glob("*.txt"))), None
+
+
+def stage_lemmatize(work, workers):
+    nlp = load_nlp()
+    lemma_cache = get_lemma_cache(nlp, path=work / "lemma_cache.json")  # общий кэш лемм не трогаем
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        process_corpus(nlp, str(work / "cleaned"), str(work / "processed_txts"), n_process=workers,
+                       lemma_cache=lemma_cache)
+    return len(list((work / "processed_txts").glob("*_lemmas.txt"))), None
+
+
+def stage_index(work, workers):
+    inverted_index = collect_postings(str(work / "processed_txts"), verbose=False)
+    write_binary_index(work / "inverted_index.bin", inverted_index)
+    positional_index = collect_positions(str(work / "processed_txts"))
+    if positional_index:
+        write_positional_index(work / "positional_index.bin", positional_index)
+    return len(set().union(*inverted_index.values())), None
+
+
+def stage_tfidf(work, workers):
+    os.chdir(work)  # tf_idf_count пишет в ./tfidf_outputs
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        tf_idf_count.update_tfidf(work / "cleaned", work / "processed_txts", Path("tfidf_outputs/stats.json"),
+                                  full=True)
+    return len(tf_idf_count.discover_doc_ids(work / "cleaned", work / "processed_txts")), None
+
+
+def stage_boolean_query(work, workers):
+    index = open_index(work / "inverted_index.bin")
+    positional_path = work / "positional_index.bin"
+    positional = open_index(positional_path) if positional_path.exists() else None
+    nlp = load_nlp()
+    lemma_cache = get_lemma_cache(nlp, path=work / "lemma_cache.json")
+
+    def lemmatize(word):
+        return lemma_cache.word(nlp, word)[0]
+
+    with (work / "boolean_queries.txt").open("r", encoding="utf-8") as f:
+        queries = f.read().splitlines()
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        Evaluator(index, positional).evaluate(parse(query, lemmatize))
+        latencies.append(time.perf_counter() - start)
+    return len(queries), latencies
+
+
+def stage_ranked_query(work, workers):
+    matrix, lemma_idf = load_matrix(work / "tfidf_outputs/lemmas_tfidf.bin")
+    nlp = load_nlp()
+    lemma_cache = get_lemma_cache(nlp, path=work / "lemma_cache.json")
+    with (work / "ranked_queries.txt").open("r", encoding="utf-8") as f:
+        queries = f.read().splitlines()
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        search_taat(build_query_vector(query, nlp, lemma_idf, lemma_cache), matrix)
+        latencies.append(time.perf_counter() - start)
+    return len(queries), latencies
+
+
+def measured(stage, work, workers):
+    # выполняется в дочернем процессе
+    start = time.perf_counter()
+    items, latencies = globals()[f"stage_{stage}"](work, workers)
+    return items, time.perf_counter() - start, latencies, peak_rss_mb()
+
+
+def run_stage(stage, work, workers):
+    with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as executor:
+        items, seconds, latencies, rss = executor.submit(measured, stage, work, workers).result()
+    result = {"items": items, "seconds": round(seconds, 4), "throughput": round(items / max(seconds, 1e-9), 2),
+              "peak_rss_mb": round(rss, 1)}
+    if latencies:
+        result["p50_ms"] = round(float(np.percentile(latencies, 50)) * 1000, 4)
+        result["p99_ms"] = round(float(np.percentile(latencies, 99)) * 1000, 4)
+    return result
+
+
+def bench_size(n_docs, vocabulary, args, work):
+    start = time.perf_counter()
+    generate_corpus(work / "pages", n_docs, vocabulary, args.seed, args.doc_length, args.zipf)
+    boolean, ranked = random_queries(vocabulary, args.queries, args.seed)
+    (work / "boolean_queries.txt").write_text("\n".join(boolean) + "\n", encoding="utf-8")
+    (work / "ranked_queries.txt").write_text("\n".join(ranked) + "\n", encoding="utf-8")
+    print(f"{n_docs} документов: корпус сгенерирован за {time.perf_counter() - start:.1f} s")
+
+    stages = {}
+    for stage in STAGES:
+        stages[stage] = run_stage(stage, work, args.workers)
+        line = (f"  {stage:<14} {stages[stage]['seconds']:9.2f} s  {stages[stage]['throughput']:10.1f}/s  "
+                f"RSS {stages[stage]['peak_rss_mb']:7.1f} MB")
+        if "p50_ms" in stages[stage]:
+            line += f"  p50 {stages[stage]['p50_ms']:.3f} ms  p99 {stages[stage]['p99_ms']:.3f} ms"
+        print(line)
+    return {"docs": n_docs, "stages": stages}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(base_path, new_path):
+    with open(base_path, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+    print(f"{base['commit']} -> {new['commit']} (время и RSS: новое / старое)")
+    base_runs = {run["docs"]: run["stages"] for run in base["runs"]}
+    for run in new["runs"]:
+        old_stages = base_runs.get(run["docs"])
+        if old_stages is None:
+            continue
+        print(f"{run['docs']} документов:")
+        for stage, result in run["stages"].items():
+            old = old_stages.get(stage)
+            if old is None:
+                continue
+            line = (f"  {stage:<14} time x{result['seconds'] / max(old['seconds'], 1e-9):5.2f}  "
+                    f"RSS x{result['peak_rss_mb'] / max(old['peak_rss_mb'], 1e-9):5.2f}")
+            if "p99_ms" in result and "p99_ms" in old:
+                line += f"  p99 x{result['p99_ms'] / max(old['p99_ms'], 1e-9):5.2f}"
+            print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк всего стека на синтетическом корпусе")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="размеры корпусов, документов")
+    parser.add_argument("--vocab", type=int, default=VOCAB_SIZE, help="размер словаря")
+    parser.add_argument("--zipf", type=float, default=ZIPF, help="показатель закона Ципфа")
+    parser.add_argument("--doc-length", type=int, default=DOC_LENGTH, help="слов в рецензии в среднем")
+    parser.add_argument("--queries", type=int, default=QUERIES, help="запросов каждого вида")
+    parser.add_argument("--workers", type=int, default=1, help="процессов в очистке и лемматизации")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", type=Path, help="где собирать корпуса (по умолчанию -- временная папка)")
+    parser.add_argument("--output", type=Path, help=f"JSON с результатами (по умолчанию {RESULTS_DIR}/<коммит>.json)")
+    parser.add_argument("--compare", type=Path, nargs=2, metavar=("BASE", "NEW"),
+                        help="сравнить два файла результатов и выйти")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        sys.exit()
+
+    vocabulary = build_vocabulary(args.vocab, args.seed)
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()}, {os.cpu_count()} CPU",
+        "params": {"vocab": args.vocab, "zipf": args.zipf, "doc_length": args.doc_length, "queries": args.queries,
+                   "workers": args.workers, "seed": args.seed},
+        "runs": [],
+    }
+    with tempfile.TemporaryDirectory(prefix="bench_stack_", dir=args.work_dir) as tmp:
+        for n_docs in args.sizes:
+            work = Path(tmp) / f"docs_{n_docs}"
+            work.mkdir()
+            report["runs"].append(bench_size(n_docs, vocabulary, args, work))
+            shutil.rmtree(work)  # корпус на 100k документов занимает гигабайты
+
+    output = args.output or RESULTS_DIR / f"{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with output.open("w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Результаты: {output}")
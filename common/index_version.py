@@ -0,0 +1,36 @@
+import hashlib
+import os
+from pathlib import Path
+
+# Версия артефактов индекса -- хэш содержимого файлов. task3 и task4 записывают ее рядом
+# с индексом после самих файлов; поиск по ней понимает, что индекс пересобран, и сбрасывает
+# кэш результатов (common/result_cache.py).
+
+
+def content_hash(paths):
+    digest = hashlib.sha256()
+    for path in map(Path, paths):
+        if not path.exists():
+            continue
+        digest.update(path.name.encode("utf-8") + b"\0")
+        with path.open("rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def write_version(version_path, paths):
+    version = content_hash(paths)
+    version_path = Path(version_path)
+    tmp_path = version_path.with_name(version_path.name + ".tmp")
+    tmp_path.write_text(version + "\n", encoding="utf-8")
+    os.replace(tmp_path, version_path)
+    return version
+
+
+def read_version(version_path, paths):
+    """Версия из файла; если его нет (индекс собран до появления версий) -- хэш самих файлов."""
+    try:
+        return Path(version_path).read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        return content_hash(paths)
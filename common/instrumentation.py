@@ -0,0 +1,263 @@
+import contextlib
+import cProfile
+import functools
+import json
+import pstats
+import threading
+import time
+from collections import Counter, defaultdict
+
+# Необязательная разметка горячих путей поиска: таймеры этапов, счетчики, трассы запросов.
+#
+#   with instrumentation.query(text):          # трасса одного запроса
+#       with instrumentation.span("lemmatize"): # этап; время -- собственное, без вложенных этапов
+#           ...
+#       instrumentation.count("postings", n)
+#
+# По умолчанию включена пустая реализация: span() отдает один и тот же nullcontext, count()
+# ничего не делает, поэтому выключенная разметка стоит один вызов функции. Горячие циклы
+# (чтение постингов) размечаются не вызовами внутри них, а оберткой Traced над индексом,
+# которая ставится только при включенной разметке.
+#
+# Включается enable() (в скриптах -- флаги --trace и --histograms). По каждому запросу
+# копится время этапов; в конце запроса оно уходит в гистограммы и, с --trace, строкой JSON
+# в файл трасс. Этапы вне запросов (загрузка индекса, spaCy) попадают в гистограммы по вызовам.
+# Трасса и стек этапов свои у каждого потока.
+
+BUCKETS_MS = (0.01, 0.03, 0.1, 0.3, 1, 3, 10, 30, 100, 300, 1000, 3000, 10000)
+REPORT_TOP = 15  # строк профиля в выводе --profile
+
+
+class NullInstrumentation:
+    enabled = False
+    _null = contextlib.nullcontext()
+
+    def span(self, name):
+        return self._null
+
+    def query(self, label):
+        return self._null
+
+    def count(self, name, n=1):
+        pass
+
+    def report(self):
+        return ""
+
+    def close(self, histograms_path=None):
+        pass
+
+
+class Instrumentation:
+    enabled = True
+
+    def __init__(self, trace_path=None):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.samples = defaultdict(list)  # этап -> длительности, мс (за запрос или за вызов вне запросов)
+        self.counters = Counter()
+        self.trace_file = open(trace_path, "w", encoding="utf-8") if trace_path else None
+
+    def _stack(self):
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    @contextlib.contextmanager
+    def span(self, name):
+        stack = self._stack()
+        frame = [0.0]  # время вложенных этапов
+        stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            stack.pop()
+            if stack:
+                stack[-1][0] += elapsed
+            self._add(name, (elapsed - frame[0]) * 1000)
+
+    def _add(self, name, ms):
+        trace = getattr(self.local, "trace", None)
+        if trace is not None:
+            trace["phases"][name] = trace["phases"].get(name, 0.0) + ms
+        else:
+            with self.lock:
+                self.samples[name].append(ms)
+
+    def count(self, name, n=1):
+        trace = getattr(self.local, "trace", None)
+        if trace is not None:
+            trace["counters"][name] = trace["counters"].get(name, 0) + n
+        with self.lock:
+            self.counters[name] += n
+
+    @contextlib.contextmanager
+    def query(self, label):
+        trace = self.local.trace = {"query": label, "phases": {}, "counters": {}}
+        start = time.perf_counter()
+        try:
+            yield trace
+        except Exception as e:
+            trace["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self.local.trace = None
+            trace["total_ms"] = (time.perf_counter() - start) * 1000
+            other = trace["total_ms"] - sum(trace["phases"].values())  # то, что не попало ни в один этап
+            with self.lock:
+                self.samples["query"].append(trace["total_ms"])
+                for name, ms in trace["phases"].items():
+                    self.samples[name].append(ms)
+                self.samples["other"].append(max(other, 0.0))
+                if self.trace_file is not None:
+                    trace["phases"] = {name: round(ms, 4) for name, ms in trace["phases"].items()}
+                    trace["total_ms"] = round(trace["total_ms"], 4)
+                    self.trace_file.write(json.dumps(trace, ensure_ascii=False) + "\n")
+
+    def histograms(self):
+        with self.lock:
+            samples = {name: sorted(values) for name, values in self.samples.items()}
+            counters = dict(self.counters)
+        phases = {}
+        for name, values in samples.items():
+            buckets = Counter()
+            for ms in values:
+                buckets[next((f"<={bound}" for bound in BUCKETS_MS if ms <= bound), f">{BUCKETS_MS[-1]}")] += 1
+            phases[name] = {
+                "count": len(values),
+                "total_ms": round(sum(values), 4),
+                "mean_ms": round(sum(values) / len(values), 4),
+                "p50_ms": round(percentile(values, 50), 4),
+                "p90_ms": round(percentile(values, 90), 4),
+                "p99_ms": round(percentile(values, 99), 4),
+                "max_ms": round(values[-1], 4),
+                "buckets": {bucket: buckets[bucket] for bucket in
+                            [f"<={bound}" for bound in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}"] if buckets[bucket]},
+            }
+        return {"phases": phases, "counters": counters}
+
+    def report(self):
+        data = self.histograms()
+        lines = [f"{'phase':<16} {'n':>7} {'total ms':>11} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}"]
+        for name, phase in sorted(data["phases"].items(), key=lambda item: -item[1]["total_ms"]):
+            lines.append(f"{name:<16} {phase['count']:>7} {phase['total_ms']:>11.2f} {phase['p50_ms']:>9.3f} "
+                         f"{phase['p90_ms']:>9.3f} {phase['p99_ms']:>9.3f} {phase['max_ms']:>9.3f}")
+        if data["counters"]:
+            lines.append("counters: " + ", ".join(f"{name} {n}" for name, n in sorted(data["counters"].items())))
+        return "\n".join(lines)
+
+    def close(self, histograms_path=None):
+        if histograms_path:
+            with open(histograms_path, "w", encoding="utf-8") as f:
+                json.dump(self.histograms(), f, indent=2, ensure_ascii=False)
+        if self.trace_file is not None:
+            self.trace_file.close()
+            self.trace_file = None
+
+
+def percentile(sorted_values, q):
+    # ближайший ранг, как у numpy.percentile(..., method="lower") для q из [0, 100]
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q / 100 * (len(sorted_values) - 1)))]
+
+
+class Traced:
+    """Обертка объекта: вызовы перечисленных методов идут в этап с тем же именем и считаются."""
+
+    def __init__(self, target, *methods):
+        self._target = target
+        for method in methods:
+            setattr(self, method, self._wrap(method, getattr(target, method)))
+
+    @staticmethod
+    def _wrap(name, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _current.span(name):
+                result = func(*args, **kwargs)
+            _current.count(name)
+            _current.count(f"{name}.items", len(result[0] if isinstance(result, tuple) else result))
+            return result
+        return wrapper
+
+    def __getattr__(self, name):
+        return getattr(self._target, name)
+
+
+_current = NullInstrumentation()
+
+
+def enable(trace_path=None):
+    global _current
+    _current = Instrumentation(trace_path)
+    return _current
+
+
+def enabled():
+    return _current.enabled
+
+
+def span(name):
+    return _current.span(name)
+
+
+def query(label):
+    return _current.query(label)
+
+
+def count(name, n=1):
+    _current.count(name, n)
+
+
+def report():
+    return _current.report()
+
+
+def traced(obj, *methods):
+    # обертка только при включенной разметке: выключенная не добавляет ни одного вызова
+    return Traced(obj, *methods) if _current.enabled else obj
+
+
+def timed(name):
+    """Декоратор для загрузчиков: вызов целиком -- один этап."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _current.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def add_arguments(parser):
+    parser.add_argument("--trace", help="включить разметку и писать трассу каждого запроса (JSON по строке) в файл")
+    parser.add_argument("--histograms", help="включить разметку и сохранить гистограммы этапов в JSON при выходе")
+    parser.add_argument("--profile", help="записать профиль cProfile сеанса (лучше вместе с --replay) в файл")
+
+
+def configure(args):
+    if args.trace or args.histograms:
+        enable(args.trace)
+
+
+def run_session(session, args):
+    """session() под cProfile, если задан --profile; затем отчет разметки и выгрузка гистограмм."""
+    if args.profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            session()
+        finally:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(REPORT_TOP)
+            print(f"cProfile: {args.profile} (python -m pstats {args.profile})")
+    else:
+        session()
+    if _current.enabled:
+        print(_current.report())
+    _current.close(args.histograms)
@@ -0,0 +1,124 @@
+import atexit
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+# Общий LRU-кэш лемм для task2, task3 и task5, сохраняется на диск между запусками.
+#
+# Ключи двух видов:
+#   "word"      -- слово само по себе (запросы): значение -- то, что spaCy дает для nlp(word)[0]
+#   "Word|POS|морфология" -- токен из контекста документа или запроса: ключ тот же, что у кэша
+#                  самого лемматизатора spaCy (orth, pos, morph). Правила (is_base_form, PROPN)
+#                  смотрят на морфологию и регистр, поэтому "saw" с VerbForm=Inf и с Tense=Past
+#                  кэшируются отдельно; кроме этих признаков, контекст на лемму не влияет
+# Значение -- [лемма, tag_].
+#
+# get, put и save идут под блокировкой, поэтому один кэш можно делить между потоками
+# (поисковый сервер), если у каждого потока своя копия модели spaCy.
+
+CACHE_FILE = Path(__file__).resolve().parent.parent / "lemma_cache.json"
+MAX_SIZE = 200_000
+
+
+def model_id(nlp):
+    return f"{nlp.meta.get('lang')}_{nlp.meta.get('name')}-{nlp.meta.get('version')}"
+
+
+class LemmaCache:
+
+    def __init__(self, path=CACHE_FILE, max_size=MAX_SIZE, model=None):
+        self.path = Path(path)
+        self.max_size = max_size
+        self.model = model
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not self.path.exists():
+            return
+        try:
+            with self.path.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return  # битый кэш просто пересобирается
+        if data.get("model") != self.model:
+            return  # леммы другой модели не годятся
+        for key, value in data.get("entries", [])[-self.max_size:]:
+            self.entries[key] = tuple(value)
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            tmp_path = self.path.with_suffix(".tmp")
+            with tmp_path.open("w", encoding="utf-8") as f:
+                json.dump({"model": self.model, "entries": [[k, list(v)] for k, v in self.entries.items()]}, f,
+                          ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+            self.dirty = True
+
+    def word(self, nlp, word):
+        """(лемма, tag_) для отдельного слова, spaCy вызывается только при промахе."""
+        key = word.lower()
+        value = self.get(key)
+        if value is None:
+            doc = nlp(key)
+            value = (doc[0].lemma_, doc[0].tag_) if len(doc) else ("", "")
+            self.put(key, value)
+        return value
+
+    def token_lemma(self, token, lemmatizer):
+        """Лемма токена из документа с учетом части речи и морфологии; lemmatizer -- компонент spaCy."""
+        if not lemmatizer.overwrite and token.lemma != 0:
+            return token.lemma_  # лемму уже поставил attribute_ruler, как и spaCy ее не трогаем
+        key = f"{token.orth_}|{token.pos_}|{token.morph}"
+        value = self.get(key)
+        if value is None:
+            value = (lemmatizer.lemmatize(token)[0], token.tag_)
+            self.put(key, value)
+        return value[0]
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def report(self):
+        return (f"Lemma cache: {self.hits} hits, {self.misses} misses, hit rate {self.hit_rate():.1%}, "
+                f"{len(self.entries)} entries")
+
+
+_caches = {}
+
+
+def get_lemma_cache(nlp, path=CACHE_FILE, max_size=MAX_SIZE):
+    """Кэш на процесс для данной модели; сохраняется на диск при выходе."""
+    key = (model_id(nlp), str(path))
+    if key not in _caches:
+        cache = LemmaCache(path, max_size, model_id(nlp))
+        atexit.register(cache.save)
+        _caches[key] = cache
+    return _caches[key]
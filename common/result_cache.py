@@ -0,0 +1,80 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Кэш результатов поиска для bool_search.py, vector_search.py и сервера: LRU с TTL.
+#
+# Ключ -- запрос после лемматизации (дерево булева запроса, веса лемм векторного), поэтому
+# "Guitars AND rock" и "rock and guitar" попадают в одну запись. Каждая запись привязана
+# к версии индекса (common/index_version.py): пришел запрос с другой версией -- индекс
+# пересобран, и кэш очищается целиком. Результаты не копируются, менять их нельзя.
+
+MAX_SIZE = 10_000
+TTL = 3600.0  # секунд; 0 -- без ограничения по времени
+
+
+class ResultCache:
+
+    def __init__(self, max_size=MAX_SIZE, ttl=TTL, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()  # ключ -> (результат, время записи)
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.invalidations = 0
+        self.lock = threading.Lock()
+
+    def _check_version(self, version):
+        if version != self.version:
+            if self.entries:
+                self.invalidations += 1
+            self.entries.clear()
+            self.version = version
+
+    def get(self, key, version):
+        with self.lock:
+            self._check_version(version)
+            entry = self.entries.get(key)
+            if entry is not None and self.ttl and self.clock() - entry[1] > self.ttl:
+                del self.entries[key]
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, version):
+        with self.lock:
+            if version != self.version:
+                return  # посчитано по версии индекса, которая уже сменилась
+            self.entries[key] = (value, self.clock())
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def lookup(self, key, version, compute):
+        """Результат из кэша или compute(), который затем кэшируется."""
+        value = self.get(key, version)
+        if value is None:
+            value = compute()
+            self.put(key, value, version)
+        return value
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def counters(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "expired": self.expired,
+                    "invalidations": self.invalidations, "entries": len(self.entries), "version": self.version}
+
+    def report(self):
+        return (f"Result cache: {self.hits} hits, {self.misses} misses, hit rate {self.hit_rate():.1%}, "
+                f"{len(self.entries)} entries, {self.invalidations} invalidations")
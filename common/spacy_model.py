@@ -0,0 +1,65 @@
+import json
+import time
+from pathlib import Path
+
+import spacy
+
+from common import instrumentation
+
+# Общая загрузка модели spaCy для task2, task3 и task5.
+# Модель не скачивается при каждом запуске: сначала проверяем, установлена ли она,
+# и грузим один раз на процесс только с нужными компонентами.
+
+MODEL = "en_core_web_sm"
+
+# нужны только is_stop, tag_ и lemma_: лемматизатору хватает tagger и attribute_ruler,
+# а синтаксический разбор и NER только тратят время
+DISABLED_COMPONENTS = ("parser", "ner")
+
+LOAD_LOG = Path(__file__).resolve().parent.parent / "model_load_times.log"  # история холодных стартов
+
+_models = {}
+load_times = {}  # (модель, отключенные компоненты) -> секунды на spacy.load
+
+
+def is_installed(name=MODEL):
+    return spacy.util.is_package(name) or Path(name).is_dir()
+
+
+def load_nlp(name=MODEL, disable=DISABLED_COMPONENTS, download_missing=False, shared=True):
+    """
+    Возвращает загруженную модель, при повторном вызове -- ту же самую.
+    shared=False -- всегда отдельная копия, например своя для каждого потока: пайплайн spaCy
+    не рассчитан на одновременные вызовы из нескольких потоков.
+    """
+    key = (name, tuple(disable))
+    if shared and key in _models:
+        return _models[key]
+
+    if not is_installed(name):
+        if not download_missing:
+            raise OSError(f"Модель spaCy {name} не установлена. Установите ее: python -m spacy download {name}")
+        from spacy.cli import download
+        download(name)
+
+    start = time.perf_counter()
+    with instrumentation.span("load.spacy"):
+        nlp = spacy.load(name, disable=list(disable))
+    elapsed = time.perf_counter() - start
+
+    if shared:
+        _models[key] = nlp
+    load_times[key] = elapsed
+    _log_load(name, nlp.pipe_names, elapsed)
+    return nlp
+
+
+def _log_load(name, pipe_names, elapsed):
+    print(f"spaCy model {name} loaded in {elapsed:.2f} s ({', '.join(pipe_names)})")
+    record = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "model": name, "pipes": pipe_names,
+              "seconds": round(elapsed, 4)}
+    try:
+        with LOAD_LOG.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+    except OSError:
+        pass  # лог не обязателен, например на read-only файловой системе
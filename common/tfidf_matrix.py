@@ -0,0 +1,193 @@
+import math
+import mmap
+import os
+import struct
+
+import numpy as np
+from scipy import sparse
+
+# Упакованная матрица tf-idf (tfidf_outputs/{terms,lemmas}_tfidf.bin), одна на вид.
+#
+#   заголовок  HEADER: magic, версия, число документов, терминов и ненулевых, смещения секций
+#   doc_ids    int64[n_docs]          номера документов, по строке матрицы на документ
+#   indptr     int32[n_docs + 1]      CSR: границы строк
+#   indices    int32[nnz]             CSR: номера терминов, внутри строки по возрастанию
+#   data       float64[nnz]           CSR: веса tf-idf
+#   idf        float64[n_terms]
+#   norms      float64[n_docs]        евклидовы нормы строк
+#   col_ptr    int32[n_terms + 1]     постинги (CSC): границы столбцов
+#   col_rows   int32[nnz]             постинги: строки документов с термином, по возрастанию
+#   col_data   float64[nnz]           постинги: веса
+#   term_max   float64[n_terms]       максимум вес / норма документа по столбцу -- верхняя оценка
+#                                     вклада термина в косинус (для MaxScore)
+#   vocab_off  int64[n_terms + 1]     границы терминов в vocab
+#   vocab      байты терминов подряд, термины отсортированы по байтам UTF-8 (номер -- позиция)
+#
+# Веса и idf берутся такими же, как в текстовых файлах (6 знаков), а нормы считаются в порядке
+# строк файла, поэтому поиск по матрице ранжирует так же, как по текстовым файлам.
+# Секции выровнены по 8 байт и читаются через mmap без копирования (np.frombuffer).
+
+MAGIC = b"TFM1"
+VERSION = 2
+HEADER = struct.Struct("<4sIQQQ12Q")  # magic, version, n_docs, n_terms, nnz, смещения 12 секций
+SECTIONS = (
+    ("doc_ids", "<i8"), ("indptr", "<i4"), ("indices", "<i4"), ("data", "<f8"),
+    ("idf", "<f8"), ("norms", "<f8"),
+    ("col_ptr", "<i4"), ("col_rows", "<i4"), ("col_data", "<f8"), ("term_max", "<f8"),
+    ("vocab_off", "<i8"), ("vocab", "u1"),
+)
+
+
+def pack_matrix(doc_ids, rows):
+    """
+    rows[i] -- [(термин, idf, вес)] документа doc_ids[i] в порядке строк текстового файла.
+    Возвращает содержимое файла.
+    """
+    vocab = sorted({term.encode("utf-8") for row in rows for term, _, _ in row})
+    term_ids = {term.decode("utf-8"): i for i, term in enumerate(vocab)}
+
+    idf = np.zeros(len(vocab))
+    norms = np.zeros(len(rows))
+    indptr = [0]
+    indices = []
+    data = []
+    for r, row in enumerate(rows):
+        norm_square = 0.0
+        for term, term_idf, weight in row:
+            norm_square += weight * weight
+        norms[r] = math.sqrt(norm_square)
+        for term_id, term_idf, weight in sorted((term_ids[term], term_idf, weight) for term, term_idf, weight in row):
+            idf[term_id] = term_idf
+            indices.append(term_id)
+            data.append(weight)
+        indptr.append(len(indices))
+    if len(indices) >= 2 ** 31:
+        raise ValueError("слишком много ненулевых для int32")
+
+    # те же веса по столбцам: постинги терминов для поиска term-at-a-time
+    indices = np.array(indices, dtype="<i4")
+    data = np.array(data, dtype="<f8")
+    nnz_rows = np.repeat(np.arange(len(rows), dtype="<i4"), np.diff(indptr))
+    order = np.argsort(indices, kind="stable")
+    col_ptr = np.zeros(len(vocab) + 1, dtype="<i4")
+    col_ptr[1:] = np.cumsum(np.bincount(indices, minlength=len(vocab)))
+    normalized = data / np.where(norms[nnz_rows] > 0, norms[nnz_rows], 1.0)
+    term_max = np.maximum.reduceat(normalized[order], col_ptr[:-1]) if len(data) else np.zeros(len(vocab))
+
+    vocab_off = np.zeros(len(vocab) + 1, dtype="<i8")
+    vocab_off[1:] = np.cumsum([len(term) for term in vocab])
+    arrays = {
+        "doc_ids": np.array([int(doc_id) for doc_id in doc_ids], dtype="<i8"),
+        "indptr": np.array(indptr, dtype="<i4"),
+        "indices": indices,
+        "data": data,
+        "idf": idf.astype("<f8"),
+        "norms": norms.astype("<f8"),
+        "col_ptr": col_ptr,
+        "col_rows": nnz_rows[order],
+        "col_data": data[order],
+        "term_max": term_max.astype("<f8"),
+        "vocab_off": vocab_off,
+        "vocab": np.frombuffer(b"".join(vocab), dtype="u1"),
+    }
+
+    body = bytearray()
+    offsets = []
+    for name, _ in SECTIONS:
+        body += b"\0" * (-(HEADER.size + len(body)) % 8)
+        offsets.append(HEADER.size + len(body))
+        body += arrays[name].tobytes()
+    return HEADER.pack(MAGIC, VERSION, len(doc_ids), len(vocab), len(indices), *offsets) + bytes(body)
+
+
+def write_matrix(path, doc_ids, rows):
+    """Пишет файл, если его содержимое изменилось; возвращает True, если записал."""
+    content = pack_matrix(doc_ids, rows)
+    if path.exists() and path.read_bytes() == content:
+        return False
+    # через временный файл: открытая через mmap старая матрица остается целой
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_bytes(content)
+    os.replace(tmp_path, path)
+    return True
+
+
+class TfidfMatrix:
+    """Матрица поверх mmap: массивы -- представления файла, в память копируется только то, что читается."""
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.n_docs, self.n_terms, self.nnz, *offsets = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path}: не матрица tf-idf версии {VERSION}")
+        counts = (self.n_docs, self.n_docs + 1, self.nnz, self.nnz, self.n_terms, self.n_docs,
+                  self.n_terms + 1, self.nnz, self.nnz, self.n_terms, self.n_terms + 1)
+        for (name, dtype), offset, count in zip(SECTIONS, offsets, counts):
+            setattr(self, name, np.frombuffer(self._mm, dtype=dtype, count=count, offset=offset))
+        self.vocab = np.frombuffer(self._mm, dtype="u1", count=int(self.vocab_off[-1]), offset=offsets[-1])
+        self._csr = None
+
+    def close(self):
+        self._csr = None
+        for name, _ in SECTIONS:
+            setattr(self, name, None)
+        self._mm.close()
+        self._file.close()
+
+    def term(self, term_id):
+        return bytes(self.vocab[self.vocab_off[term_id]:self.vocab_off[term_id + 1]]).decode("utf-8")
+
+    def term_id(self, term):
+        """Номер термина бинарным поиском по словарю или None."""
+        key = term.encode("utf-8")
+        lo, hi = 0, self.n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            current = bytes(self.vocab[self.vocab_off[mid]:self.vocab_off[mid + 1]])
+            if current < key:
+                lo = mid + 1
+            elif current > key:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    def csr(self):
+        # scipy.sparse.csr_matrix над теми же массивами, без копирования
+        if self._csr is None:
+            self._csr = sparse.csr_matrix((self.data, self.indices, self.indptr),
+                                          shape=(self.n_docs, self.n_terms), copy=False)
+        return self._csr
+
+    def postings(self, term_id):
+        """(строки документов по возрастанию, веса) для термина -- срезы столбца, без копирования."""
+        start, end = self.col_ptr[term_id], self.col_ptr[term_id + 1]
+        return self.col_rows[start:end], self.col_data[start:end]
+
+    def row(self, row):
+        start, end = self.indptr[row], self.indptr[row + 1]
+        return self.indices[start:end], self.data[start:end]
+
+
+class IdfTable:
+    """термин -> idf поверх TfidfMatrix, чтобы build_query_vector работал без словаря в памяти."""
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+
+    def __contains__(self, term):
+        return self.matrix.term_id(term) is not None
+
+    def __getitem__(self, term):
+        term_id = self.matrix.term_id(term)
+        if term_id is None:
+            raise KeyError(term)
+        return float(self.matrix.idf[term_id])
+
+    def get(self, term, default=None):
+        term_id = self.matrix.term_id(term)
+        return default if term_id is None else float(self.matrix.idf[term_id])
+
+    def __len__(self):
+        return self.matrix.n_terms
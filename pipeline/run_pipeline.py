@@ -0,0 +1,251 @@
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+# Весь конвейер одной командой: crawl -> clean -> lemmatize -> index / tfidf / bm25 -> lsa -> serve.
+#
+# Каждый этап -- скрипт своего задания, он запускается отдельным процессом из своей папки
+# (скрипты читают соседей по путям вида ../task1/cleaned). Для этапа известны входы и выходы
+# (файлы и папки). Отпечаток -- sha256 содержимого всех файлов; хэш файла пересчитывается,
+# только если изменились его размер или mtime (кэш в state.json). Этап пропускается, если
+# отпечатки входов и выходов совпадают с записанными после его прошлого успешного запуска.
+# В входы входит и сам скрипт этапа, и общие модули, от которых зависит его результат
+# (загрузка spaCy, кэш лемм, формат матрицы, запись версии), поэтому правка кода тоже
+# перезапускает этап. common/instrumentation.py на результат не влияет и во входы не входит.
+# Этап, который переписал выходы тем же содержимым, не заставляет пересчитывать следующие.
+#
+# Этапы, у которых готовы все зависимости, идут параллельно (до --jobs одновременно):
+# после лемматизации индекс, tf-idf и BM25 собираются одновременно. Если этап упал,
+# зависящие от него не запускаются. Вывод каждого этапа пишется в logs/<этап>.log.
+
+ROOT = Path(__file__).resolve().parent.parent
+PIPELINE_DIR = ROOT / "pipeline"
+STATE_FILE = PIPELINE_DIR / "state.json"
+LOG_DIR = PIPELINE_DIR / "logs"
+JOBS = os.cpu_count() or 1
+LOG_TAIL = 20  # сколько последних строк лога показать, если этап упал
+
+RAN, SKIPPED, FAILED, BLOCKED, WOULD_RUN = "ran", "skipped", "failed", "blocked", "would run"
+
+
+class Stage:
+
+    def __init__(self, name, cwd, command, inputs, outputs, deps=(), always=False):
+        self.name = name
+        self.cwd = cwd  # папка задания относительно ROOT
+        self.command = command  # аргументы после python
+        self.inputs = inputs  # пути относительно ROOT
+        self.outputs = outputs
+        self.deps = deps
+        self.always = always  # входы не описываются файлами (сеть) -- запускать всегда
+
+
+SPACY = ["common/spacy_model.py", "common/lemma_cache.py"]  # лемматизация и токенизация spaCy
+VERSION = ["common/index_version.py"]  # хэш, который этап пишет рядом с индексом
+MATRIX = ["common/tfidf_matrix.py"]  # формат упакованной матрицы tf-idf
+
+
+def stages(workers=1):
+    return [
+        Stage("crawl", "task1", ["crawling.py"],
+              ["task1/urls.txt", "task1/crawling.py"], ["task1/pages"], always=True),
+        Stage("clean", "task1", ["cleaning.py", "--workers", str(workers)],
+              ["task1/pages", "task1/cleaning.py"], ["task1/cleaned"], deps=("crawl",)),
+        Stage("lemmatize", "task2", ["text_processing.py", "--workers", str(workers)],
+              ["task1/cleaned", "task2/text_processing.py", *SPACY], ["task2/processed_txts"], deps=("clean",)),
+        Stage("index", "task3", ["build_inverted_index.py", "--text"],
+              ["task2/processed_txts", "task3/build_inverted_index.py", "task3/index_format.py", "task3/spimi.py",
+               *VERSION],
+              ["task3/inverted_index.bin", "task3/inverted_index.txt", "task3/positional_index.bin",
+               "task3/index_version.txt"],
+              deps=("lemmatize",)),
+        Stage("tfidf", "task4", ["tf_idf_count.py"],
+              ["task1/cleaned", "task2/processed_txts", "task4/tf_idf_count.py", *MATRIX, *VERSION],
+              ["task4/tfidf_outputs/terms", "task4/tfidf_outputs/lemmas", "task4/tfidf_outputs/terms_tfidf.bin",
+               "task4/tfidf_outputs/lemmas_tfidf.bin", "task4/tfidf_outputs/version.txt"],
+              deps=("clean", "lemmatize")),
+        Stage("bm25", "task5", ["bm25.py"],
+              ["task1/cleaned", "task2/processed_txts", "task5/bm25.py", "task2/text_processing.py", *SPACY],
+              ["task5/bm25_index.npz"],
+              deps=("clean", "lemmatize")),
+        Stage("lsa", "task5", ["lsa.py"],
+              ["task4/tfidf_outputs/lemmas_tfidf.bin", "task5/lsa.py", *MATRIX], ["task5/lsa_index.npz"],
+              deps=("tfidf",)),
+    ]
+
+
+class Fingerprints:
+    """Хэши файлов с кэшем по (размер, mtime); общий для потоков этапов."""
+
+    def __init__(self, files=None):
+        self.files = dict(files or {})  # путь -> [размер, mtime_ns, sha256]
+        self.lock = threading.Lock()
+
+    def file_hash(self, path, rel):
+        stat = path.stat()
+        with self.lock:
+            cached = self.files.get(rel)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        digest = hashlib.sha256()
+        with path.open("rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        with self.lock:
+            self.files[rel] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.files)
+
+    def of(self, paths):
+        digest = hashlib.sha256()
+        for rel in sorted(paths):
+            path = ROOT / rel
+            if path.is_dir():
+                files = sorted(p for p in path.rglob("*") if p.is_file() and "__pycache__" not in p.parts)
+            else:
+                files = [path] if path.exists() else []
+            if not files:
+                digest.update(f"{rel}\0-\n".encode("utf-8"))
+            for file in files:
+                name = file.relative_to(ROOT).as_posix()
+                digest.update(f"{name}\0{self.file_hash(file, name)}\n".encode("utf-8"))
+        return digest.hexdigest()[:16]
+
+
+def load_state(path=STATE_FILE):
+    if not path.exists():
+        return {"files": {}, "stages": {}}
+    with path.open("r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(state, path=STATE_FILE):
+    tmp = path.with_suffix(".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+class Pipeline:
+
+    def __init__(self, stage_list, jobs=JOBS, force=(), dry_run=False):
+        self.stages = {stage.name: stage for stage in stage_list}
+        self.jobs = jobs
+        self.force = set(force)
+        self.dry_run = dry_run
+        self.state = load_state()
+        self.fingerprints = Fingerprints(self.state.get("files"))
+        self.state_lock = threading.Lock()
+        self.results = {}  # этап -> (статус, секунды)
+
+    def deps(self, stage):
+        return [dep for dep in stage.deps if dep in self.stages]  # зависимости среди выбранных этапов
+
+    def up_to_date(self, stage, inputs):
+        record = self.state["stages"].get(stage.name)
+        return (record is not None and not stage.always and stage.name not in self.force
+                and record["inputs"] == inputs and record["outputs"] == self.fingerprints.of(stage.outputs))
+
+    def run_stage(self, stage):
+        start = time.perf_counter()
+        inputs = self.fingerprints.of(stage.inputs)
+        if self.up_to_date(stage, inputs):
+            return SKIPPED, time.perf_counter() - start
+        if self.dry_run:
+            return WOULD_RUN, time.perf_counter() - start
+
+        LOG_DIR.mkdir(exist_ok=True)
+        log_path = LOG_DIR / f"{stage.name}.log"
+        with log_path.open("w", encoding="utf-8") as log:
+            code = subprocess.run([sys.executable, *stage.command], cwd=ROOT / stage.cwd,
+                                  stdout=log, stderr=subprocess.STDOUT).returncode
+        if code != 0:
+            tail = log_path.read_text(encoding="utf-8", errors="replace").splitlines()[-LOG_TAIL:]
+            print(f"[{stage.name}] exit code {code}, {log_path}:\n" + "\n".join(tail))
+            return FAILED, time.perf_counter() - start
+
+        record = {"inputs": inputs, "outputs": self.fingerprints.of(stage.outputs),
+                  "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        with self.state_lock:
+            self.state["stages"][stage.name] = record
+            self.save()
+        return RAN, time.perf_counter() - start
+
+    def save(self):
+        self.state["files"] = self.fingerprints.snapshot()
+        save_state(self.state)
+
+    def run(self):
+        pending = dict(self.stages)
+        with ThreadPoolExecutor(self.jobs, thread_name_prefix="stage") as pool:
+            running = {}
+            while pending or running:
+                for name, stage in list(pending.items()):
+                    statuses = [self.results.get(dep, (None,))[0] for dep in self.deps(stage)]
+                    if any(status in (FAILED, BLOCKED) for status in statuses):
+                        self.results[name] = (BLOCKED, 0.0)
+                        del pending[name]
+                    elif WOULD_RUN in statuses and self.dry_run:
+                        self.results[name] = (WOULD_RUN, 0.0)  # входы изменятся, когда отработает зависимость
+                        del pending[name]
+                    elif all(status is not None for status in statuses) and len(running) < self.jobs:
+                        print(f"[{name}] start")
+                        running[pool.submit(self.run_stage, stage)] = name
+                        del pending[name]
+                if not running:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    self.results[name] = future.result()
+                    print(f"[{name}] {self.results[name][0]} in {self.results[name][1]:.2f} s")
+        if not self.dry_run:
+            with self.state_lock:
+                self.save()  # хэши файлов, посчитанные и для пропущенных этапов
+        return all(status in (RAN, SKIPPED, WOULD_RUN) for status, _ in self.results.values())
+
+    def report(self, wall):
+        lines = [f"{'stage':<10} {'status':<10} {'wall, s':>9}"]
+        for name in self.stages:
+            status, seconds = self.results.get(name, ("-", 0.0))
+            lines.append(f"{name:<10} {status:<10} {seconds:9.2f}")
+        lines.append(f"{'total':<21} {wall:9.2f}")
+        return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    names = [stage.name for stage in stages()]
+    parser = argparse.ArgumentParser(description="Конвейер от скачивания до поискового сервера")
+    parser.add_argument("--crawl", action="store_true", help="заново скачать страницы (по умолчанию -- из task1/pages)")
+    parser.add_argument("--only", nargs="+", choices=names, help="запустить только эти этапы")
+    parser.add_argument("--force", nargs="+", default=[], choices=names,
+                        help="запустить этапы, даже если ничего не менялось")
+    parser.add_argument("--jobs", type=int, default=JOBS, help="сколько этапов выполнять одновременно")
+    parser.add_argument("--workers", type=int, default=1, help="процессов в очистке и лемматизации")
+    parser.add_argument("--dry-run", action="store_true", help="только показать, какие этапы будут запущены")
+    parser.add_argument("--serve", action="store_true", help="после сборки запустить server/search_server.py")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+
+    selected = [stage for stage in stages(args.workers)
+                if (stage.name in args.only if args.only else stage.name != "crawl" or args.crawl)]
+    pipeline = Pipeline(selected, args.jobs, args.force, args.dry_run)
+    start = time.perf_counter()
+    ok = pipeline.run()
+    print()
+    print(pipeline.report(time.perf_counter() - start))
+    if not ok:
+        sys.exit(1)
+
+    if args.serve and not args.dry_run:
+        subprocess.run([sys.executable, str(ROOT / "server/search_server.py"), "--port", str(args.port)], cwd=ROOT)
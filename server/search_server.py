@@ -0,0 +1,381 @@
+import argparse
+import hashlib
+import json
+import queue
+import re
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+sys.path.append(str(ROOT / "task3"))
+sys.path.append(str(ROOT / "task5"))
+from common.spacy_model import load_nlp  # noqa: E402
+from common.lemma_cache import get_lemma_cache  # noqa: E402
+from common.index_version import content_hash  # noqa: E402
+from common.result_cache import MAX_SIZE as CACHE_SIZE, TTL as CACHE_TTL, ResultCache  # noqa: E402
+import bool_search  # noqa: E402
+import vector_search  # noqa: E402
+from boolean_query import QueryError  # noqa: E402
+from lsa import LSA_FILE, N_PROBE, LsaIndex  # noqa: E402
+from bm25 import BM25_FILE, Bm25Index  # noqa: E402
+
+# Поисковый сервер: индекс, матрица tf-idf, URL и spaCy загружаются один раз, запросы --
+# HTTP/JSON, обрабатываются параллельно. Разбор и лемматизация запросов идут в пуле потоков,
+# у каждого потока своя копия spaCy, кэш лемм общий.
+#
+# Все загруженное для одной версии индекса -- объект Artifacts, который не меняется.
+# Запрос берет ссылку на текущий Artifacts один раз и до конца работает с ней; перезагрузка
+# собирает новый Artifacts рядом со старым и подменяет ссылку, поэтому запросы не ждут и
+# не видят наполовину загруженный индекс. Старые файлы, открытые через mmap, закрываются
+# сборщиком мусора, когда их отпустит последний запрос (писатели в task3/task4 подменяют
+# файлы через os.replace, а не переписывают их на месте).
+#
+# Результаты кэшируются (common/result_cache.py) по версиям, которые пишут task3 и task4:
+# после перезагрузки пересобранного индекса кэш соответствующего вида поиска сбрасывается.
+
+HOST = "127.0.0.1"
+PORT = 8080
+WORKERS = 4
+WATCH_INTERVAL = 5.0  # как часто проверять файлы индекса, секунд; 0 -- только POST /reload
+MAX_RESULTS = 100
+INT_RE = re.compile(r"-?\d+")
+
+ARTIFACT_FILES = (bool_search.INDEX_FILE, bool_search.TEXT_INDEX_FILE, bool_search.POSITIONAL_INDEX_FILE,
+                  bool_search.URL_FILE, bool_search.VERSION_FILE, vector_search.TFIDF_MATRIX,
+                  vector_search.TFIDF_VERSION_FILE, vector_search.URL_FILE, LSA_FILE, BM25_FILE)
+
+
+def artifacts_version():
+    # размер и время изменения файлов индекса: изменился любой -- это новая версия
+    state = []
+    for path in ARTIFACT_FILES:
+        try:
+            stat = path.stat()
+            state.append(f"{path.name}:{stat.st_size}:{stat.st_mtime_ns}")
+        except FileNotFoundError:
+            state.append(f"{path.name}:-")
+    return hashlib.sha1("|".join(state).encode("utf-8")).hexdigest()[:12]
+
+
+def int_param(params, name, default, minimum):
+    """Целый параметр запроса не меньше minimum; нет его или null -- default, иначе QueryError."""
+    value = params.get(name)
+    if value is None or value == "":
+        return default
+    if isinstance(value, str) and INT_RE.fullmatch(value.strip()):
+        value = int(value)
+    if not isinstance(value, int) or isinstance(value, bool) or value < minimum:
+        raise QueryError(f"{name}: ожидается целое число не меньше {minimum}")
+    return value
+
+
+class Artifacts:
+    """Все, что нужно для поиска по одной версии индекса."""
+
+    def __init__(self):
+        self.version = artifacts_version()  # до загрузки: если файлы поменяются во время нее, версия устареет
+        start = time.perf_counter()
+        self.index, self.positional = bool_search.load_index()
+        self.boolean_version = bool_search.load_index_version()
+        self.boolean_urls = bool_search.load_doc_urls()
+
+        self.matrix = self.doc_vectors = self.doc_norms = self.lsa_index = None
+        if vector_search.TFIDF_MATRIX.exists():
+            self.matrix, self.lemma_idf = vector_search.load_matrix()
+            if LSA_FILE.exists():
+                try:
+                    self.lsa_index = LsaIndex.load(self.matrix)
+                except ValueError as e:
+                    print(f"LSA index skipped: {e}")
+        else:
+            self.doc_vectors, self.doc_norms, self.lemma_idf = vector_search.load_doc_vectors()
+        self.bm25_index = Bm25Index.load() if BM25_FILE.exists() else None
+        self.ranked_version = vector_search.load_tfidf_version()
+        if self.lsa_index is not None:
+            self.ranked_version += "+" + content_hash([LSA_FILE])  # LSA можно пересобрать по той же матрице
+        if self.bm25_index is not None:
+            self.ranked_version += "+" + content_hash([BM25_FILE])
+        self.ranked_urls = vector_search.load_doc_urls()
+        self.load_seconds = time.perf_counter() - start
+        self.loaded_at = time.time()
+
+    def ranked_docs(self):
+        return self.matrix.n_docs if self.matrix is not None else len(self.doc_vectors)
+
+
+class SearchService:
+
+    def __init__(self, workers=WORKERS, cache_size=CACHE_SIZE, cache_ttl=CACHE_TTL):
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        print("Loading index...")
+        self.artifacts = self.with_caches(Artifacts())
+        print(f"Index {self.artifacts.version} loaded in {self.artifacts.load_seconds:.2f} s")
+
+        print(f"Loading {workers} spaCy pipelines...")
+        pipelines = [load_nlp(shared=False) for _ in range(workers)]  # по копии модели на поток пула
+        self.pipelines = queue.SimpleQueue()
+        for nlp in pipelines:
+            self.pipelines.put(nlp)
+        self.lemma_cache = get_lemma_cache(pipelines[0])
+        self.pool = ThreadPoolExecutor(workers, thread_name_prefix="query")
+        self.workers = workers
+
+        self.reload_lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.stats = Counter()
+        self.started_at = time.time()
+
+    def with_caches(self, artifacts, previous=None):
+        # Кэши результатов принадлежат версии индекса: запрос, начатый до перезагрузки, пишет в кэш
+        # своей версии и не сбрасывает кэш новой (иначе старые и новые запросы сбрасывали бы его
+        # по очереди). Кэш вида поиска, версия которого не изменилась, переходит к новой версии.
+        if previous is not None and previous.boolean_version == artifacts.boolean_version:
+            artifacts.boolean_cache = previous.boolean_cache
+        else:
+            artifacts.boolean_cache = ResultCache(self.cache_size, self.cache_ttl)
+        if previous is not None and previous.ranked_version == artifacts.ranked_version:
+            artifacts.ranked_cache = previous.ranked_cache
+        else:
+            artifacts.ranked_cache = ResultCache(self.cache_size, self.cache_ttl)
+        return artifacts
+
+    def count(self, name):
+        with self.stats_lock:
+            self.stats[name] += 1
+
+    def run(self, task, *args):
+        # задача выполняется в пуле со свободной копией spaCy
+        def with_pipeline():
+            nlp = self.pipelines.get()
+            try:
+                return task(nlp, *args)
+            finally:
+                self.pipelines.put(nlp)
+        return self.pool.submit(with_pipeline).result()
+
+    def boolean(self, query, artifacts=None):
+        artifacts = artifacts or self.artifacts
+
+        def task(nlp, query):
+            def lemmatize(word):
+                return self.lemma_cache.word(nlp, word)[0]
+            return bool_search.cached_search(query.strip().lower(), artifacts.index, lemmatize, artifacts.positional,
+                                             artifacts.boolean_cache, artifacts.boolean_version)
+
+        doc_ids = self.run(task, query)
+        return {
+            "version": artifacts.version,
+            "doc_ids": doc_ids,
+            "urls": [artifacts.boolean_urls[doc_id] for doc_id in doc_ids if doc_id in artifacts.boolean_urls],
+        }
+
+    def ranked(self, query, k=vector_search.RESULTS_COUNT, mode="taat", n_probe=N_PROBE, artifacts=None):
+        artifacts = artifacts or self.artifacts
+
+        def task(nlp, query):
+            if mode == "bm25":
+                return vector_search.build_query_counts(query, nlp, artifacts.bm25_index, self.lemma_cache)
+            return vector_search.build_query_vector(query, nlp, artifacts.lemma_idf, self.lemma_cache)
+
+        def ranked():
+            if mode == "bm25":
+                return artifacts.bm25_index.search(query_vector, k)
+            if mode == "lsa":
+                return artifacts.lsa_index.search(query_vector, k, n_probe or None)
+            if artifacts.matrix is not None:
+                return vector_search.search_taat(query_vector, artifacts.matrix, k, max_score=(mode == "max_score"))
+            # без упакованной матрицы и taat, и max_score -- полный перебор: топ у всех трех один и тот же
+            return vector_search.search(query_vector, artifacts.doc_vectors, artifacts.doc_norms, k)
+
+        if mode == "lsa" and artifacts.lsa_index is None:
+            raise QueryError("LSA-индекс не загружен (python task5/lsa.py)")
+        if mode == "bm25" and artifacts.bm25_index is None:
+            raise QueryError("BM25-индекс не загружен (python task5/bm25.py)")
+        query_vector = self.run(task, query)  # для bm25 -- tf лемм запроса
+        # taat и max_score дают один и тот же топ, в ключе режим нужен только для LSA и BM25
+        options = {"lsa": (k, "lsa", n_probe), "bm25": (k, "bm25")}.get(mode, (k,))
+        top_docs = artifacts.ranked_cache.lookup(vector_search.query_key(query_vector, *options),
+                                                 artifacts.ranked_version, ranked)
+        key = "score" if mode == "bm25" else "distance"  # у BM25 больше -- лучше
+        return {
+            "version": artifacts.version,
+            "results": [{"doc_id": doc_id, key: value, "url": artifacts.ranked_urls.get(doc_id)}
+                        for value, doc_id in top_docs],
+        }
+
+    def reload(self, force=False):
+        """Загружает новую версию индекса, если файлы изменились; True, если подменил."""
+        with self.reload_lock:
+            if not force and artifacts_version() == self.artifacts.version:
+                return False
+            artifacts = self.with_caches(Artifacts(), self.artifacts)  # если загрузка упадет, остается прежняя
+            self.artifacts = artifacts
+            self.count("reloads")
+            print(f"Index {artifacts.version} loaded in {artifacts.load_seconds:.2f} s")
+            return True
+
+    def watch(self, interval, stop):
+        # перезагружает индекс, когда файлы изменились и не менялись весь последний интервал:
+        # пока task3/task4 пишут файлы по очереди, смесь старых и новых не загружается
+        last_seen = self.artifacts.version
+        while not stop.wait(interval):
+            version = artifacts_version()
+            if version != self.artifacts.version and version == last_seen:
+                try:
+                    self.reload()
+                except Exception as e:  # noqa: BLE001 -- сервер продолжает работать на старой версии
+                    print(f"Reload failed: {e}")
+            last_seen = version
+
+    def health(self):
+        artifacts = self.artifacts
+        with self.stats_lock:
+            stats = dict(self.stats)
+        return {
+            "status": "ok",
+            "version": artifacts.version,
+            "loaded_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(artifacts.loaded_at)),
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "documents": {"boolean": len(artifacts.index.all_docs), "ranked": artifacts.ranked_docs()},
+            "positional": artifacts.positional is not None,
+            "lsa": artifacts.lsa_index is not None,
+            "bm25": artifacts.bm25_index is not None,
+            "workers": self.workers,
+            "stats": stats,
+            "result_cache": {"boolean": artifacts.boolean_cache.counters(),
+                             "ranked": artifacts.ranked_cache.counters()},
+            "lemma_cache": {"hits": self.lemma_cache.hits, "misses": self.lemma_cache.misses,
+                            "entries": len(self.lemma_cache.entries)},
+        }
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+        self.lemma_cache.save()
+
+
+class SearchHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    timeout = 10  # простаивающее keep-alive соединение не держит поток вечно
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        self._dispatch(url.path, params)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            try:
+                body = json.loads(self.rfile.read(length))
+            except ValueError:
+                return self._reply(400, {"error": "тело запроса -- не JSON"})
+            if not isinstance(body, dict):
+                return self._reply(400, {"error": "ожидается JSON-объект"})
+            params.update(body)
+        self._dispatch(url.path, params, post=True)
+
+    def _dispatch(self, path, params, post=False):
+        service = self.server.service
+        start = time.perf_counter()
+        try:
+            if path == "/health":
+                return self._reply(200, service.health())
+            if path == "/reload":
+                if not post:
+                    return self._reply(405, {"error": "перезагрузка -- только POST"})
+                reloaded = service.reload(force=params.get("force") in (True, 1, "1", "true"))
+                return self._reply(200, {"reloaded": reloaded, "version": service.artifacts.version})
+            if path not in ("/search/boolean", "/search/ranked"):
+                return self._reply(404, {"error": f"нет такого адреса: {path}"})
+
+            query = str(params.get("q", "")).strip()
+            if not query:
+                return self._reply(400, {"error": "пустой запрос, параметр q"})
+            artifacts = service.artifacts  # одна версия индекса на весь запрос, даже если идет перезагрузка
+            if path == "/search/boolean":
+                service.count("boolean")
+                result = service.boolean(query, artifacts)
+            else:
+                service.count("ranked")
+                k = min(int_param(params, "k", vector_search.RESULTS_COUNT, 1), MAX_RESULTS)
+                n_probe = int_param(params, "n_probe", N_PROBE, 0)
+                mode = params.get("mode", "taat")
+                if mode not in ("taat", "max_score", "lsa", "bm25"):
+                    return self._reply(400, {"error": "mode: taat, max_score, lsa или bm25"})
+                result = service.ranked(query, k, mode, n_probe, artifacts)
+        except QueryError as e:
+            service.count("errors")
+            return self._reply(400, {"error": str(e)})
+        except ValueError:
+            service.count("errors")
+            return self._reply(400, {"error": "некорректный запрос"})
+        except Exception as e:  # noqa: BLE001
+            service.count("errors")
+            return self._reply(500, {"error": f"{type(e).__name__}: {e}"})
+
+        result = {"query": query, **result, "took_ms": round((time.perf_counter() - start) * 1000, 3)}
+        self._reply(200, result)
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # каждый запрос в консоль не пишем, счетчики -- в /health
+
+
+class SearchServer(ThreadingHTTPServer):
+    daemon_threads = False  # при остановке дождаться запросов, которые уже выполняются
+
+    def __init__(self, address, service):
+        super().__init__(address, SearchHandler)
+        self.service = service
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP/JSON сервер булева и векторного поиска")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=WORKERS, help="потоков (и копий spaCy) для разбора запросов")
+    parser.add_argument("--cache-size", type=int, default=CACHE_SIZE, help="записей в кэше результатов каждого вида")
+    parser.add_argument("--cache-ttl", type=float, default=CACHE_TTL,
+                        help="время жизни результата в кэше, секунд; 0 -- без ограничения")
+    parser.add_argument("--watch", type=float, default=WATCH_INTERVAL,
+                        help="как часто проверять, не изменились ли файлы индекса, секунд; 0 -- не проверять")
+    args = parser.parse_args()
+
+    service = SearchService(args.workers, args.cache_size, args.cache_ttl)
+    server = SearchServer((args.host, args.port), service)
+    stop = threading.Event()
+    if args.watch > 0:
+        threading.Thread(target=service.watch, args=(args.watch, stop), name="reload-watch", daemon=True).start()
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))  # kill останавливает так же, как Ctrl+C
+    print(f"Serving on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        stop.set()
+        server.server_close()
+        service.close()
+        print(service.lemma_cache.report())
+        print("boolean", service.artifacts.boolean_cache.report())
+        print("ranked", service.artifacts.ranked_cache.report())
+        print("Server stopped.")
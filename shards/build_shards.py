@@ -0,0 +1,162 @@
+import argparse
+import json
+import shutil
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+sys.path.append(str(ROOT / "task3"))
+sys.path.append(str(ROOT / "task4"))
+from common.index_version import write_version  # noqa: E402
+from common.tfidf_matrix import write_matrix  # noqa: E402
+from index_format import write_binary_index, write_positional_index  # noqa: E402
+from build_inverted_index import collect_positions, collect_postings  # noqa: E402
+import tf_idf_count  # noqa: E402
+from worker_pool import WorkerPool  # noqa: E402
+
+# Шардированная сборка: документы делятся на шарды по doc_id % N, каждый шард собирается
+# в своем процессе (worker_pool.py) и получает свой инвертированный индекс и матрицу tf-idf лемм.
+#
+# tf-idf шарда зависит от всего корпуса, поэтому сборка идет в три фазы:
+#   1. scan        шард читает свои документы и отдает для каждой леммы первое появление
+#                  (doc_id, строка) и токены; из этого собирается маппинг лемма -> токены
+#                  всего корпуса в том же порядке, что у tf_idf_count.load_lemma_tokens
+#   2. frequencies по общему маппингу шард строит свои TF (столбцы у всех шардов общие)
+#                  и отдает DF; DF шардов складываются
+#   3. write       шард считает idf по общему DF и N и пишет свои файлы
+# Веса, idf и нормы документов получаются такими же, как при сборке task4 без шардов,
+# поэтому поиск по шардам ранжирует так же (shard_search.py --check).
+
+CLEANED_DIR = ROOT / "task1/cleaned"
+LEMMA_DIR = ROOT / "task2/processed_txts"
+SHARDS_DIR = ROOT / "shards/output"
+N_SHARDS = 4
+MANIFEST_FILE = "manifest.json"
+IDF_FILE = "lemma_idf.txt"  # idf всего корпуса, "лемма idf" -- для векторов запросов
+VERSION_FILE = "version.txt"
+INDEX_FILE = "inverted_index.bin"
+POSITIONAL_INDEX_FILE = "positional_index.bin"
+MATRIX_FILE = "lemmas_tfidf.bin"
+
+
+def shard_of(doc_id, n_shards):
+    return int(doc_id) % n_shards
+
+
+def shard_dir(root, shard):
+    return Path(root) / f"shard_{shard:02d}"
+
+
+class ShardBuilder:
+    """Состояние одного шарда между фазами сборки, живет в процессе шарда."""
+
+    def __init__(self, shard, n_shards, out_dir, cleaned_dir, lemma_dir):
+        self.shard = shard
+        self.n_shards = n_shards
+        self.out_dir = Path(out_dir)
+        self.cleaned_dir = Path(cleaned_dir)
+        self.lemma_dir = Path(lemma_dir)
+
+    def keep(self, doc_id):
+        return shard_of(doc_id, self.n_shards) == self.shard
+
+    def scan(self):
+        self.doc_ids = [doc_id for doc_id in tf_idf_count.discover_doc_ids(self.cleaned_dir, self.lemma_dir)
+                        if self.keep(doc_id)]
+        self.doc_stats = {doc_id: tf_idf_count.read_doc(doc_id, self.lemma_dir, self.cleaned_dir)[0]
+                          for doc_id in self.doc_ids}
+        lemmas = {}  # лемма -> [(doc_id, строка) первого появления, токены]
+        for doc_id in self.doc_ids:
+            for line, (lemma, tokens) in enumerate(self.doc_stats[doc_id]["lemmas"]):
+                if lemma in lemmas:
+                    lemmas[lemma][1].update(tokens)
+                else:
+                    lemmas[lemma] = [(int(doc_id), line), set(tokens)]
+        return len(self.doc_ids), lemmas
+
+    def frequencies(self, global_lemma2tokens):
+        _, (self.lemma_tf, self.lemmas) = tf_idf_count.tf_matrices(self.doc_ids, self.doc_stats, global_lemma2tokens)
+        return tf_idf_count.document_frequency(self.lemma_tf)
+
+    def write(self, lemma_df, n_docs):
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        lemma_idf = tf_idf_count.idf_from_df(lemma_df, n_docs)
+        lines = [tf_idf_count.format_row(self.lemma_tf, lemma_idf, self.lemmas, row)
+                 for row in range(len(self.doc_ids))]
+        # в матрицу -- значения в том виде, в каком их записал бы tf_idf_count
+        rows = [[(term, float(term_idf), float(tfidf)) for term, term_idf, tfidf in map(str.split, doc_lines)]
+                for doc_lines in lines]
+        write_matrix(self.out_dir / MATRIX_FILE, self.doc_ids, rows)
+
+        inverted_index = collect_postings(self.lemma_dir, self.keep, verbose=False)
+        write_binary_index(self.out_dir / INDEX_FILE, inverted_index)
+        positional_index = collect_positions(self.lemma_dir, self.keep)
+        if positional_index:
+            write_positional_index(self.out_dir / POSITIONAL_INDEX_FILE, positional_index)
+        return len(set().union(*inverted_index.values())) if inverted_index else 0
+
+
+def merge_lemma_tokens(shard_lemmas):
+    # леммы в порядке первого появления во всем корпусе, токены -- объединение по шардам
+    first = {}
+    tokens = {}
+    for lemmas in shard_lemmas:
+        for lemma, (position, lemma_tokens) in lemmas.items():
+            if lemma not in first or position < first[lemma]:
+                first[lemma] = position
+            tokens.setdefault(lemma, set()).update(lemma_tokens)
+    return {lemma: tokens[lemma] for lemma in sorted(first, key=first.get)}
+
+
+def build_shards(n_shards=N_SHARDS, out_root=SHARDS_DIR, cleaned_dir=CLEANED_DIR, lemma_dir=LEMMA_DIR):
+    out_root = Path(out_root)
+    out_root.mkdir(parents=True, exist_ok=True)
+    timings = {}
+    start = time.perf_counter()
+    shard_args = [(shard, n_shards, shard_dir(out_root, shard), cleaned_dir, lemma_dir) for shard in range(n_shards)]
+    with WorkerPool(ShardBuilder, shard_args) as pool:
+        scanned = pool.call("scan")
+        timings["scan"] = time.perf_counter() - start
+
+        n_docs = sum(count for count, _ in scanned)
+        global_lemma2tokens = merge_lemma_tokens(lemmas for _, lemmas in scanned)
+        lemma_df = np.sum(pool.call("frequencies", global_lemma2tokens), axis=0)
+        timings["frequencies"] = time.perf_counter() - start - timings["scan"]
+
+        index_docs = pool.call("write", lemma_df, n_docs)
+        timings["write"] = time.perf_counter() - start - timings["scan"] - timings["frequencies"]
+
+    # idf всего корпуса в том виде, в каком он записан в матрицы
+    lemma_idf = tf_idf_count.idf_from_df(lemma_df, n_docs)
+    with (out_root / IDF_FILE).open("w", encoding="utf-8") as f:
+        for lemma, df, idf in zip(global_lemma2tokens, lemma_df.tolist(), lemma_idf.tolist()):
+            if df > 0:
+                f.write(f"{lemma} {idf:.6f}\n")
+
+    for stale in out_root.glob("shard_*"):
+        if int(stale.name.split("_")[1]) >= n_shards:
+            shutil.rmtree(stale)  # шарды от прошлой сборки с большим N
+    manifest = {"shards": n_shards, "documents": n_docs, "index_documents": sum(index_docs),
+                "shard_documents": [count for count, _ in scanned]}
+    (out_root / MANIFEST_FILE).write_text(json.dumps(manifest, indent=2) + "\n", encoding="utf-8")
+    files = [shard_dir(out_root, shard) / name for shard in range(n_shards)
+             for name in (INDEX_FILE, POSITIONAL_INDEX_FILE, MATRIX_FILE)]
+    manifest["version"] = write_version(out_root / VERSION_FILE, files + [out_root / IDF_FILE])
+    return manifest, timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Шардированная сборка инвертированного индекса и tf-idf лемм")
+    parser.add_argument("--shards", type=int, default=N_SHARDS, help="число шардов (и процессов сборки)")
+    parser.add_argument("--output", type=Path, default=SHARDS_DIR)
+    args = parser.parse_args()
+
+    manifest, timings = build_shards(args.shards, args.output)
+    print(f"Шардов: {manifest['shards']}, документов: {manifest['documents']} "
+          f"({', '.join(map(str, manifest['shard_documents']))}), версия {manifest['version']}")
+    for phase, seconds in timings.items():
+        print(f"{phase:<12} {seconds:7.2f} s")
@@ -0,0 +1,166 @@
+import argparse
+import heapq
+import itertools
+import json
+import math
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+sys.path.append(str(ROOT / "task3"))
+sys.path.append(str(ROOT / "task5"))
+from common.spacy_model import load_nlp  # noqa: E402
+from common.lemma_cache import get_lemma_cache  # noqa: E402
+from common.tfidf_matrix import TfidfMatrix  # noqa: E402
+from index_format import open_index  # noqa: E402
+from boolean_query import Evaluator, QueryError, parse  # noqa: E402
+import bool_search  # noqa: E402
+import vector_search  # noqa: E402
+from build_shards import (IDF_FILE, INDEX_FILE, MANIFEST_FILE, MATRIX_FILE, POSITIONAL_INDEX_FILE,  # noqa: E402
+                          SHARDS_DIR, shard_dir)
+from worker_pool import WorkerPool  # noqa: E402
+
+# Scatter-gather: координатор разбирает и лемматизирует запрос один раз и рассылает его
+# процессам шардов (worker_pool.py), каждый ищет по своим документам, координатор сливает ответы.
+#   булев запрос  шард вычисляет дерево над своим индексом (NOT -- относительно своих документов),
+#                 отсортированные списки шардов сливаются heapq.merge
+#   top-k         вектор запроса строится по idf всего корпуса, его норма считается один раз;
+#                 шард отдает свои k лучших (search_taat с нормой полного запроса), координатор
+#                 выбирает k лучших из k * N -- с теми же расстояниями и порядком, что без шардов
+
+
+class ShardSearcher:
+    """Поиск по одному шарду, живет в процессе шарда."""
+
+    def __init__(self, directory):
+        directory = Path(directory)
+        self.index = open_index(directory / INDEX_FILE)
+        positional_path = directory / POSITIONAL_INDEX_FILE
+        self.positional = open_index(positional_path) if positional_path.exists() else None
+        self.matrix = TfidfMatrix(directory / MATRIX_FILE)
+
+    def boolean(self, node):
+        return Evaluator(self.index, self.positional).evaluate(node)
+
+    def ranked(self, query_vector, query_norm, k, max_score):
+        return vector_search.search_taat(query_vector, self.matrix, k, max_score, query_norm=query_norm)
+
+
+def load_lemma_idf(path):
+    lemma_idf = {}
+    with Path(path).open("r", encoding="utf-8") as f:
+        for line in f:
+            lemma, idf = line.split()
+            lemma_idf[lemma] = float(idf)
+    return lemma_idf
+
+
+class ShardedSearch:
+
+    def __init__(self, root=SHARDS_DIR):
+        root = Path(root)
+        self.manifest = json.loads((root / MANIFEST_FILE).read_text(encoding="utf-8"))
+        self.lemma_idf = load_lemma_idf(root / IDF_FILE)
+        self.pool = WorkerPool(ShardSearcher, [(shard_dir(root, shard),) for shard in range(self.manifest["shards"])])
+
+    def boolean(self, node):
+        """doc_id по возрастанию для уже разобранного дерева запроса."""
+        return list(heapq.merge(*self.pool.call("boolean", node)))
+
+    def ranked(self, query_vector, k=vector_search.RESULTS_COUNT, max_score=False):
+        """Топ-k (расстояние, doc_id) как у vector_search.search_taat по всему корпусу."""
+        query_norm = math.sqrt(sum(weight * weight for weight in query_vector.values()))
+        if query_norm == 0:
+            return []
+        shard_tops = self.pool.call("ranked", query_vector, query_norm, k, max_score)
+        return heapq.nsmallest(k, itertools.chain.from_iterable(shard_tops))
+
+    def close(self):
+        self.pool.close()
+
+
+def check(queries, sharded, nlp, lemma_cache, ranked):
+    """Сверяет ответы шардов с поиском по индексам task3/task5 без шардов."""
+    def lemmatize(word):
+        return lemma_cache.word(nlp, word)[0]
+
+    if ranked:
+        matrix, lemma_idf = vector_search.load_matrix()
+    else:
+        index, positional = bool_search.load_index()
+    same = 0
+    start = time.perf_counter()
+    for query in queries:
+        if ranked:
+            expected = vector_search.search_taat(vector_search.build_query_vector(query, nlp, lemma_idf, lemma_cache),
+                                                 matrix)
+            result = sharded.ranked(vector_search.build_query_vector(query, nlp, sharded.lemma_idf, lemma_cache))
+        else:
+            try:
+                node = parse(query.lower(), lemmatize)
+            except QueryError:
+                same += 1
+                continue
+            expected = Evaluator(index, positional).evaluate(node)
+            result = sharded.boolean(node)
+        same += result == expected
+    elapsed = time.perf_counter() - start
+    print(f"Совпало с поиском без шардов: {same}/{len(queries)} ({elapsed:.2f} s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Поиск по шардам (scatter-gather), см. build_shards.py")
+    parser.add_argument("--shards-dir", type=Path, default=SHARDS_DIR)
+    parser.add_argument("--ranked", action="store_true", help="векторный поиск вместо булева")
+    parser.add_argument("--max-score", action="store_true", help="MaxScore в шардах, результат тот же")
+    parser.add_argument("--check", type=Path, help="файл с запросами: сверить с поиском без шардов и выйти")
+    args = parser.parse_args()
+
+    print("Starting shard workers...")
+    sharded = ShardedSearch(args.shards_dir)
+    print(f"Shards: {sharded.manifest['shards']}, documents: {sharded.manifest['documents']}")
+    doc_urls = vector_search.load_doc_urls() if args.ranked else bool_search.load_doc_urls()
+
+    print("Loading spaCy model...")
+    nlp = load_nlp()
+    lemma_cache = get_lemma_cache(nlp)
+    print("Model loaded.\n")
+
+    def lemmatize(word):
+        return lemma_cache.word(nlp, word)[0]
+
+    if args.check:
+        with args.check.open("r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+        check(queries, sharded, nlp, lemma_cache, args.ranked)
+        sharded.close()
+        sys.exit()
+
+    while True:
+        query = input("Query (type 'exit' to quit): ").strip()
+
+        if query == "exit" or query == "":
+            print(lemma_cache.report())
+            print("Session finished.")
+            break
+
+        try:
+            if args.ranked:
+                query_vector = vector_search.build_query_vector(query, nlp, sharded.lemma_idf, lemma_cache)
+                doc_ids = [doc_id for _, doc_id in sharded.ranked(query_vector, max_score=args.max_score)]
+            else:
+                doc_ids = sharded.boolean(parse(query.lower(), lemmatize))
+        except QueryError as e:
+            print(f"Error in query: {e}\n")
+            continue
+
+        print("Doc IDs:", doc_ids)
+        print("URLs:")
+        for doc_id in doc_ids:
+            if doc_id in doc_urls:
+                print(doc_urls[doc_id])
+        print()
+
+    sharded.close()
@@ -0,0 +1,89 @@
+import threading
+from multiprocessing import Pipe, Process
+
+# По процессу на шард. Объект шарда создается в своем процессе и живет там, пока пул
+# не закрыт; call рассылает вызов метода всем процессам и собирает ответы в порядке шардов,
+# так что шарды считают параллельно, а между вызовами сохраняют свое состояние.
+
+
+class ShardError(RuntimeError):
+    pass
+
+
+def _serve(conn, factory, args):
+    try:
+        shard = factory(*args)
+    except Exception as e:  # noqa: BLE001 -- ошибка уходит в главный процесс
+        conn.send((False, f"{type(e).__name__}: {e}"))
+        return
+    conn.send((True, None))
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        method, call_args = message
+        try:
+            conn.send((True, getattr(shard, method)(*call_args)))
+        except Exception as e:  # noqa: BLE001
+            conn.send((False, f"{type(e).__name__}: {e}"))
+    conn.close()
+
+
+class WorkerPool:
+
+    def __init__(self, factory, shard_args):
+        """factory(*shard_args[i]) создает объект i-го шарда в его процессе."""
+        self.conns = []
+        self.processes = []
+        self.lock = threading.Lock()  # ответы читаются по порядку, вызовы из разных потоков -- по очереди
+        for args in shard_args:
+            parent, child = Pipe()
+            process = Process(target=_serve, args=(child, factory, args), daemon=True)
+            process.start()
+            child.close()
+            self.conns.append(parent)
+            self.processes.append(process)
+        try:
+            self._collect()
+        except ShardError:
+            self.close()
+            raise
+
+    def _collect(self):
+        results = []
+        errors = []
+        for shard, conn in enumerate(self.conns):
+            try:
+                ok, value = conn.recv()
+            except EOFError:
+                ok, value = False, "процесс шарда завершился"
+            if ok:
+                results.append(value)
+            else:
+                errors.append(f"шард {shard}: {value}")
+        if errors:
+            raise ShardError("; ".join(errors))
+        return results
+
+    def call(self, method, *args):
+        with self.lock:
+            for conn in self.conns:
+                conn.send((method, args))
+            return self._collect()
+
+    def close(self):
+        for conn in self.conns:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+        for process in self.processes:
+            process.join()
+        for conn in self.conns:
+            conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,85 @@
+import argparse
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from crawling import crawl
+
+# Бенчмарк crawling.py на локальном сервере-заглушке: сравниваем последовательное
+# и многопоточное скачивание. Сервер отвечает с задержкой, часть страниц отдает
+# 503 на первый запрос (проверка повторов), а часть -- 404 (проверка списка ошибок).
+# Второй проход по той же папке проверяет условные запросы: сервер отвечает 304 по ETag.
+
+PAGE = "<html><head><title>Album {n}</title></head><body>" + "<p>review text</p>" * 200 + "</body></html>"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, чтобы было видно переиспользование соединений
+    delay = 0.05
+    seen = set()
+    seen_lock = threading.Lock()
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        n = int(self.path.strip("/").split("/")[-1])
+        if n % 50 == 0:
+            self._reply(404, "not found")
+            return
+        if n % 20 == 0:
+            with self.seen_lock:
+                first = self.path not in self.seen
+                self.seen.add(self.path)
+            if first:
+                self._reply(503, "try again")
+                return
+        etag = f'"{n}"'
+        if self.headers.get("If-None-Match") == etag:
+            self._reply(304, "")
+            return
+        self._reply(200, PAGE.format(n=n), etag)
+
+    def _reply(self, status, body, etag=None):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        if etag:
+            self.send_header("ETag", etag)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def run(urls, workers, per_host):
+    StubHandler.seen.clear()
+    with tempfile.TemporaryDirectory() as pages_dir:
+        for label in ("full", "recrawl"):
+            start = time.perf_counter()
+            index, failures, changed = crawl(urls, pages_dir, workers=workers, per_host=per_host, backoff=0.01)
+            elapsed = time.perf_counter() - start
+            print(f"{label:<8} workers={workers:<3} per_host={per_host:<3} {elapsed:7.2f} s  "
+                  f"{len(urls) / elapsed:8.1f} pages/s  ok={len(index)} failed={len(failures)} "
+                  f"changed={len(changed)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--delay", type=float, default=0.05, help="задержка ответа сервера, с")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 8, 32])
+    args = parser.parse_args()
+
+    StubHandler.delay = args.delay
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}/reviews/albums"
+    urls = [f"{base}/{n}" for n in range(1, args.pages + 1)]
+
+    try:
+        for workers in args.workers:
+            run(urls, workers, per_host=workers)
+    finally:
+        server.shutdown()
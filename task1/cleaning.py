@@ -1,15 +1,33 @@
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+import argparse
+import os
 import re
 import json
+import time
 from typing import List, Optional, Any, Dict
+import soupsieve
 from bs4 import BeautifulSoup
 
 # Папки вход/выход
 PAGES_DIR = Path('pages')
 CLEANED_DIR = Path('cleaned')
-CLEANED_DIR.mkdir(exist_ok=True)
+
+# lxml быстрее встроенного html.parser, но строит дерево немного иначе на битой разметке,
+# поэтому по умолчанию остается html.parser, а lxml включается явно (--parser lxml)
+PARSER = 'html.parser'
 
 ISO_DT_RE = re.compile(r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(?:\.\d+)?Z')
+LD_JSON_SPLIT_RE = re.compile(r'\n(?=\s*[{[]\s*)')
+AUTHOR_SPLIT_RE = re.compile(r'\s*[;,/]\s*|\s+and\s+')
+BYLINE_RE = re.compile(r'^(By|by)\s+([A-Z][\w\-\.\s]+)$')
+AUTHOR_PREFIX_RE = re.compile(r'^(Автор[:\-–]\s*)(.+)$', flags=re.I)
+WHITESPACE_RE = re.compile(r'\s+')
+
+AUTHOR_SELECTORS = [soupsieve.compile(sel) for sel in
+                    ['a[rel="author"]', '.byline', '.article-author', '.author-name', '.author']]
+AUTHOR_SELECTOR_CLASSES = {'byline', 'article-author', 'author-name', 'author'}
+BYLINE_TAGS = {'p', 'div', 'span', 'a', 'li'}
 
 
 # -----------------------
@@ -36,7 +54,7 @@ def _parse_ld_json(soup: BeautifulSoup) -> List[Any]:
             continue
         except Exception:
             pass
-        for chunk in re.split(r'\n(?=\s*[{[]\s*)', text):
+        for chunk in LD_JSON_SPLIT_RE.split(text):
             try:
                 data = json.loads(chunk)
                 results.append(data)
@@ -68,20 +86,27 @@ def _extract_info_slice_fields(soup: BeautifulSoup) -> List[str]:
     return list(dict.fromkeys(results))
 
 
-def _extract_author_names(soup: BeautifulSoup) -> List[str]:
-    authors: List[str] = []
+def _short_text(el, limit: int) -> Optional[str]:
+    # то же, что el.get_text(strip=True), но перестает обходить дерево, как только текст длиннее limit
+    parts = []
+    size = 0
+    for s in el.stripped_strings:
+        size += len(s)
+        if size > limit:
+            return None
+        parts.append(s)
+    return ''.join(parts)
 
 
-    meta_author = _get_meta_content(soup,
-                                    [{'name': 'author'}, {'property': 'article:author'}, {'name': 'parsely-author'}])
-    if meta_author:
+def _is_author_like(tag) -> bool:
+    return bool((tag.get('rel') and ('author' in ' '.join(tag.get('rel')))) or
+                (tag.has_attr('class') and any(
+                    'author' in c.lower() or 'byline' in c.lower() or 'contributor' in c.lower()
+                    for c in tag.get('class'))))
 
-        for part in re.split(r'\s*[;,/]\s*|\s+and\s+', meta_author):
-            name = part.strip()
-            if name:
-                authors.append(name)
 
-    ld = _parse_ld_json(soup)
+def _authors_from_ld(ld: List[Any]) -> List[str]:
+    authors: List[str] = []
     for item in ld:
         if isinstance(item, dict) and item.get('author'):
             a = item.get('author')
@@ -101,58 +126,122 @@ def _extract_author_names(soup: BeautifulSoup) -> List[str]:
                         name = elt.get('name') or elt.get('author')
                         if name:
                             authors.append(str(name).strip())
+    return authors
 
 
-    for el in soup.find_all(attrs={'itemprop': 'author'}):
+def _extract_author_names(soup: BeautifulSoup, ld: Optional[List[Any]] = None) -> List[str]:
+    authors: List[str] = []
+
+    meta_author = _get_meta_content(soup,
+                                    [{'name': 'author'}, {'property': 'article:author'}, {'name': 'parsely-author'}])
+    if meta_author:
+
+        for part in AUTHOR_SPLIT_RE.split(meta_author):
+            name = part.strip()
+            if name:
+                authors.append(name)
+
+    if ld is None:
+        ld = _parse_ld_json(soup)
+    authors.extend(_authors_from_ld(ld))
+
+    # Один обход дерева вместо отдельного find_all/select на каждый признак.
+    # Кандидаты раскладываются по группам в порядке документа, а группы идут в прежнем порядке,
+    # поэтому список авторов совпадает с тем, что давали отдельные проходы.
+    by_itemprop = []
+    by_class_or_rel = []
+    by_selector = [[] for _ in AUTHOR_SELECTORS]
+    by_text = []
+    for el in soup.find_all(True):
+        if el.get('itemprop') == 'author':
+            by_itemprop.append(el)
+        if _is_author_like(el):
+            by_class_or_rel.append(el)
+        # селекторы сопоставляем только с тегами, которые в принципе могут под них подойти
+        if el.name == 'a' or (el.has_attr('class') and AUTHOR_SELECTOR_CLASSES.intersection(el.get('class'))):
+            for i, selector in enumerate(AUTHOR_SELECTORS):
+                if selector.match(el):
+                    by_selector[i].append(el)
+        if el.name in BYLINE_TAGS:
+            by_text.append(el)
+
+    for el in by_itemprop:
 
         text = ' '.join(el.stripped_strings)
         if text:
             authors.append(text.strip())
     # По классам и атрибутам rel
-    for el in soup.find_all(lambda tag: (
-                                                tag.get('rel') and ('author' in ' '.join(tag.get('rel')))) or
-                                        (tag.has_attr('class') and any(
-                                            'author' in c.lower() or 'byline' in c.lower() or 'contributor' in c.lower()
-                                            for c in tag.get('class')))
-                            ):
+    for el in by_class_or_rel:
         txt = ' '.join(el.stripped_strings)
         if txt:
             authors.append(txt.strip())
 
-    for sel in ['a[rel="author"]', '.byline', '.article-author', '.author-name', '.author']:
-        for el in soup.select(sel):
+    for matched in by_selector:
+        for el in matched:
             txt = ' '.join(el.stripped_strings)
             if txt:
                 authors.append(txt.strip())
 
-    for el in soup.find_all(['p', 'div', 'span', 'a', 'li']):
-        txt = el.get_text(strip=True)
-        if not txt or len(txt) > 200:
+    for el in by_text:
+        txt = _short_text(el, 200)
+        if not txt:
             continue
 
-        m = re.match(r'^(By|by)\s+([A-Z][\w\-\.\s]+)$', txt)
+        m = BYLINE_RE.match(txt)
         if m:
             authors.append(m.group(2).strip())
             continue
 
-        m2 = re.match(r'^(Автор[:\-–]\s*)(.+)$', txt, flags=re.I)
+        m2 = AUTHOR_PREFIX_RE.match(txt)
         if m2:
             authors.append(m2.group(2).strip())
             continue
 
     clean: List[str] = []
     for a in authors:
-        name = re.sub(r'\s+', ' ', a).strip()
+        name = WHITESPACE_RE.sub(' ', a).strip()
         if name and name not in clean:
             clean.append(name)
     return clean
 
 
+def resolve_parser(name: str) -> str:
+    if name == 'lxml':
+        try:
+            import lxml  # noqa: F401
+        except ImportError:
+            print('lxml не установлен, используется html.parser')
+            return 'html.parser'
+    return name
+
+
+class _StageClock:
+    """Копит время этапов в словарь timings; без словаря ничего не делает."""
+
+    def __init__(self, timings: Optional[Dict[str, float]]):
+        self.timings = timings
+        self.last = time.perf_counter() if timings is not None else 0.0
+
+    def lap(self, stage: str):
+        if self.timings is None:
+            return
+        now = time.perf_counter()
+        self.timings[stage] = self.timings.get(stage, 0.0) + now - self.last
+        self.last = now
+
+
 # -----------------------
 # Основная функция извлечения
 # -----------------------
-def extract_fields_from_html(html: str) -> Dict[str, Any]:
-    soup = BeautifulSoup(html, 'html.parser')
+def extract_fields_from_html(html: str, parser: str = PARSER,
+                             timings: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    """
+    Разбирает страницу один раз и достает из нее поля.
+    timings -- если передан, в него добавляется время по этапам (секунды).
+    """
+    clock = _StageClock(timings)
+    soup = BeautifulSoup(html, parser)
+    clock.lap('parse')
 
     # name: meta og:title / meta title / <title> / h1 / ld+json
     name = _get_meta_content(soup, [{'property': 'og:title'}, {'name': 'title'}])
@@ -162,8 +251,10 @@ def extract_fields_from_html(html: str) -> Dict[str, Any]:
         h1 = soup.find('h1')
         if h1:
             name = h1.get_text(strip=True)
-    # ld+json — дополнительная попытка
+    clock.lap('name')
+    # ld+json разбираем один раз, он же используется для авторов
     ld = _parse_ld_json(soup)
+    clock.lap('ld_json')
     for item in ld:
         if isinstance(item, dict) and not name:
             if item.get('name'):
@@ -206,12 +297,15 @@ def extract_fields_from_html(html: str) -> Dict[str, Any]:
                 review_body = '\n\n'.join(p.get_text(strip=True) for p in paragraphs)
             else:
                 review_body = article.get_text(separator='\n', strip=True)
+    clock.lap('review_body')
 
     # info slice
     info_slice_fields = _extract_info_slice_fields(soup)
+    clock.lap('info_slice')
 
     # author names
-    author_names = _extract_author_names(soup)
+    author_names = _extract_author_names(soup, ld)
+    clock.lap('authors')
 
     return {
         'name': name,
@@ -257,39 +351,93 @@ def write_single_cleaned_file(out_path: Path, fields: Dict[str, Any]):
 # -----------------------
 # Обход папки pages
 # -----------------------
-def process_all_pages(pages_dir: Path, cleaned_dir: Path):
+def list_page_files(pages_dir: Path) -> List[Path]:
+    # только сами страницы N.txt, без index.txt, failed.txt и прочих служебных файлов
+    return sorted(p for p in pages_dir.iterdir() if p.is_file() and p.suffix == '.txt' and p.stem.isdigit())
+
+
+def read_page(file_path: Path) -> str:
+    try:
+        return file_path.read_text(encoding='utf-8')
+    except UnicodeDecodeError:
+        return file_path.read_text(encoding='latin-1', errors='ignore')
+
+
+def clean_page(file_path: Path, cleaned_dir: Path, parser: str = PARSER):
+    """Обрабатывает одну страницу. Возвращает (имя файла, время по этапам, ошибка или None)."""
+    timings: Dict[str, float] = {}
+    start = time.perf_counter()
+    try:
+        html = read_page(file_path)
+    except Exception as e:
+        return file_path.name, timings, f'Не удалось прочитать {file_path.name}: {e}'
+    timings['read'] = time.perf_counter() - start
+
+    fields = extract_fields_from_html(html, parser, timings)
+
+    start = time.perf_counter()
+    write_single_cleaned_file(cleaned_dir / (file_path.stem + '.txt'), fields)
+    timings['write'] = time.perf_counter() - start
+    return file_path.name, timings, None
+
+
+def print_timing_report(timings: Dict[str, float], pages: int, wall: float):
+    total = sum(timings.values())
+    print(f'\nВремя по этапам ({pages} страниц, {wall:.2f} c на часах):')
+    for stage, seconds in sorted(timings.items(), key=lambda x: x[1], reverse=True):
+        share = seconds / total * 100 if total else 0.0
+        print(f'  {stage:<12} {seconds:8.2f} c  {seconds / max(pages, 1) * 1000:8.1f} мс/стр  {share:5.1f}%')
+
+
+def process_all_pages(pages_dir: Path, cleaned_dir: Path, workers: int = 1, parser: str = PARSER,
+                      report: bool = False):
 
     if not pages_dir.exists() or not pages_dir.is_dir():
         print(f'Входная папка {pages_dir!s} не найдена. Поместите HTML-файлы в папку "{pages_dir}" и запустите снова.')
         return
 
-    files = sorted([p for p in pages_dir.iterdir() if p.is_file()])
+    files = list_page_files(pages_dir)
     if not files:
         print(f'Файлы в папке {pages_dir!s} не найдены.')
         return
 
-    for file_path in files:
-        try:
-            try:
-                html = file_path.read_text(encoding='utf-8')
-            except Exception:
-                html = file_path.read_text(encoding='latin-1', errors='ignore')
-        except Exception as e:
-            print(f'Не удалось прочитать {file_path.name}: {e}')
-            continue
+    cleaned_dir.mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+    totals: Dict[str, float] = {}
+    if workers > 1:
+        # страницы независимы, поэтому просто раздаем их пулу процессов
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(clean_page, files, [cleaned_dir] * len(files), [parser] * len(files),
+                                   chunksize=max(1, len(files) // (workers * 4)))
+            results = list(_log_results(results, totals))
+    else:
+        results = list(_log_results((clean_page(p, cleaned_dir, parser) for p in files), totals))
 
-        print(f'Обрабатываю: {file_path.name}')
-        fields = extract_fields_from_html(html)
+    print('Обработка завершена. Результаты в папке:', cleaned_dir.resolve())
+    if report:
+        print_timing_report(totals, len(results), time.perf_counter() - start)
 
-        out_name = file_path.stem + '.txt'
-        out_path = cleaned_dir / out_name
-        write_single_cleaned_file(out_path, fields)
 
-    print('Обработка завершена. Результаты в папке:', cleaned_dir.resolve())
+def _log_results(results, totals: Dict[str, float]):
+    for name, timings, error in results:
+        if error:
+            print(error)
+            continue
+        print(f'Обработан: {name}')
+        for stage, seconds in timings.items():
+            totals[stage] = totals.get(stage, 0.0) + seconds
+        yield name
 
 
 # -----------------------
 # Запуск
 # -----------------------
 if __name__ == '__main__':
-    process_all_pages(PAGES_DIR, CLEANED_DIR)
+    arg_parser = argparse.ArgumentParser(description='Очистка HTML-страниц из pages в cleaned')
+    arg_parser.add_argument('--workers', type=int, default=1,
+                            help=f'число процессов, 1 -- последовательно (ядер: {os.cpu_count()})')
+    arg_parser.add_argument('--parser', default=PARSER, help="html.parser или lxml, если он установлен")
+    arg_parser.add_argument('--report', action='store_true', help='вывести время по этапам')
+    args = arg_parser.parse_args()
+
+    process_all_pages(PAGES_DIR, CLEANED_DIR, args.workers, resolve_parser(args.parser), args.report)
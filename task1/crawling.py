@@ -1,24 +1,301 @@
-import requests
+import argparse
+import contextlib
+import hashlib
+import json
 import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
 from tqdm import tqdm
 
-with open("urls.txt", "r", encoding="utf-8") as f:
-    urls = [line.strip() for line in f if line.strip()]  # перекалдываем ссылки из txt файла в список
-
-session = requests.Session()  # создзаем сессию
-index_lines = []
-file_id = 1
-for url in tqdm(urls, desc="Скачивание"):  # обходим сайты из списка
-    r = session.get(url, timeout=20)
-    if r.status_code != 200:  # проверка статуса ответа
-        print("status_code != 200")
-        break
-    filename = os.path.join("pages", f"{file_id}.txt")
-    with open(filename, "w", encoding="utf-8") as f:
-        f.write(r.text)  # записываем содердимое страницы в файл
-    index_lines.append(f"{file_id} {url}")
-    file_id += 1
-
-index_path = os.path.join("pages", "index.txt")
-with open(index_path, "w", encoding="utf-8") as f:
-    f.write("\n".join(index_lines))
+URLS_FILE = "urls.txt"
+PAGES_DIR = "pages"
+TIMEOUT = 20
+RETRIES = 3  # сколько раз повторяем запрос после неудачи
+BACKOFF = 0.5  # базовая задержка перед повтором, растет экспоненциально
+RETRY_STATUSES = {429, 500, 502, 503, 504}  # статусы, после которых есть смысл повторить запрос
+PER_HOST = 4  # максимум одновременных запросов к одному хосту
+MANIFEST_FILE = "manifest.json"  # url -> file_id, ETag, Last-Modified и хэш содержимого
+CHANGED_FILE = "changed.txt"  # номера документов, которые изменились за последний запуск
+
+
+def read_urls(path=URLS_FILE):
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]  # перекладываем ссылки из txt файла в список
+
+
+def make_session(pool_size=PER_HOST):
+    # сессия с пулом соединений, чтобы переиспользовать keep-alive соединения
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def fetch(session, url, retries=RETRIES, backoff=BACKOFF, timeout=TIMEOUT, headers=None, slot=None):
+    """
+    Скачивает url с повторами. Возвращает (response, error), одно из них None.
+    При условном запросе (headers с If-None-Match/If-Modified-Since) ответ может быть 304.
+    slot -- семафор хоста: берется на каждую попытку и отпускается на время задержки перед повтором.
+    """
+    slot = slot or contextlib.nullcontext()
+    error = None
+    for attempt in range(retries + 1):
+        if attempt:
+            # экспоненциальная задержка с небольшим джиттером
+            time.sleep(backoff * (2 ** (attempt - 1)) * (1 + random.random() / 2))
+        try:
+            with slot:
+                r = session.get(url, timeout=timeout, headers=headers)
+        except requests.RequestException as e:
+            error = f"{type(e).__name__}: {e}"
+            continue
+        if r.status_code in RETRY_STATUSES:
+            error = f"status_code {r.status_code}"
+            continue
+        if r.status_code not in (200, 304):  # остальные статусы повторять бессмысленно
+            return None, f"status_code {r.status_code}"
+        return r, None
+    return None, error
+
+
+class HostLimiter:
+    """Ограничивает число одновременных запросов к каждому хосту."""
+
+    def __init__(self, per_host=PER_HOST):
+        self.per_host = per_host
+        self._lock = threading.Lock()
+        self._semaphores = {}
+
+    def __call__(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.per_host)
+            return self._semaphores[host]
+
+
+def iter_pages(urls, workers=1, per_host=PER_HOST, retries=RETRIES, backoff=BACKOFF, headers_for=None):
+    """
+    Скачивает страницы и отдает (file_id, url, response, error) по мере готовности.
+    file_id -- позиция ссылки в urls.txt (с 1), поэтому номера не зависят от порядка скачивания.
+    headers_for(file_id, url) -- дополнительные заголовки запроса, например условные.
+    """
+    if headers_for is None:
+        headers_for = lambda file_id, url: None
+
+    if workers <= 1:
+        session = make_session()
+        for file_id, url in enumerate(urls, start=1):
+            r, error = fetch(session, url, retries, backoff, headers=headers_for(file_id, url))
+            yield file_id, url, r, error
+        return
+
+    local = threading.local()  # у каждого потока своя сессия со своим пулом соединений
+    limiter = HostLimiter(per_host)
+
+    def task(file_id, url):
+        if not hasattr(local, "session"):
+            local.session = make_session(per_host)
+        r, error = fetch(local.session, url, retries, backoff, headers=headers_for(file_id, url), slot=limiter(url))
+        return file_id, url, r, error
+
+    pending = set()
+    queue = iter(enumerate(urls, start=1))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # держим в работе не больше 2 * workers задач, чтобы не копить ответы в памяти
+        for file_id, url in queue:
+            pending.add(executor.submit(task, file_id, url))
+            if len(pending) >= 2 * workers:
+                break
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+                for file_id, url in queue:
+                    pending.add(executor.submit(task, file_id, url))
+                    break
+
+
+def write_index(pages_dir, index_lines):
+    index_path = os.path.join(pages_dir, "index.txt")
+    with open(index_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(index_lines))
+
+
+def write_failures(pages_dir, failures):
+    # по строке на неудачную ссылку: "<file_id> <url> <ошибка>"
+    failed_path = os.path.join(pages_dir, "failed.txt")
+    if not failures:
+        if os.path.exists(failed_path):
+            os.remove(failed_path)
+        return
+    with open(failed_path, "w", encoding="utf-8") as f:
+        for file_id, url, error in sorted(failures):
+            f.write(f"{file_id} {url} {error}\n")
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def load_manifest(pages_dir):
+    path = os.path.join(pages_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(pages_dir, manifest):
+    path = os.path.join(pages_dir, MANIFEST_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)  # атомарная замена, чтобы не оставить битый манифест
+
+
+def write_changed(pages_dir, changed):
+    # номера новых и изменившихся документов -- их и нужно переобработать на следующих этапах
+    with open(os.path.join(pages_dir, CHANGED_FILE), "w", encoding="utf-8") as f:
+        f.write("".join(f"{file_id}\n" for file_id in sorted(changed)))
+
+
+def read_changed(pages_dir=PAGES_DIR):
+    path = os.path.join(pages_dir, CHANGED_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return [int(line) for line in f if line.strip()]
+
+
+class CrawlState:
+    """
+    Учет одного запуска скачивания: манифест, index.txt, failed.txt и changed.txt.
+    Сохраненность документа проверяет has_doc(file_id): для обычного режима это файл в pages,
+    для потокового конвейера -- уже очищенный файл.
+    """
+
+    def __init__(self, pages_dir=PAGES_DIR, full=False, has_doc=None):
+        self.pages_dir = pages_dir
+        self.old_manifest = {} if full else load_manifest(pages_dir)
+        self.has_doc = has_doc or (lambda file_id: os.path.exists(os.path.join(pages_dir, f"{file_id}.txt")))
+        self.manifest = {}
+        self.index = {}
+        self.failures = []
+        self.changed = []
+
+    def _known(self, file_id, url):
+        old = self.old_manifest.get(url)
+        return old if old is not None and old.get("file_id") == file_id else None
+
+    def headers_for(self, file_id, url):
+        # условный запрос, если страница уже скачана под тем же номером
+        old = self._known(file_id, url)
+        if old is None or not self.has_doc(file_id):
+            return None
+        headers = {}
+        if old.get("etag"):
+            headers["If-None-Match"] = old["etag"]
+        if old.get("last_modified"):
+            headers["If-Modified-Since"] = old["last_modified"]
+        return headers or None
+
+    def accept(self, file_id, url, r, error):
+        """Учитывает ответ. Возвращает текст страницы, если ее нужно (пере)обработать, иначе None."""
+        old = self._known(file_id, url)
+
+        if r is None:
+            self.failures.append((file_id, url, error))
+            if old is not None and self.has_doc(file_id):
+                # оставляем прошлую версию страницы
+                self.manifest[url] = old
+                self.index[file_id] = url
+            return None
+
+        if r.status_code == 304 and old is not None:  # страница не изменилась
+            self.manifest[url] = old
+            self.index[file_id] = url
+            return None
+
+        text = r.text
+        digest = content_hash(text)
+        self.manifest[url] = {
+            "file_id": file_id,
+            "etag": r.headers.get("ETag"),
+            "last_modified": r.headers.get("Last-Modified"),
+            "sha256": digest,
+        }
+        self.index[file_id] = url
+        if old is not None and old.get("sha256") == digest and self.has_doc(file_id):
+            return None  # сервер не поддерживает условные запросы, но содержимое то же
+
+        self.changed.append(file_id)
+        return text
+
+    def reject(self, file_id, url, error):
+        """
+        Страница скачана, но не обработана (например, упала очистка). Запись в манифест не попадает,
+        поэтому следующий запуск скачает и обработает страницу заново, даже если она не изменилась.
+        В index.txt страница остается, только если сохранилась ее прошлая версия.
+        """
+        self.manifest.pop(url, None)
+        if not self.has_doc(file_id):
+            self.index.pop(file_id, None)
+        if file_id in self.changed:
+            self.changed.remove(file_id)
+        self.failures.append((file_id, url, error))
+
+    def finish(self, total):
+        os.makedirs(self.pages_dir, exist_ok=True)
+        write_index(self.pages_dir, [f"{file_id} {self.index[file_id]}" for file_id in sorted(self.index)])
+        write_failures(self.pages_dir, self.failures)
+        save_manifest(self.pages_dir, self.manifest)
+        write_changed(self.pages_dir, self.changed)
+        print(f"Изменилось страниц: {len(self.changed)} из {total}")
+        if self.failures:
+            print(f"Не удалось скачать или обработать {len(self.failures)} страниц, "
+                  f"список в {os.path.join(self.pages_dir, 'failed.txt')}")
+
+
+def crawl(urls, pages_dir=PAGES_DIR, workers=1, per_host=PER_HOST, retries=RETRIES, backoff=BACKOFF,
+          full=False):
+    """
+    Скачивает страницы в pages_dir. Если есть манифест прошлого запуска (и не full), запросы
+    делаются условными, а страницы с ответом 304 или с тем же хэшем содержимого не перезаписываются.
+    Возвращает (index, failures, changed).
+    """
+    os.makedirs(pages_dir, exist_ok=True)
+    state = CrawlState(pages_dir, full)
+    pages = iter_pages(urls, workers, per_host, retries, backoff, headers_for=state.headers_for)
+    for file_id, url, r, error in tqdm(pages, total=len(urls), desc="Скачивание"):  # обходим сайты из списка
+        text = state.accept(file_id, url, r, error)
+        if text is None:
+            continue
+        filename = os.path.join(pages_dir, f"{file_id}.txt")
+        with open(filename, "w", encoding="utf-8") as f:
+            f.write(text)  # записываем содержимое страницы в файл
+
+    state.finish(len(urls))
+    return state.index, state.failures, state.changed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Скачивание страниц из urls.txt")
+    parser.add_argument("--urls", default=URLS_FILE)
+    parser.add_argument("--pages-dir", default=PAGES_DIR)
+    parser.add_argument("--workers", type=int, default=1, help="число потоков, 1 -- последовательное скачивание")
+    parser.add_argument("--per-host", type=int, default=PER_HOST, help="максимум одновременных запросов к хосту")
+    parser.add_argument("--retries", type=int, default=RETRIES)
+    parser.add_argument("--backoff", type=float, default=BACKOFF)
+    parser.add_argument("--full", action="store_true", help="игнорировать манифест и перекачать все страницы")
+    args = parser.parse_args()
+
+    crawl(read_urls(args.urls), args.pages_dir, args.workers, args.per_host, args.retries, args.backoff,
+          full=args.full)
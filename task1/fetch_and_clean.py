@@ -0,0 +1,97 @@
+import argparse
+import gzip
+import resource
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from tqdm import tqdm
+
+from crawling import read_urls, iter_pages, CrawlState, URLS_FILE, PAGES_DIR, PER_HOST
+from cleaning import extract_fields_from_html, write_single_cleaned_file, resolve_parser, CLEANED_DIR, PARSER
+
+# Потоковый режим: скачанная страница сразу уходит в очистку, сырой HTML на диск не пишется
+# (только сжатым в архив, если попросили). В pages остаются только index.txt, manifest.json,
+# changed.txt и failed.txt, поэтому следующие этапы работают как раньше.
+
+QUEUE_SIZE = 16  # сколько скачанных страниц может ждать очистки
+
+
+def clean_html(file_id, html, cleaned_dir, parser=PARSER, archive_dir=None):
+    if archive_dir is not None:
+        with gzip.open(archive_dir / f"{file_id}.html.gz", "wt", encoding="utf-8") as f:
+            f.write(html)
+    fields = extract_fields_from_html(html, parser)
+    write_single_cleaned_file(cleaned_dir / f"{file_id}.txt", fields)
+    return file_id
+
+
+def run_pipeline(urls, pages_dir=PAGES_DIR, cleaned_dir=CLEANED_DIR, fetch_workers=8, clean_workers=1,
+                 per_host=PER_HOST, queue_size=QUEUE_SIZE, parser=PARSER, archive_dir=None, full=False):
+    cleaned_dir = Path(cleaned_dir)
+    cleaned_dir.mkdir(parents=True, exist_ok=True)
+    if archive_dir is not None:
+        archive_dir = Path(archive_dir)
+        archive_dir.mkdir(parents=True, exist_ok=True)
+
+    # страница считается сохраненной, если для нее уже есть очищенный файл
+    state = CrawlState(pages_dir, full, has_doc=lambda file_id: (cleaned_dir / f"{file_id}.txt").exists())
+    errors = []  # (file_id, url, ошибка) для страниц, которые не удалось очистить
+
+    # Обратное давление: не больше queue_size страниц ждут очистки. Пока очередь полна, главный
+    # поток не забирает новые ответы, а iter_pages не ставит новые запросы, так что память не растет.
+    slots = threading.BoundedSemaphore(queue_size)
+
+    def on_done(future, file_id, url):
+        slots.release()
+        if future.exception() is not None:
+            errors.append((file_id, url, future.exception()))
+
+    executor = ProcessPoolExecutor(max_workers=clean_workers) if clean_workers > 1 else None
+    start = time.perf_counter()
+    try:
+        pages = iter_pages(urls, fetch_workers, per_host, headers_for=state.headers_for)
+        for file_id, url, r, error in tqdm(pages, total=len(urls), desc="Скачивание и очистка"):
+            html = state.accept(file_id, url, r, error)
+            if html is None:
+                continue
+            if executor is None:
+                try:
+                    clean_html(file_id, html, cleaned_dir, parser, archive_dir)
+                except Exception as e:  # одна битая страница не должна останавливать весь обход
+                    errors.append((file_id, url, e))
+                continue
+            slots.acquire()
+            future = executor.submit(clean_html, file_id, html, cleaned_dir, parser, archive_dir)
+            future.add_done_callback(lambda future, file_id=file_id, url=url: on_done(future, file_id, url))
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    # манифест запоминает только очищенные страницы, остальные будут обработаны при следующем запуске
+    for file_id, url, e in errors:
+        print(f"Ошибка очистки {url}: {e}")
+        state.reject(file_id, url, f"clean failed: {type(e).__name__}: {e}")
+    state.finish(len(urls))
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"Готово за {time.perf_counter() - start:.2f} c, пик памяти {peak_rss_mb:.0f} МБ")
+    return state
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Скачивание и очистка страниц без сохранения сырого HTML")
+    parser.add_argument("--urls", default=URLS_FILE)
+    parser.add_argument("--pages-dir", default=PAGES_DIR, help="куда писать index.txt и манифест")
+    parser.add_argument("--cleaned-dir", default=str(CLEANED_DIR))
+    parser.add_argument("--fetch-workers", type=int, default=8)
+    parser.add_argument("--clean-workers", type=int, default=1, help="процессов очистки, 1 -- в главном процессе")
+    parser.add_argument("--per-host", type=int, default=PER_HOST)
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE)
+    parser.add_argument("--parser", default=PARSER)
+    parser.add_argument("--archive-dir", default=None, help="сохранять сырой HTML сжатым (N.html.gz) в эту папку")
+    parser.add_argument("--full", action="store_true", help="игнорировать манифест и обработать все страницы")
+    args = parser.parse_args()
+
+    run_pipeline(read_urls(args.urls), args.pages_dir, args.cleaned_dir, args.fetch_workers, args.clean_workers,
+                 args.per_host, args.queue_size, resolve_parser(args.parser), args.archive_dir, args.full)
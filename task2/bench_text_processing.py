@@ -0,0 +1,46 @@
+import argparse
+import time
+
+import spacy
+
+from text_processing import INPUT_DIR, BATCH_SIZE, iter_input, build_lemma_map
+from common.spacy_model import MODEL, load_nlp
+
+# Сравнение старого пути (полный конвейер, nlp(text) на каждый файл) с новым
+# (nlp.pipe без parser/ner, пачками и в нескольких процессах). Заодно проверяет,
+# что леммы и токены получаются те же самые.
+
+
+def run_old(texts):
+    nlp = spacy.load(MODEL)
+    start = time.perf_counter()
+    maps = [build_lemma_map(nlp(text)) for text in texts]
+    return maps, time.perf_counter() - start
+
+
+def run_new(texts, batch_size, n_process):
+    nlp = load_nlp()
+    start = time.perf_counter()
+    maps = [build_lemma_map(doc) for doc in nlp.pipe(texts, batch_size=batch_size, n_process=n_process)]
+    return maps, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input-dir", default=INPUT_DIR)
+    parser.add_argument("--repeat", type=int, default=1, help="сколько раз повторить корпус")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2])
+    args = parser.parse_args()
+
+    texts = [text for text, _ in iter_input(args.input_dir)] * args.repeat
+    print(f"Документов: {len(texts)}")
+
+    old_maps, elapsed = run_old(texts)
+    print(f"old  nlp(text)                       {elapsed:7.2f} s  {len(texts) / elapsed:8.1f} docs/s")
+
+    for n_process in args.workers:
+        new_maps, elapsed = run_new(texts, args.batch_size, n_process)
+        same = "ok" if new_maps == old_maps else "DIFFERENT"
+        print(f"new  pipe batch={args.batch_size:<4} n_process={n_process:<3} {elapsed:7.2f} s  "
+              f"{len(texts) / elapsed:8.1f} docs/s  {same}")
@@ -1,49 +1,99 @@
+import argparse
 import os
 import glob
 import re
+import sys
 
-from collections import defaultdict
+from collections import Counter, defaultdict
+from pathlib import Path
 
-import spacy  # библиотека дял токенизации и лемматизации
-from spacy.cli import download
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.spacy_model import load_nlp  # noqa: E402  загрузка spaCy для токенизации и лемматизации
+from common.lemma_cache import get_lemma_cache  # noqa: E402
 
-download("en_core_web_sm")  # скачиваем модель
+INPUT_DIR = "../task1/cleaned"
+OUTPUT_DIR = "processed_txts"
+BATCH_SIZE = 32
+N_PROCESS = 1
 
-nlp = spacy.load("en_core_web_sm")
-
-input_dir = "../task1/cleaned"
-output_dir = "processed_txts"
-os.makedirs(output_dir, exist_ok=True)
-
-pattern = os.path.join(input_dir, "*.txt")
-for filepath in glob.glob(pattern):
-
-    doc_id = os.path.splitext(os.path.basename(filepath))[0]
-
-    with open(filepath, "r", encoding="utf-8") as f:
-        text = f.read()
 
+def normalize_text(text):
     text = text.replace("’", "'").replace("‘", "'")  # нормализуем апострофы
 
     # приведение к нижнему регистру и удаление нежелательных символов
     text = text.lower()
     text = re.sub(r"[^a-zA-Z'\s]", " ", text)
     text = re.sub(r'\s+', ' ', text).strip()
+    return text
 
-    doc = nlp(text)  # токенизация и лемматизация через spacy
-
-    lemma_map = defaultdict(set)
 
+def content_tokens(doc, lemmatize=None):
+    # (лемма, токен) для каждого вхождения значимого токена документа.
+    # lemmatize(token) -- лемма из кэша, если лемматизатор spaCy отключен
     for token in doc:
         # пропускаем стоп-слова, пробелы, притяжательные маркеры и одиночные кавычки/пустые токены
         if token.is_stop or token.is_space or token.tag_ == "POS" or token.text in ("'", ""):
             continue
-        lemma = token.lemma_.strip()
+        lemma = (token.lemma_ if lemmatize is None else lemmatize(token)).strip()
         token_text = token.text.strip()
         if not lemma or not token_text:
             continue
+        yield lemma, token_text
+
+
+def build_counts(doc, lemmatize=None):
+    # (лемма, токен) -> число вхождений: из них task4 считает tf без повторного прохода по тексту
+    return Counter(content_tokens(doc, lemmatize))
+
+
+def lemma_map_from_counts(counts):
+    lemma_map = defaultdict(set)
+    for lemma, token_text in counts:
         lemma_map[lemma].add(token_text)  # собираем токены по леммам
+    return lemma_map
+
 
+def build_lemma_map(doc, lemmatize=None):
+    return lemma_map_from_counts(build_counts(doc, lemmatize))
+
+
+def write_counts(doc_id, counts, output_dir):
+    # "<токен> <номер леммы>:<вхождений> ...", номер леммы -- номер строки в <doc_id>_lemmas.txt
+    lemma_ids = {lemma: i for i, lemma in enumerate(sorted({lemma for lemma, _ in counts}))}
+    by_token = defaultdict(list)
+    for (lemma, token_text), n in counts.items():
+        by_token[token_text].append((lemma_ids[lemma], n))
+    counts_path = os.path.join(output_dir, f"{doc_id}_counts.txt")
+    with open(counts_path, "w", encoding="utf-8") as out_counts:
+        for token_text in sorted(by_token):
+            out_counts.write(token_text + " " + " ".join(f"{i}:{n}" for i, n in sorted(by_token[token_text])) + "\n")
+    return counts_path
+
+
+def build_positions(doc, lemmatize=None):
+    # лемма -> позиции в потоке токенов документа (без пробелов и одиночных кавычек).
+    # Стоп-слова тоже получают позиции, иначе фразы вроде "kid a" не найти
+    positions = defaultdict(list)
+    position = 0
+    for token in doc:
+        if token.is_space or token.text in ("'", ""):
+            continue
+        lemma = (token.lemma_ if lemmatize is None else lemmatize(token)).strip() or token.text.strip()
+        positions[lemma].append(position)
+        position += 1
+    return positions
+
+
+def write_positions(doc_id, positions, output_dir):
+    # "<лемма> <позиция> <позиция> ..." по строке на лемму
+    positions_path = os.path.join(output_dir, f"{doc_id}_positions.txt")
+    with open(positions_path, "w", encoding="utf-8") as out_positions:
+        for lemma in sorted(positions.keys()):
+            out_positions.write(lemma + " " + " ".join(map(str, positions[lemma])) + "\n")
+    return positions_path
+
+
+def write_outputs(doc_id, lemma_map, output_dir):
     # сохраняем токены
     tokens_path = os.path.join(output_dir, f"{doc_id}_tokens.txt")
     all_tokens = set()
@@ -63,6 +113,65 @@ for filepath in glob.glob(pattern):
                 continue
             out_lemmas.write(lemma + " " + " ".join(toks) + "\n")
 
-    print(f"Обработан {filepath} -> {tokens_path}, {lemmas_path}")
-
-print("Готово. Результаты в папке:", output_dir)
+    return tokens_path, lemmas_path
+
+
+def iter_input(input_dir):
+    # отдаем (нормализованный текст, (doc_id, путь)) по одному файлу, чтобы не держать корпус в памяти
+    pattern = os.path.join(input_dir, "*.txt")
+    for filepath in glob.glob(pattern):
+        doc_id = os.path.splitext(os.path.basename(filepath))[0]
+
+        with open(filepath, "r", encoding="utf-8") as f:
+            text = f.read()
+
+        yield normalize_text(text), (doc_id, filepath)
+
+
+def process_corpus(nlp, input_dir=INPUT_DIR, output_dir=OUTPUT_DIR, batch_size=BATCH_SIZE, n_process=N_PROCESS,
+                   lemma_cache=None, positions=True):
+    os.makedirs(output_dir, exist_ok=True)
+
+    # с кэшем лемматизатор spaCy не запускается: лемма берется из кэша по (токен, часть речи, морфология)
+    lemmatize = None
+    disable = []
+    if lemma_cache is not None and "lemmatizer" in nlp.pipe_names:
+        lemmatizer = nlp.get_pipe("lemmatizer")
+        disable = ["lemmatizer"]
+
+        def lemmatize(token):
+            return lemma_cache.token_lemma(token, lemmatizer)
+
+    # nlp.pipe обрабатывает документы пачками (и в нескольких процессах при n_process > 1),
+    # порядок результатов совпадает с порядком входа
+    docs = nlp.pipe(iter_input(input_dir), as_tuples=True, batch_size=batch_size, n_process=n_process,
+                    disable=disable)
+    for doc, (doc_id, filepath) in docs:
+        counts = build_counts(doc, lemmatize)
+        tokens_path, lemmas_path = write_outputs(doc_id, lemma_map_from_counts(counts), output_dir)
+        write_counts(doc_id, counts, output_dir)
+        if positions:
+            write_positions(doc_id, build_positions(doc, lemmatize), output_dir)
+        print(f"Обработан {filepath} -> {tokens_path}, {lemmas_path}")
+
+    if lemma_cache is not None:
+        print(lemma_cache.report())
+        lemma_cache.save()
+    print("Готово. Результаты в папке:", output_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Токенизация и лемматизация очищенных текстов")
+    parser.add_argument("--input-dir", default=INPUT_DIR)
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=N_PROCESS, help="число процессов spaCy (n_process)")
+    parser.add_argument("--download", action="store_true", help="скачать модель, если она не установлена")
+    parser.add_argument("--no-lemma-cache", action="store_true", help="лемматизировать без общего кэша лемм")
+    parser.add_argument("--no-positions", action="store_true", help="не сохранять позиции лемм (<doc_id>_positions.txt)")
+    args = parser.parse_args()
+
+    nlp = load_nlp(download_missing=args.download)
+    lemma_cache = None if args.no_lemma_cache else get_lemma_cache(nlp)
+    process_corpus(nlp, args.input_dir, args.output_dir, args.batch_size, args.workers, lemma_cache,
+                   not args.no_positions)
@@ -1,102 +1,157 @@
-import spacy
-import re
-from collections import defaultdict
+import argparse
+import sys
+import time
+from pathlib import Path
 
-from spacy.cli import download
-# download("en_core_web_sm")  # скачиваем модель если не скачана
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.spacy_model import load_nlp  # noqa: E402
+from common.lemma_cache import get_lemma_cache  # noqa: E402
+from common.index_version import read_version  # noqa: E402
+from common.result_cache import ResultCache  # noqa: E402
+from common import instrumentation  # noqa: E402
 
-INDEX_FILE = 'inverted_index.txt'
-URL_FILE = '../task1/pages/index.txt'
+from index_format import open_index  # noqa: E402
+from boolean_query import Evaluator, PositionalIndexMissing, QueryError, canonical, parse  # noqa: E402
 
-print("Loading inverted index...")
+BASE_DIR = Path(__file__).resolve().parent
+INDEX_FILE = BASE_DIR / 'inverted_index.bin'  # бинарный индекс, если его нет -- текстовый
+TEXT_INDEX_FILE = BASE_DIR / 'inverted_index.txt'
+POSITIONAL_INDEX_FILE = BASE_DIR / 'positional_index.bin'  # для фраз и NEAR/k, необязателен
+URL_FILE = BASE_DIR / '../task1/pages/index.txt'
+VERSION_FILE = BASE_DIR / 'index_version.txt'  # хэш файлов индекса, пишет build_inverted_index.py
+# позиций нет в репозитории: их пишет task2, поэтому для фраз нужно пересобрать оба этапа
+POSITIONAL_HINT = ("positional_index.bin not found, phrase and NEAR queries are unavailable. Build it with:\n"
+                   "  cd ../task2 && python text_processing.py   # writes <doc_id>_positions.txt\n"
+                   "  cd ../task3 && python build_inverted_index.py --text")
 
-# загрузка инвертированного индекса
-with open(INDEX_FILE, "r", encoding="utf-8") as f:
-    index = defaultdict(set)  # lemma -> множество doc_id
-    all_docs = set()  # множество всех документов
-    for line in f:
-        parts = line.strip().split(' ')
-        lemma = parts[0]
-        doc_ids = map(int, parts[1:])
-        index[lemma].update(doc_ids)
-        all_docs.update(index[lemma])
 
-print("Inverted index loaded.")
+@instrumentation.timed("load.index")
+def load_index():
+    # индекс открывается через mmap, постинги декодируются только для лемм из запроса
+    index = open_index(INDEX_FILE if INDEX_FILE.exists() else TEXT_INDEX_FILE)
+    positional = open_index(POSITIONAL_INDEX_FILE) if POSITIONAL_INDEX_FILE.exists() else None
+    return index, positional
 
-print("Loading URLs...")
 
-# загрузка индекса doc_id -> url
-doc_urls = {}
-with open(URL_FILE, "r", encoding="utf-8") as f:
-    for line in f:
-        parts = line.strip().split(' ', 1)
-        doc_id = int(parts[0])
-        url = parts[1]
-        doc_urls[doc_id] = url
-
-print("URLs loaded.")
-
-print("Loading spaCy model...")
-
-# загрузка модели для лемматизации
-nlp = spacy.load("en_core_web_sm")
-
-print("Model loaded.\n")
-
-# основной цикл обработки запросов
-while True:
-    query = input("Query (type 'exit' to quit): ").strip().lower()
-
-    # выход из программы
-    if query == "exit" or query == "":
-        print("Session finished.")
-        break
-
-    # токенизация запроса (слова и скобки)
-    tokens = re.findall(r"\w+|\(|\)", query)
-    expression = []
-
-    # преобразование запроса в выражение над множествами
-    for token in tokens:
+def load_index_version():
+    return read_version(VERSION_FILE, (INDEX_FILE, POSITIONAL_INDEX_FILE, TEXT_INDEX_FILE))
 
-        if token == "and":
-            expression.append("&")
 
-        elif token == "or":
-            expression.append("|")
+def cached_search(query, index, lemmatize, positional, result_cache, version):
+    # запрос разбирается и лемматизируется всегда, а вычисляется только при промахе кэша
+    with instrumentation.span("parse"):
+        node = parse(query, lemmatize)
+    return result_cache.lookup(canonical(node), version, lambda: evaluate(node, index, positional))
 
-        elif token == "not":
-            expression.append("all_docs -")
 
-        elif token in ("(", ")"):
-            expression.append(token)
+def evaluate(node, index, positional):
+    # собственное время этапа -- пересечения и объединения, чтение постингов идет в свой этап
+    with instrumentation.span("set_algebra"):
+        return Evaluator(index, positional).evaluate(node)
 
-        else:
-            # лемматизация токена
-            lemma = nlp(token)[0].lemma_
 
-            # получение множества документов по лемме
-            if lemma:
-                docs = index.get(lemma, set())
-            else:
-                docs = set()
-
-            expression.append(f"set({list(docs)})")
-
-    final_expression = " ".join(expression)
-
-    try:
-        # вычисление булевого выражения
-        result = eval(final_expression)
-
-        print("Doc IDs:", result)
-
-        print("URLs:")
-        for doc_id in result:
-            if doc_id in doc_urls:
-                print(doc_urls[doc_id])
-
-        print()
-
-    except Exception as e:
-        print(f"Error in query: {e}\n")
+# загрузка индекса doc_id -> url
+@instrumentation.timed("load.urls")
+def load_doc_urls():
+    doc_urls = {}
+    with URL_FILE.open("r", encoding="utf-8") as f:
+        for line in f:
+            parts = line.strip().split(' ', 1)
+            doc_id = int(parts[0])
+            url = parts[1]
+            doc_urls[doc_id] = url
+    return doc_urls
+
+
+def replay(queries, run_query):
+    """Прогон журнала запросов без вывода результатов: для замеров, трасс и --profile."""
+    errors = 0
+    start = time.perf_counter()
+    for query in queries:
+        try:
+            run_query(query)
+        except QueryError:
+            errors += 1
+    elapsed = time.perf_counter() - start
+    print(f"Запросов: {len(queries)}, с ошибкой: {errors}, {elapsed:.3f} s, "
+          f"{len(queries) / max(elapsed, 1e-9):.1f} queries/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Булев поиск по инвертированному индексу")
+    parser.add_argument("--replay", type=Path, help="файл с запросами (по строке): выполнить без вывода и выйти")
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    instrumentation.configure(args)
+
+    print("Loading inverted index...")
+    index, positional = load_index()
+    # с разметкой чтение постингов и позиций идет в свои этапы; без нее индекс не оборачивается
+    index = instrumentation.traced(index, "postings")
+    if positional is not None:
+        positional = instrumentation.traced(positional, "postings", "positions")
+    index_version = load_index_version()
+    result_cache = ResultCache()  # повторные запросы не вычисляются заново
+    print("Inverted index loaded.")
+    if positional is None:
+        print(POSITIONAL_HINT)
+
+    print("Loading URLs...")
+    doc_urls = load_doc_urls()
+    print("URLs loaded.")
+
+    print("Loading spaCy model...")
+
+    # загрузка модели для лемматизации
+    nlp = load_nlp()
+    lemma_cache = get_lemma_cache(nlp)  # леммы слов запросов кэшируются между запусками
+
+    print("Model loaded.\n")
+
+    # лемматизация слов запроса (spaCy вызывается только для слов, которых нет в кэше)
+    def lemmatize(word):
+        with instrumentation.span("lemmatize"):
+            return lemma_cache.word(nlp, word)[0]
+
+    def run_query(query):
+        with instrumentation.query(query):
+            # разбор запроса в дерево и вычисление над отсортированными постингами
+            result = cached_search(query, index, lemmatize, positional, result_cache, index_version)
+            with instrumentation.span("urls"):
+                urls = [doc_urls[doc_id] for doc_id in result if doc_id in doc_urls]
+        return result, urls
+
+    # основной цикл обработки запросов
+    def interactive():
+        while True:
+            query = input("Query (type 'exit' to quit): ").strip().lower()
+
+            # выход из программы
+            if query == "exit" or query == "":
+                break
+
+            try:
+                result, urls = run_query(query)
+
+                print("Doc IDs:", result)
+
+                print("URLs:")
+                for url in urls:
+                    print(url)
+
+                print()
+
+            except PositionalIndexMissing as e:
+                print(f"Error in query: {e}\n{POSITIONAL_HINT}\n")
+            except QueryError as e:
+                print(f"Error in query: {e}\n")
+
+    if args.replay:
+        with args.replay.open("r", encoding="utf-8") as f:
+            queries = [line.strip().lower() for line in f if line.strip()]
+        instrumentation.run_session(lambda: replay(queries, run_query), args)
+    else:
+        instrumentation.run_session(interactive, args)
+    print(lemma_cache.report())
+    print(result_cache.report())
+    print("Session finished.")
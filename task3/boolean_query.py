@@ -0,0 +1,379 @@
+import re
+from bisect import bisect_left
+
+# Разбор и вычисление булевых запросов без eval().
+#
+# Грамматика (приоритет NOT > AND > OR, соседние операнды без оператора -- AND):
+#   or_expr  := and_expr ("or" and_expr)*
+#   and_expr := not_expr (["and"] not_expr)*
+#   not_expr := "not" not_expr | primary
+#   primary  := слово ("near/k" слово)* | '"' фраза '"' | "(" or_expr ")"
+#
+# Дерево вычисляется прямо над отсортированными постингами: пересечения идут от самого
+# короткого списка к длинному с галопирующим поиском, а NOT внутри AND -- это разность
+# с уже найденным результатом, поэтому множество всех документов нужно только для
+# запроса вида "NOT x" без положительной части.
+#
+# Фразы ("kid a") и близость (kid NEAR/3 radiohead) проверяются по позиционному индексу,
+# причем только на документах, оставшихся после пересечения на уровне документов:
+# внутри AND они вычисляются последними и получают текущий результат как кандидатов.
+
+TOKEN_RE = re.compile(r'"[^"]*"|near/\d+|\w+|\(|\)')
+WORD_RE = re.compile(r"\w+")
+OPERATORS = {"and", "or", "not"}
+
+
+class QueryError(ValueError):
+    pass
+
+
+class QuerySyntaxError(QueryError):
+    pass
+
+
+class PositionalIndexMissing(QueryError):
+    pass  # фраза или NEAR, а позиционного индекса нет
+
+
+class Term:
+    def __init__(self, lemma):
+        self.lemma = lemma
+
+    def __repr__(self):
+        return f"Term({self.lemma!r})"
+
+
+class Phrase:
+    def __init__(self, lemmas):
+        self.lemmas = lemmas
+
+    def __repr__(self):
+        return f"Phrase({self.lemmas!r})"
+
+
+class Near:
+    def __init__(self, left, right, distance):
+        self.left = left
+        self.right = right
+        self.distance = distance
+
+    def __repr__(self):
+        return f"Near({self.left!r}, {self.right!r}, {self.distance})"
+
+
+class Not:
+    def __init__(self, child):
+        self.child = child
+
+    def __repr__(self):
+        return f"Not({self.child!r})"
+
+
+class And:
+    def __init__(self, children):
+        self.children = children
+
+    def __repr__(self):
+        return f"And({self.children!r})"
+
+
+class Or:
+    def __init__(self, children):
+        self.children = children
+
+    def __repr__(self):
+        return f"Or({self.children!r})"
+
+
+def tokenize(query):
+    return TOKEN_RE.findall(query.lower())
+
+
+class _Parser:
+
+    def __init__(self, tokens, lemmatize):
+        self.tokens = tokens
+        self.pos = 0
+        self.lemmatize = lemmatize
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise QuerySyntaxError("пустой запрос")
+        node = self.or_expr()
+        if self.peek() is not None:
+            raise QuerySyntaxError(f"лишний токен {self.peek()!r}")
+        return node
+
+    def or_expr(self):
+        children = [self.and_expr()]
+        while self.peek() == "or":
+            self.take()
+            children.append(self.and_expr())
+        return children[0] if len(children) == 1 else Or(children)
+
+    def and_expr(self):
+        children = [self.not_expr()]
+        while self.peek() is not None and self.peek() not in ("or", ")"):
+            if self.peek() == "and":
+                self.take()
+            children.append(self.not_expr())
+        return children[0] if len(children) == 1 else And(children)
+
+    def not_expr(self):
+        if self.peek() == "not":
+            self.take()
+            return Not(self.not_expr())
+        return self.primary()
+
+    def primary(self):
+        token = self.take()
+        if token is None:
+            raise QuerySyntaxError("запрос оборвался")
+        if token == "(":
+            node = self.or_expr()
+            if self.take() != ")":
+                raise QuerySyntaxError("не закрыта скобка")
+            return node
+        if token.startswith('"'):
+            words = WORD_RE.findall(token)
+            if not words:
+                raise QuerySyntaxError("пустая фраза")
+            return Phrase([self.lemmatize(word) for word in words])
+        node = Term(self.word(token))
+        while self.peek() is not None and self.peek().startswith("near/"):
+            distance = int(self.take()[len("near/"):])
+            right = self.take()
+            if right is None:
+                raise QuerySyntaxError("после NEAR/k нет слова")
+            node = Near(node.lemma if isinstance(node, Term) else node, self.word(right), distance)
+        return node
+
+    def word(self, token):
+        if token in ("(", ")") or token in OPERATORS or token.startswith(("near/", '"')):
+            raise QuerySyntaxError(f"ожидалось слово, а не {token!r}")
+        return self.lemmatize(token)
+
+
+def parse(query, lemmatize):
+    """Строит дерево запроса; lemmatize(слово) -> лемма."""
+    return _Parser(tokenize(query), lemmatize).parse()
+
+
+def canonical(node):
+    """
+    Запись дерева, одинаковая у равносильных запросов: вложенные AND (OR) раскрываются,
+    их операнды сортируются и не повторяются. Ключ кэша результатов.
+    """
+    if isinstance(node, (And, Or)):
+        kind = type(node)
+        stack = list(node.children)
+        children = set()
+        while stack:
+            child = stack.pop()
+            if type(child) is kind:
+                stack.extend(child.children)
+            else:
+                children.add(canonical(child))
+        return f"{kind.__name__}({', '.join(sorted(children))})"
+    if isinstance(node, Not):
+        return f"Not({canonical(node.child)})"
+    return repr(node)
+
+
+# -----------------------
+# Операции над отсортированными списками
+# -----------------------
+def _gallop(items, target, lo):
+    # первая позиция >= target, начиная с lo: сначала шаги 1, 2, 4, ..., потом бинарный поиск
+    step = 1
+    hi = lo
+    n = len(items)
+    while hi < n and items[hi] < target:
+        lo = hi + 1
+        hi += step
+        step *= 2
+    return bisect_left(items, target, lo, min(hi, n))
+
+
+def intersect(short, long):
+    if len(short) > len(long):
+        short, long = long, short
+    result = []
+    pos = 0
+    for doc_id in short:
+        pos = _gallop(long, doc_id, pos)
+        if pos == len(long):
+            break
+        if long[pos] == doc_id:
+            result.append(doc_id)
+    return result
+
+
+def difference(items, excluded):
+    result = []
+    pos = 0
+    for doc_id in items:
+        pos = _gallop(excluded, doc_id, pos)
+        if pos == len(excluded) or excluded[pos] != doc_id:
+            result.append(doc_id)
+    return result
+
+
+def union(lists):
+    merged = set()
+    for items in lists:
+        merged.update(items)
+    return sorted(merged)
+
+
+# -----------------------
+# Вычисление
+# -----------------------
+def estimate(node, index, positional=None):
+    """Верхняя оценка числа документов -- для порядка пересечений, постинги не декодируются."""
+    if isinstance(node, Term):
+        return index.df(node.lemma)
+    if isinstance(node, Phrase) and positional is not None:
+        return min(positional.df(lemma) for lemma in node.lemmas)
+    if isinstance(node, Near) and positional is not None:
+        return min(positional.df(lemma) for lemma in _near_lemmas(node))
+    if isinstance(node, And):
+        positive = [estimate(child, index, positional) for child in node.children if not isinstance(child, Not)]
+        return min(positive) if positive else index.n_docs
+    if isinstance(node, Or):
+        return min(index.n_docs, sum(estimate(child, index, positional) for child in node.children))
+    return index.n_docs
+
+
+def _near_lemmas(node):
+    # цепочка a NEAR/2 b NEAR/3 c разбирается в Near(Near(a, b, 2), c, 3)
+    left = _near_lemmas(node.left) if isinstance(node.left, Near) else [node.left]
+    return left + [node.right]
+
+
+def _is_positional(node):
+    return isinstance(node, (Phrase, Near))
+
+
+def phrase_match(position_lists):
+    """Есть ли p, что p + i встречается в i-м списке позиций для всех i."""
+    rest = [set(positions) for positions in position_lists[1:]]
+    return any(all(p + i in positions for i, positions in enumerate(rest, start=1))
+               for p in position_lists[0])
+
+
+def near_match(left, right, distance):
+    """Есть ли пара позиций из двух отсортированных списков на расстоянии не больше distance."""
+    i = j = 0
+    while i < len(left) and j < len(right):
+        if abs(left[i] - right[j]) <= distance:
+            return True
+        if left[i] < right[j]:
+            i += 1
+        else:
+            j += 1
+    return False
+
+
+class Evaluator:
+
+    def __init__(self, index, positional=None):
+        self.index = index
+        self.positional = positional
+        self._all_docs = None
+
+    def all_docs(self):
+        if self._all_docs is None:
+            self._all_docs = sorted(self.index.all_docs)
+        return self._all_docs
+
+    def evaluate(self, node, within=None):
+        """Отсортированный список doc_id, подходящих под запрос; within -- кандидаты для фраз и NEAR."""
+        if isinstance(node, Term):
+            return self.index.postings(node.lemma) if node.lemma else []
+        if isinstance(node, Phrase):
+            return self.evaluate_phrase(node, within)
+        if isinstance(node, Near):
+            return self.evaluate_near(node, within)
+        if isinstance(node, And):
+            return self.evaluate_and(node)
+        if isinstance(node, Or):
+            return union(self.evaluate(child) for child in node.children)
+        if isinstance(node, Not):
+            return difference(self.all_docs(), self.evaluate(node.child))
+        raise TypeError(f"неизвестный узел {node!r}")
+
+    def evaluate_and(self, node):
+        positive = [child for child in node.children if not isinstance(child, Not)]
+        negative = [child.child for child in node.children if isinstance(child, Not)]
+
+        if positive:
+            # от самого редкого, фразы и NEAR -- в конце, уже по найденным кандидатам
+            positive.sort(key=lambda child: (_is_positional(child), estimate(child, self.index, self.positional)))
+            result = self.evaluate(positive[0])
+            for child in positive[1:]:
+                if not result:
+                    return result
+                if _is_positional(child):
+                    result = self.evaluate(child, within=result)
+                else:
+                    result = intersect(result, self.evaluate(child))
+        else:
+            result = self.all_docs()
+
+        for child in sorted(negative, key=lambda child: -estimate(child, self.index, self.positional)):
+            if not result:
+                break
+            result = difference(result, self.evaluate(child))
+        return result
+
+    def candidates(self, lemmas, within=None):
+        # документы, где есть все леммы, -- обычное пересечение по позиционному индексу
+        if self.positional is None:
+            raise PositionalIndexMissing("позиционный индекс не построен, фразы и NEAR недоступны")
+        result = within
+        for lemma in sorted(set(lemmas), key=self.positional.df):
+            if result is not None and not result:
+                break
+            postings = self.positional.postings(lemma)
+            result = postings if result is None else intersect(result, postings)
+        return result or []
+
+    def evaluate_phrase(self, node, within=None):
+        docs = self.candidates(node.lemmas, within)
+        if len(node.lemmas) == 1 or not docs:
+            return docs
+        doc_set = set(docs)
+        positions = {lemma: self.positional.positions(lemma, doc_set) for lemma in set(node.lemmas)}
+        return [doc_id for doc_id in docs
+                if phrase_match([positions[lemma][doc_id] for lemma in node.lemmas])]
+
+    def evaluate_near(self, node, within=None):
+        docs = self.candidates(_near_lemmas(node), within)
+        if not docs:
+            return docs
+        doc_set = set(docs)
+        positions = {lemma: self.positional.positions(lemma, doc_set) for lemma in set(_near_lemmas(node))}
+        return [doc_id for doc_id in docs if _near_positions(node, positions, doc_id)]
+
+
+def _near_positions(node, positions, doc_id):
+    # позиции правого слова, для которых вся цепочка слева выполняется
+    if isinstance(node.left, Near):
+        left = _near_positions(node.left, positions, doc_id)
+    else:
+        left = positions[node.left].get(doc_id, [])
+    right = positions[node.right].get(doc_id, [])
+    return [p for p in right if near_match(left, [p], node.distance)]
+
+
+def search(query, index, lemmatize, positional=None):
+    return Evaluator(index, positional).evaluate(parse(query, lemmatize))
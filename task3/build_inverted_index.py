@@ -1,26 +1,82 @@
 from collections import defaultdict
+import argparse
 import os
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.index_version import write_version  # noqa: E402
+
+from index_format import write_binary_index, write_text_index, write_positional_index  # noqa: E402
+from spimi import build_spimi  # noqa: E402
 
 TERMS_DIR = '../task2/processed_txts'  # папка с леммами
+BINARY_INDEX_FILE = 'inverted_index.bin'  # основной формат, его читает bool_search.py
+TEXT_INDEX_FILE = 'inverted_index.txt'  # текстовый экспорт
+POSITIONAL_INDEX_FILE = 'positional_index.bin'  # позиции лемм для фраз и NEAR/k
+VERSION_FILE = 'index_version.txt'  # хэш индексов: по нему поиск сбрасывает кэш результатов
+
+
+def doc_files(terms_dir, suffix, keep=None):
+    # (doc_id, путь) файлов "<doc_id><suffix>"; keep(doc_id) -- отбор документов (например, шарда)
+    for filename in os.listdir(terms_dir):
+        if not filename.endswith(suffix):
+            continue
+        doc_id = int(filename.split('_')[0])
+        if keep is None or keep(doc_id):
+            yield doc_id, os.path.join(terms_dir, filename)
+
+
+def collect_postings(terms_dir=TERMS_DIR, keep=None, verbose=True):
+    inverted_index = defaultdict(set)  # словарь для индекса. ключ -- лемма, значение -- номера доков
+
+    for doc_id, file_path in doc_files(terms_dir, 'lemmas.txt', keep):  # берем только файлы с леммами
+        with open(file_path, "r", encoding="utf-8") as f:
+
+            if verbose:
+                print('Processing ' + os.path.basename(file_path))
+            for line in f:  # проходимся по всем строкам
+
+                lemma = line.strip().split(' ')[0]  # берем первое слово в строке -- лемму
+                inverted_index[lemma].add(doc_id)  # кладем в сет номер дока в котором встречается данная лемма
 
-inverted_index = defaultdict(set)  # словарь для индекса. ключ -- лемма, значение -- номера доков
+    return inverted_index
 
-for filename in os.listdir(TERMS_DIR):
 
-    if not filename.endswith('lemmas.txt'):  # берем только файлы с леммами
-        continue
+def collect_positions(terms_dir=TERMS_DIR, keep=None):
+    # позиционный индекс строится, если task2 сохранил позиции (<doc_id>_positions.txt)
+    positional_index = defaultdict(dict)  # лемма -> {doc_id: позиции}
+    for doc_id, file_path in doc_files(terms_dir, '_positions.txt', keep):
+        with open(file_path, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.strip().split(' ')
+                positional_index[parts[0]][doc_id] = [int(p) for p in parts[1:]]
+    return positional_index
 
-    doc_id = int(filename.split('_')[0])
-    file_path = os.path.join(TERMS_DIR, filename)
 
-    with open(file_path, "r", encoding="utf-8") as f:
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Построение инвертированного индекса по леммам')
+    parser.add_argument('--text', action='store_true', help=f'дополнительно выгрузить индекс в {TEXT_INDEX_FILE}')
+    parser.add_argument('--memory-budget', type=float,
+                        help='МБ под индекс в памяти: строить по частям во внешней памяти (SPIMI, см. spimi.py)')
+    parser.add_argument('--tmp-dir', help='папка для частичных индексов SPIMI (по умолчанию системная временная)')
+    args = parser.parse_args()
 
-        print('Processing ' + filename)
-        for line in f:  # проходимся по всем строкам
+    if args.memory_budget:
+        n_runs, n_terms = build_spimi(TERMS_DIR, int(args.memory_budget * 2 ** 20), BINARY_INDEX_FILE,
+                                      TEXT_INDEX_FILE if args.text else None, args.tmp_dir)
+        print(f'SPIMI: {n_runs} частичных индексов, {n_terms} лемм')
+    else:
+        inverted_index = collect_postings()
+        write_binary_index(BINARY_INDEX_FILE, inverted_index)  # сохраняем индекс в бинарный файл
+        if args.text:
+            write_text_index(TEXT_INDEX_FILE, inverted_index)
 
-            lemma = line.strip().split(' ')[0]  # берем первое слово в строке -- лемму
-            inverted_index[lemma].add(doc_id)  # кладем в сет номер дока в котором встречается данная лемма
+    positional_index = collect_positions()
+    if positional_index:
+        write_positional_index(POSITIONAL_INDEX_FILE, positional_index)
+    else:
+        print(f'Файлов с позициями в {TERMS_DIR} нет, {POSITIONAL_INDEX_FILE} не построен')
 
-with open('inverted_index.txt', "w", encoding="utf-8") as f:  # сохраянем индекс в файл
-    for lemma in sorted(inverted_index.keys()):
-        f.write(lemma + " " + " ".join(map(str, sorted(inverted_index[lemma]))) + "\n")
\ No newline at end of file
+    # версия пишется последней, когда все файлы индекса уже на месте
+    print(f'{VERSION_FILE}: {write_version(VERSION_FILE, (BINARY_INDEX_FILE, POSITIONAL_INDEX_FILE))}')
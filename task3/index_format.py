@@ -0,0 +1,356 @@
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+from collections import defaultdict
+
+# Бинарный формат инвертированного индекса (inverted_index.bin).
+#
+#   заголовок      HEADER: magic, версия, число терминов, смещения секций
+#   таблица        по записи ENTRY на термин, термины отсортированы по байтам UTF-8:
+#                  (смещение термина, смещение постинга, df) и завершающая запись-ограничитель,
+#                  длины термина и постинга -- разность со следующей записью
+#   термины        байты всех терминов подряд
+#   постинги       номера документов по возрастанию: разности соседних номеров в varint
+#   все документы  такой же список всех doc_id (нужен для NOT)
+#
+# Позиционный индекс (positional_index.bin) устроен так же, отличается только постинг,
+# см. write_positional_index.
+#
+# Файл открывается через mmap, таблица не загружается целиком: термин ищется бинарным
+# поиском, а постинг декодируется только для терминов из запроса.
+
+MAGIC = b"IIX1"
+POSITIONAL_MAGIC = b"PIX1"
+VERSION = 1
+HEADER = struct.Struct("<4sIIIQQQQQ")  # magic, version, n_terms, n_docs, table, terms, postings, docs, docs_len
+ENTRY = struct.Struct("<IQI")  # term_off, post_off, df
+
+
+def encode_postings(doc_ids):
+    """Отсортированные doc_id -> разности в varint."""
+    out = bytearray()
+    prev = 0
+    for doc_id in doc_ids:
+        delta = doc_id - prev
+        prev = doc_id
+        while delta >= 0x80:
+            out.append((delta & 0x7F) | 0x80)
+            delta >>= 7
+        out.append(delta)
+    return bytes(out)
+
+
+def decode_postings(buf, start=0, end=None):
+    end = len(buf) if end is None else end
+    doc_ids = []
+    prev = 0
+    value = 0
+    shift = 0
+    for i in range(start, end):
+        byte = buf[i]
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        prev += value
+        doc_ids.append(prev)
+        value = 0
+        shift = 0
+    return doc_ids
+
+
+def write_binary_index(path, inverted_index):
+    """inverted_index: термин -> множество doc_id."""
+    writer = IndexWriter(path)
+    for term, docs in sorted((term.encode("utf-8"), sorted(docs)) for term, docs in inverted_index.items()):
+        writer.add(term, encode_postings(docs), docs)
+    writer.close()
+
+
+class IndexWriter:
+    """
+    Пишет индекс по одному термину, термины -- по возрастанию байтов UTF-8. Постинги сразу
+    уходят во временный файл, в памяти остаются только таблица, термины и номера документов,
+    поэтому индекс можно писать потоком, не собирая его целиком (см. spimi.py).
+    """
+
+    def __init__(self, path, magic=MAGIC):
+        self.path = path
+        self.magic = magic
+        self.table = bytearray()
+        self.terms = bytearray()
+        self.postings_size = 0
+        self.n_terms = 0
+        self.all_docs = set()
+        self.last_term = None
+        self.spool = tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(path)))
+
+    def add(self, term, encoded, doc_ids):
+        """term -- байты UTF-8, encoded -- закодированный постинг, doc_ids -- его документы."""
+        if self.last_term is not None and term <= self.last_term:
+            raise ValueError("термины должны идти строго по возрастанию")
+        self.table += ENTRY.pack(len(self.terms), self.postings_size, len(doc_ids))
+        self.terms += term
+        self.spool.write(encoded)
+        self.postings_size += len(encoded)
+        self.all_docs.update(doc_ids)
+        self.n_terms += 1
+        self.last_term = term
+
+    def close(self):
+        table = self.table + ENTRY.pack(len(self.terms), self.postings_size, 0)  # ограничитель
+        all_docs = sorted(self.all_docs)
+        docs_blob = encode_postings(all_docs)
+
+        table_off = HEADER.size
+        terms_off = table_off + len(table)
+        postings_off = terms_off + len(self.terms)
+        docs_off = postings_off + self.postings_size
+        # пишем во временный файл и подменяем им старый: тот, кто уже открыл старый индекс
+        # через mmap (например, поисковый сервер), дочитывает его целым
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(self.magic, VERSION, self.n_terms, len(all_docs),
+                                table_off, terms_off, postings_off, docs_off, len(docs_blob)))
+            f.write(table)
+            f.write(self.terms)
+            self.spool.seek(0)
+            shutil.copyfileobj(self.spool, f)
+            f.write(docs_blob)
+        self.spool.close()
+        os.replace(tmp_path, self.path)
+
+
+def _varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(buf, i):
+    value = 0
+    shift = 0
+    while True:
+        byte = buf[i]
+        i += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, i
+        shift += 7
+
+
+def write_positional_index(path, positional_index):
+    """
+    positional_index: термин -> {doc_id: отсортированные позиции}.
+    Та же раскладка, что у write_binary_index, но постинг термина состоит из двух потоков:
+    документы -- (разность doc_id, tf, длина блока позиций в байтах) в varint, и позиции --
+    по блоку разностей на документ. Длина блока позволяет перескакивать позиции документов,
+    которых нет среди кандидатов, не декодируя их.
+    """
+    writer = IndexWriter(path, POSITIONAL_MAGIC)
+    for term, docs in sorted((term.encode("utf-8"), docs) for term, docs in positional_index.items()):
+        doc_stream = bytearray()
+        pos_stream = bytearray()
+        prev_doc = 0
+        for doc_id in sorted(docs):
+            block = encode_postings(docs[doc_id])
+            _varint(doc_stream, doc_id - prev_doc)
+            _varint(doc_stream, len(docs[doc_id]))
+            _varint(doc_stream, len(block))
+            prev_doc = doc_id
+            pos_stream += block
+        # перед потоком документов -- его длина, чтобы найти начало позиций
+        head = bytearray()
+        _varint(head, len(doc_stream))
+        writer.add(term, head + doc_stream + pos_stream, docs.keys())
+    writer.close()
+
+
+def write_text_index(path, inverted_index):
+    # прежний текстовый формат: "лемма doc_id doc_id ..." по строке на лемму
+    with open(path, "w", encoding="utf-8") as f:
+        for lemma in sorted(inverted_index.keys()):
+            f.write(lemma + " " + " ".join(map(str, sorted(inverted_index[lemma]))) + "\n")
+
+
+class BinaryIndex:
+    """Индекс поверх mmap: постинги декодируются по требованию."""
+
+    magic = MAGIC
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.n_terms, self.n_docs, self._table, self._terms, self._postings, self._docs,
+         self._docs_len) = HEADER.unpack_from(self._mm, 0)
+        if magic != self.magic or version != VERSION:
+            raise ValueError(f"{path}: не бинарный индекс версии {VERSION}")
+        self._all_docs = None
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+    def __len__(self):
+        return self.n_terms
+
+    def _entry(self, i):
+        # (начало термина, конец термина, начало постинга, конец постинга, df) -- абсолютные смещения
+        term_off, post_off, df = ENTRY.unpack_from(self._mm, self._table + i * ENTRY.size)
+        term_end, post_end, _ = ENTRY.unpack_from(self._mm, self._table + (i + 1) * ENTRY.size)
+        return (self._terms + term_off, self._terms + term_end,
+                self._postings + post_off, self._postings + post_end, df)
+
+    def _term(self, entry):
+        return self._mm[entry[0]:entry[1]]
+
+    def _find(self, term):
+        key = term.encode("utf-8")
+        lo, hi = 0, self.n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            entry = self._entry(mid)
+            current = self._term(entry)
+            if current < key:
+                lo = mid + 1
+            elif current > key:
+                hi = mid
+            else:
+                return entry
+        return None
+
+    def __contains__(self, term):
+        return self._find(term) is not None
+
+    def df(self, term):
+        entry = self._find(term)
+        return entry[4] if entry else 0
+
+    def postings(self, term):
+        """Отсортированный список doc_id для термина (пустой, если термина нет)."""
+        entry = self._find(term)
+        if entry is None:
+            return []
+        return decode_postings(self._mm, entry[2], entry[3])
+
+    def get(self, term, default=None):
+        entry = self._find(term)
+        if entry is None:
+            return default
+        return set(decode_postings(self._mm, entry[2], entry[3]))
+
+    @property
+    def all_docs(self):
+        if self._all_docs is None:
+            self._all_docs = set(decode_postings(self._mm, self._docs, self._docs + self._docs_len))
+        return self._all_docs
+
+    def items(self):
+        for i in range(self.n_terms):
+            entry = self._entry(i)
+            yield self._term(entry).decode("utf-8"), decode_postings(self._mm, entry[2], entry[3])
+
+
+class PositionalIndex(BinaryIndex):
+    """Позиционный индекс поверх mmap (см. write_positional_index)."""
+
+    magic = POSITIONAL_MAGIC
+
+    def _doc_stream(self, entry):
+        doc_len, i = _read_varint(self._mm, entry[2])
+        return i, i + doc_len
+
+    def postings(self, term):
+        entry = self._find(term)
+        if entry is None:
+            return []
+        i, end = self._doc_stream(entry)
+        doc_ids = []
+        doc_id = 0
+        mm = self._mm
+        while i < end:
+            delta, i = _read_varint(mm, i)
+            _, i = _read_varint(mm, i)
+            _, i = _read_varint(mm, i)
+            doc_id += delta
+            doc_ids.append(doc_id)
+        return doc_ids
+
+    def get(self, term, default=None):
+        return set(self.postings(term)) if term in self else default
+
+    def positions(self, term, candidates=None):
+        """{doc_id: позиции} для термина; при candidates -- только для этих документов."""
+        entry = self._find(term)
+        return self._positions(entry, candidates) if entry is not None else {}
+
+    def _positions(self, entry, candidates=None):
+        i, end = self._doc_stream(entry)
+        pos = end
+        result = {}
+        doc_id = 0
+        mm = self._mm
+        while i < end:
+            delta, i = _read_varint(mm, i)
+            _, i = _read_varint(mm, i)
+            block_len, i = _read_varint(mm, i)
+            doc_id += delta
+            if candidates is None or doc_id in candidates:
+                result[doc_id] = decode_postings(mm, pos, pos + block_len)
+            pos += block_len
+        return result
+
+    def items(self):
+        for i in range(self.n_terms):
+            entry = self._entry(i)
+            yield self._term(entry).decode("utf-8"), self._positions(entry)
+
+
+class TextIndex:
+    """Старый текстовый формат, загруженный целиком в память; интерфейс как у BinaryIndex."""
+
+    def __init__(self, path):
+        self._index = defaultdict(set)  # lemma -> множество doc_id
+        self.all_docs = set()  # множество всех документов
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.strip().split(' ')
+                lemma = parts[0]
+                doc_ids = map(int, parts[1:])
+                self._index[lemma].update(doc_ids)
+                self.all_docs.update(self._index[lemma])
+        self.n_terms = len(self._index)
+        self.n_docs = len(self.all_docs)
+
+    def close(self):
+        pass
+
+    def __len__(self):
+        return self.n_terms
+
+    def __contains__(self, term):
+        return term in self._index
+
+    def df(self, term):
+        return len(self._index.get(term, ()))
+
+    def postings(self, term):
+        return sorted(self._index.get(term, ()))
+
+    def get(self, term, default=None):
+        return self._index.get(term, default)
+
+    def items(self):
+        for term in sorted(self._index):
+            yield term, sorted(self._index[term])
+
+
+def open_index(path):
+    with open(path, "rb") as f:
+        magic = f.read(len(MAGIC))
+    if magic == POSITIONAL_MAGIC:
+        return PositionalIndex(path)
+    return BinaryIndex(path) if magic == MAGIC else TextIndex(path)
@@ -0,0 +1,129 @@
+import heapq
+import os
+import tempfile
+
+from index_format import IndexWriter, encode_postings
+
+# Построение индекса во внешней памяти (SPIMI, single-pass in-memory indexing).
+#
+# Файлы лемм читаются один раз по возрастанию doc_id, постинги копятся в словаре в памяти.
+# Когда оценка его размера превышает бюджет, словарь сортируется и сбрасывается на диск
+# частичным индексом (run) -- строки "лемма doc_id doc_id ...", как в inverted_index.txt.
+# В конце runs сливаются k-путевым слиянием (heapq.merge) и потоком пишутся в
+# inverted_index.bin через IndexWriter и, если нужно, в inverted_index.txt. Документ целиком
+# попадает в один run, а runs идут по возрастанию doc_id, поэтому постинги одной леммы из
+# разных runs просто склеиваются по порядку. В памяти одновременно -- один частичный
+# индекс и по строке из каждого run.
+
+TERM_OVERHEAD = 200  # оценка байт на лемму в словаре: строка, запись словаря, список
+POSTING_OVERHEAD = 40  # байт на doc_id в списке
+MAX_FAN_IN = 64  # сколько runs сливать за раз; если их больше -- слияние в несколько проходов
+
+
+def lemma_files(terms_dir):
+    files = [(int(filename.split('_')[0]), os.path.join(terms_dir, filename))
+             for filename in os.listdir(terms_dir) if filename.endswith('lemmas.txt')]
+    return sorted(files)
+
+
+def format_line(lemma, docs):
+    return lemma + " " + " ".join(map(str, docs)) + "\n"
+
+
+def write_run(path, entries):
+    with open(path, "w", encoding="utf-8") as f:
+        for lemma, docs in entries:
+            f.write(format_line(lemma, docs))
+
+
+def read_run(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            lemma, _, docs = line.rstrip("\n").partition(" ")
+            yield lemma, docs
+
+
+def invert(terms_dir, budget, tmp_dir):
+    """Пишет runs в tmp_dir и возвращает их пути по порядку."""
+    runs = []
+    partial = {}
+    size = 0
+
+    def flush():
+        path = os.path.join(tmp_dir, f"run_{len(runs):05d}.txt")
+        write_run(path, ((lemma, partial[lemma]) for lemma in sorted(partial)))
+        runs.append(path)
+        partial.clear()
+
+    for doc_id, file_path in lemma_files(terms_dir):
+        with open(file_path, "r", encoding="utf-8") as f:
+            for line in f:
+                lemma = line.strip().split(' ')[0]
+                postings = partial.get(lemma)
+                if postings is None:
+                    partial[lemma] = [doc_id]
+                    size += TERM_OVERHEAD + len(lemma) + POSTING_OVERHEAD
+                elif postings[-1] != doc_id:
+                    postings.append(doc_id)
+                    size += POSTING_OVERHEAD
+        if size >= budget:  # сбрасываем только между документами
+            flush()
+            size = 0
+    if partial or not runs:
+        flush()
+    return runs
+
+
+def merge_runs(runs):
+    # (лемма, doc_id по возрастанию) по возрастанию лемм; при равных леммах heapq.merge
+    # сохраняет порядок runs
+    current = None
+    docs = []
+    for lemma, run_docs in heapq.merge(*(read_run(path) for path in runs), key=lambda entry: entry[0]):
+        if lemma != current:
+            if current is not None:
+                yield current, docs
+            current = lemma
+            docs = []
+        docs.extend(map(int, run_docs.split()))
+    if current is not None:
+        yield current, docs
+
+
+def reduce_runs(runs, run_dir, fan_in=MAX_FAN_IN):
+    # соседние runs сливаются группами в промежуточные, пока их не станет не больше fan_in:
+    # порядок runs сохраняется, открытых файлов -- не больше fan_in
+    level = 0
+    while len(runs) > fan_in:
+        merged = []
+        for start in range(0, len(runs), fan_in):
+            path = os.path.join(run_dir, f"merge_{level}_{start // fan_in:05d}.txt")
+            write_run(path, merge_runs(runs[start:start + fan_in]))
+            for run in runs[start:start + fan_in]:
+                os.remove(run)
+            merged.append(path)
+        runs = merged
+        level += 1
+    return runs
+
+
+def build_spimi(terms_dir, budget, binary_path, text_path=None, tmp_dir=None):
+    """Строит индекс с бюджетом памяти budget байт под частичный индекс; возвращает (число runs, число лемм)."""
+    with tempfile.TemporaryDirectory(prefix="spimi_", dir=tmp_dir) as run_dir:
+        runs = invert(terms_dir, budget, run_dir)
+        n_runs = len(runs)
+        runs = reduce_runs(runs, run_dir)
+        writer = IndexWriter(binary_path)
+        text = open(text_path, "w", encoding="utf-8") if text_path else None
+        n_terms = 0
+        try:
+            for lemma, docs in merge_runs(runs):
+                writer.add(lemma.encode("utf-8"), encode_postings(docs), docs)
+                if text is not None:
+                    text.write(format_line(lemma, docs))
+                n_terms += 1
+        finally:
+            if text is not None:
+                text.close()
+        writer.close()
+    return n_runs, n_terms
@@ -0,0 +1,107 @@
+import argparse
+import math
+import shutil
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from tf_idf_count import CLEANED_DIR, LEMMA_DIR, discover_doc_ids, compute_tfidf, format_row
+
+# Сравнение прежнего подсчета (вложенные циклы документы x словарь) с разреженными матрицами
+# на корпусах разного размера. Корпус больше исходного собирается копированием документов
+# под новыми номерами во временную папку. Заодно проверяется, что строки файлов совпадают.
+
+
+def run_old(doc_ids, lemma_dir, cleaned_dir):
+    N = len(doc_ids)
+    global_lemma2tokens = defaultdict(set)
+    for doc_id in doc_ids:
+        for line in (lemma_dir / f"{doc_id}_lemmas.txt").read_text(encoding='utf-8').splitlines():
+            parts = line.strip().split()
+            if parts:
+                global_lemma2tokens[parts[0]].update(parts[1:])
+    tokens_in_mapping = set()
+    for toks in global_lemma2tokens.values():
+        tokens_in_mapping.update(toks)
+
+    doc_token_counts = {}
+    for doc_id in doc_ids:
+        raw = (cleaned_dir / f"{doc_id}.txt").read_text(encoding='utf-8')
+        doc_token_counts[doc_id] = Counter(t for t in raw.split() if t and (t in tokens_in_mapping))
+
+    term_df = defaultdict(int)
+    for cnt in doc_token_counts.values():
+        for term in cnt.keys():
+            term_df[term] += 1
+    term_idf = {term: (math.log(N / df) + 1.0) for term, df in term_df.items()}
+
+    lemma_doc_tf = {doc_id: Counter() for doc_id in doc_ids}
+    for doc_id in doc_ids:
+        token_counts = doc_token_counts[doc_id]
+        for lemma, toks in global_lemma2tokens.items():
+            tf_sum = 0
+            for tok in toks:
+                tf_sum += token_counts.get(tok, 0)
+            if tf_sum > 0:
+                lemma_doc_tf[doc_id][lemma] = tf_sum
+
+    lemma_df = defaultdict(int)
+    for lemma in global_lemma2tokens.keys():
+        for doc_id in doc_ids:
+            if lemma_doc_tf[doc_id].get(lemma, 0) > 0:
+                lemma_df[lemma] += 1
+    lemma_idf = {lemma: (math.log(N / df) + 1.0) for lemma, df in lemma_df.items() if df > 0}
+
+    return (rows_old(doc_ids, doc_token_counts, term_idf), rows_old(doc_ids, lemma_doc_tf, lemma_idf))
+
+
+def rows_old(doc_ids, counts, idf):
+    result = []
+    for doc_id in doc_ids:
+        entries = [(key, idf.get(key, 0.0), tf * idf.get(key, 0.0)) for key, tf in counts[doc_id].items()]
+        entries.sort(key=lambda x: x[2], reverse=True)
+        result.append([f"{key} {i:.6f} {w:.6f}\n" for key, i, w in entries])
+    return result
+
+
+def rows_new(tf, idf, vocab):
+    return [format_row(tf, idf, vocab, row) for row in range(tf.shape[0])]
+
+
+def make_corpus(root, n_docs, source_ids):
+    # документы 1..n_docs -- копии исходных по кругу
+    lemma_dir = root / 'lemmas'
+    cleaned_dir = root / 'cleaned'
+    lemma_dir.mkdir()
+    cleaned_dir.mkdir()
+    for doc_id in range(1, n_docs + 1):
+        src = source_ids[(doc_id - 1) % len(source_ids)]
+        shutil.copyfile(LEMMA_DIR / f"{src}_lemmas.txt", lemma_dir / f"{doc_id}_lemmas.txt")
+        shutil.copyfile(CLEANED_DIR / f"{src}.txt", cleaned_dir / f"{doc_id}.txt")
+    return [str(i) for i in range(1, n_docs + 1)], lemma_dir, cleaned_dir
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 200, 800])
+    parser.add_argument("--skip-old-above", type=int, default=1000, help="не запускать старый подсчет на корпусах больше")
+    args = parser.parse_args()
+
+    source_ids = discover_doc_ids()
+    for n_docs in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            doc_ids, lemma_dir, cleaned_dir = make_corpus(Path(tmp), n_docs, source_ids)
+
+            start = time.perf_counter()
+            terms, lemmas = compute_tfidf(doc_ids, lemma_dir, cleaned_dir)
+            new_time = time.perf_counter() - start
+            line = f"docs={n_docs:<6} vocab={len(lemmas[2]):<6} new {new_time:7.2f} s"
+
+            if n_docs <= args.skip_old_above:
+                start = time.perf_counter()
+                old_terms, old_lemmas = run_old(doc_ids, lemma_dir, cleaned_dir)
+                old_time = time.perf_counter() - start
+                same = old_terms == rows_new(*terms) and old_lemmas == rows_new(*lemmas)
+                line += f"  old {old_time:7.2f} s  x{old_time / new_time:5.1f}  {'ok' if same else 'DIFFERENT'}"
+            print(line)
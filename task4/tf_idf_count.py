@@ -1,111 +1,343 @@
 from pathlib import Path
-from collections import Counter, defaultdict
+from collections import Counter
+import argparse
+import hashlib
+import json
 import math
+import os
+import sys
+
+import numpy as np
+from scipy import sparse
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.tfidf_matrix import write_matrix  # noqa: E402
+from common.index_version import write_version  # noqa: E402
 
 CLEANED_DIR = Path('../task1/cleaned')
 LEMMA_DIR = Path('../task2/processed_txts')
 OUT_TERMS_DIR = Path('./tfidf_outputs/terms')
 OUT_LEMMAS_DIR = Path('./tfidf_outputs/lemmas')
-OUT_TERMS_DIR.mkdir(parents=True, exist_ok=True)
-OUT_LEMMAS_DIR.mkdir(parents=True, exist_ok=True)
+OUT_TERMS_MATRIX = Path('./tfidf_outputs/terms_tfidf.bin')  # те же веса одной упакованной матрицей
+OUT_LEMMAS_MATRIX = Path('./tfidf_outputs/lemmas_tfidf.bin')
+VERSION_FILE = Path('./tfidf_outputs/version.txt')  # хэш матриц: по нему поиск сбрасывает кэш результатов
+STATS_FILE = Path('./tfidf_outputs/stats.json')  # разобранные документы с прошлого запуска
+# --separate-idf: вместо файлов tf-idf по документам -- tf без idf и одна таблица idf на вид
+OUT_TERMS_TF_DIR = Path('./tfidf_outputs/terms_tf')
+OUT_LEMMAS_TF_DIR = Path('./tfidf_outputs/lemmas_tf')
+OUT_TERMS_IDF = Path('./tfidf_outputs/terms_idf.txt')
+OUT_LEMMAS_IDF = Path('./tfidf_outputs/lemmas_idf.txt')
+
+# TF, DF и IDF считаются разреженными матрицами:
+#   X -- документы x токены (CSR), счетчики токенов
+#   M -- токены x леммы, M[t, l] = 1, если токен t встречался с леммой l
+#   TF лемм = X @ M, DF -- число ненулевых в столбце, IDF -- по DF
+# Порядок столбцов в строках совпадает с порядком прежних словарей (первое появление токена
+# в документе, первое появление леммы в корпусе), поэтому при равных tf-idf строки файлов
+# идут в том же порядке, что и раньше.
+#
+# Счетчики берутся из <doc_id>_counts.txt, который task2 пишет вместе с леммами: там число
+# вхождений каждой пары (токен, лемма) по токенизации spaCy. TF токена -- сумма по его парам,
+# TF леммы -- сумма по парам с этой леммой. Очищенный текст при этом не читается. Для документов,
+# обработанных старым task2 (без _counts.txt), счетчики по-прежнему считаются по словам
+# очищенного текста (raw.split()), а TF лемм -- через матрицу токены x леммы.
+#
+# Пересчет инкрементальный: для каждого документа в STATS_FILE хранятся sha256 его файлов,
+# строки файла лемм и счетчики. Заново разбираются только новые и
+# измененные документы, глобальные DF/IDF пересчитываются по сохраненным счетчикам,
+# а файл в tfidf_outputs перезаписывается, только если его содержимое изменилось.
+#
+# В файлах tf-idf по документам записан idf, а он зависит от числа документов N, поэтому
+# добавление или удаление одного документа перезаписывает почти все файлы. С --separate-idf
+# по документам пишется только tf ("термин tf", по алфавиту), а idf -- одной таблицей
+# {terms,lemmas}_idf.txt с полной точностью. Файл tf зависит только от своего документа,
+# поэтому при изменении одного документа пишутся его файлы, таблицы idf и упакованные матрицы.
+# idf применяется при чтении (vector_search.load_doc_vectors) с тем же округлением, что и в
+# файлах tf-idf; упакованные матрицы в обоих режимах одинаковые. Одновременно на диске лежит
+# только один вид файлов по документам, файлы другого удаляются.
+
 
-DOC_START = 1
-DOC_END = 200
-doc_ids = [str(i) for i in range(DOC_START, DOC_END + 1)]
-N = len(doc_ids)
+def discover_doc_ids(cleaned_dir=CLEANED_DIR, lemma_dir=LEMMA_DIR):
+    # документы, для которых есть и очищенный текст, и леммы, по возрастанию номера
+    doc_ids = [path.stem for path in cleaned_dir.glob('*.txt')
+               if path.stem.isdigit() and (lemma_dir / f"{path.stem}_lemmas.txt").exists()]
+    return sorted(doc_ids, key=int)
 
-# Загрузка глобального маппинга "лемма -> сет токенов"
 
-global_lemma2tokens = defaultdict(set)
-for doc_id in doc_ids:
-    fn = LEMMA_DIR / f"{doc_id}_lemmas.txt"
-    txt = fn.read_text(encoding='utf-8')
-    for line in txt.splitlines():
+def fingerprint(lemma_bytes, raw_bytes):
+    return hashlib.sha256(lemma_bytes + b"\0" + raw_bytes).hexdigest()
+
+
+def parse_lemmas(lemma_bytes):
+    # строки "лемма токен токен ..." в порядке файла
+    lemmas = []
+    for line in lemma_bytes.decode('utf-8').splitlines():
         parts = line.strip().split()
-        if not parts:
-            continue
-        lemma = parts[0]
-        tokens = parts[1:]
-        for t in tokens:
-            global_lemma2tokens[lemma].add(t)
+        if parts:
+            lemmas.append([parts[0], parts[1:]])
+    return lemmas
+
 
-# множество всех токенов
-tokens_in_mapping = set()
-for toks in global_lemma2tokens.values():
-    tokens_in_mapping.update(toks)
+def parse_doc(lemma_bytes, raw_bytes):
+    # леммы и счетчики всех слов текста в порядке появления
+    return {"lemmas": parse_lemmas(lemma_bytes), "counts": dict(Counter(raw_bytes.decode('utf-8').split()))}
 
-# Загрузка документов
 
-doc_token_counts = {}  # doc_id -> Counter
-for doc_id in doc_ids:
-    raw = (CLEANED_DIR / f"{doc_id}.txt").read_text(encoding='utf-8')
+def parse_counts(lemma_bytes, counts_bytes):
+    # строки "токен номер_леммы:вхождений ..." -> счетчики токенов и TF лемм документа
+    lemmas = parse_lemmas(lemma_bytes)
+    counts = {}
+    lemma_counts = {}
+    for line in counts_bytes.decode('utf-8').splitlines():
+        token, *pairs = line.split()
+        for pair in pairs:
+            lemma_id, n = map(int, pair.split(':'))
+            lemma = lemmas[lemma_id][0]
+            counts[token] = counts.get(token, 0) + n
+            lemma_counts[lemma] = lemma_counts.get(lemma, 0) + n
+    return {"lemmas": lemmas, "counts": counts, "lemma_counts": lemma_counts}
 
-    tokens = [t for t in raw.split() if t and (t in tokens_in_mapping)]
-    doc_token_counts[doc_id] = Counter(tokens)
 
-# DF для токенов
+def read_doc(doc_id, lemma_dir=LEMMA_DIR, cleaned_dir=CLEANED_DIR, cached=None):
+    """Статистика документа; cached -- сохраненная с прошлого запуска, берется, если файлы не менялись."""
+    lemma_bytes = (lemma_dir / f"{doc_id}_lemmas.txt").read_bytes()
+    counts_path = lemma_dir / f"{doc_id}_counts.txt"
+    if counts_path.exists():
+        counts_bytes = counts_path.read_bytes()
+        current = fingerprint(lemma_bytes, b"counts\0" + counts_bytes)
+        parse = parse_counts
+    else:
+        counts_bytes = (cleaned_dir / f"{doc_id}.txt").read_bytes()  # старый task2 -- слова очищенного текста
+        current = fingerprint(lemma_bytes, counts_bytes)
+        parse = parse_doc
+    if cached is not None and cached.get("fingerprint") == current:
+        return cached, False
+    stats = parse(lemma_bytes, counts_bytes)
+    stats["fingerprint"] = current
+    return stats, True
 
-term_df = defaultdict(int)
-for doc_id, cnt in doc_token_counts.items():
-    for term in cnt.keys():
-        term_df[term] += 1
 
-# IDF для токенов
+def load_stats(path=STATS_FILE):
+    if not path.exists():
+        return {}
+    try:
+        with path.open('r', encoding='utf-8') as f:
+            return json.load(f).get("docs", {})
+    except (OSError, ValueError):
+        return {}  # битый файл -- просто полный пересчет
 
-term_idf = {term: (math.log(N / df) + 1.0) for term, df in term_df.items()}
 
-# TF для лемм -- сумма TF токенов
+def save_stats(doc_stats, path=STATS_FILE):
+    tmp_path = path.with_suffix('.tmp')
+    with tmp_path.open('w', encoding='utf-8') as f:
+        f.write(json.dumps({"docs": doc_stats}, ensure_ascii=False))  # dumps кодирует на C, dump -- нет
+    os.replace(tmp_path, path)
+
+
+def load_lemma_tokens(doc_ids, doc_stats):
+    # глобальный маппинг "лемма -> сет токенов", леммы в порядке первого появления
+    global_lemma2tokens = {}
+    for doc_id in doc_ids:
+        for lemma, tokens in doc_stats[doc_id]["lemmas"]:
+            global_lemma2tokens.setdefault(lemma, set()).update(tokens)
+    return global_lemma2tokens
+
+
+def doc_term_matrix(doc_ids, doc_token_counts, token_ids):
+    indptr = [0]
+    indices = []
+    data = []
+    for doc_id in doc_ids:
+        for token, tf in doc_token_counts[doc_id].items():
+            indices.append(token_ids[token])
+            data.append(tf)
+        indptr.append(len(indices))
+    return sparse.csr_matrix((np.array(data, dtype=np.int64), np.array(indices, dtype=np.int64), indptr),
+                             shape=(len(doc_ids), len(token_ids)))
 
-lemma_doc_tf = {doc_id: Counter() for doc_id in doc_ids}
-for doc_id in doc_ids:
-    token_counts = doc_token_counts[doc_id]
-    for lemma, toks in global_lemma2tokens.items():
-        tf_sum = 0
+
+def token_lemma_matrix(global_lemma2tokens, token_ids):
+    rows = []
+    cols = []
+    for lemma_id, toks in enumerate(global_lemma2tokens.values()):
         for tok in toks:
-            tf_sum += token_counts.get(tok, 0)
-        if tf_sum > 0:
-            lemma_doc_tf[doc_id][lemma] = tf_sum
+            rows.append(token_ids[tok])
+            cols.append(lemma_id)
+    data = np.ones(len(rows), dtype=np.int64)
+    return sparse.csr_matrix((data, (rows, cols)), shape=(len(token_ids), len(global_lemma2tokens)))
+
+
+def document_frequency(matrix):
+    # число документов со столбцом > 0 -- нули в матрицах не хранятся
+    return np.bincount(matrix.indices, minlength=matrix.shape[1])
+
+
+def idf_from_df(df, n_docs):
+    # log(N / df) + 1 через math.log для каждого различного df, чтобы значения совпадали бит в бит
+    idf = np.zeros(len(df))
+    for value in np.unique(df[df > 0]):
+        idf[df == value] = math.log(n_docs / int(value)) + 1.0
+    return idf
+
+
+def compute_tfidf(doc_ids, lemma_dir=LEMMA_DIR, cleaned_dir=CLEANED_DIR):
+    doc_stats = {doc_id: read_doc(doc_id, lemma_dir, cleaned_dir)[0] for doc_id in doc_ids}
+    return compute_from_stats(doc_ids, doc_stats)
+
+
+def compute_from_stats(doc_ids, doc_stats):
+    """
+    Возвращает два вида: (tf, idf, словарь) для токенов и для лемм,
+    tf -- CSR документы x словарь, idf -- массив по словарю.
+    """
+    n_docs = len(doc_ids)
+    (term_tf, tokens), (lemma_tf, lemmas) = tf_matrices(doc_ids, doc_stats, load_lemma_tokens(doc_ids, doc_stats))
+    term_idf = idf_from_df(document_frequency(term_tf), n_docs)
+    lemma_idf = idf_from_df(document_frequency(lemma_tf), n_docs)
+    return (term_tf, term_idf, tokens), (lemma_tf, lemma_idf, lemmas)
+
+
+def tf_matrices(doc_ids, doc_stats, global_lemma2tokens):
+    """
+    (tf, словарь) для токенов и для лемм. Словари задает global_lemma2tokens, поэтому
+    для части корпуса (шарда) с маппингом всего корпуса столбцы совпадают с полным подсчетом.
+    """
+    tokens = sorted(set().union(*global_lemma2tokens.values()))  # множество всех токенов
+    token_ids = {token: i for i, token in enumerate(tokens)}
+    # doc_id -> счетчик токенов из маппинга
+    doc_token_counts = {doc_id: {t: n for t, n in doc_stats[doc_id]["counts"].items() if t in token_ids}
+                        for doc_id in doc_ids}
+
+    term_tf = doc_term_matrix(doc_ids, doc_token_counts, token_ids)
 
-# DF для лемм
+    # TF для лемм -- сумма TF токенов, одним умножением
+    lemma_tf = (term_tf @ token_lemma_matrix(global_lemma2tokens, token_ids)).tocsr()
+    counted = np.array(["lemma_counts" in doc_stats[doc_id] for doc_id in doc_ids])
+    if counted.any():
+        # у документов с _counts.txt TF лемм уже посчитан по парам (токен, лемма)
+        lemma_ids = {lemma: i for i, lemma in enumerate(global_lemma2tokens)}
+        lemma_counts = [doc_stats[doc_id].get("lemma_counts", {}) for doc_id in doc_ids]
+        lemma_tf = (sparse.diags((~counted).astype(np.int64), dtype=np.int64) @ lemma_tf
+                    + doc_term_matrix(range(len(doc_ids)), lemma_counts, lemma_ids)).tocsr()
+        lemma_tf.eliminate_zeros()
+    lemma_tf.sort_indices()
 
-lemma_df = defaultdict(int)
-for lemma in global_lemma2tokens.keys():
+    return (term_tf, tokens), (lemma_tf, list(global_lemma2tokens))
+
+
+def row_entries(tf, idf, vocab, row):
+    # (термин, idf, tf-idf) по убыванию tf-idf, при равенстве -- в порядке столбцов строки
+    start, end = tf.indptr[row], tf.indptr[row + 1]
+    ids = tf.indices[start:end]
+    row_idf = idf[ids]
+    weights = tf.data[start:end] * row_idf
+    order = np.argsort(-weights, kind='stable')
+    return [(vocab[i], term_idf, tfidf)
+            for i, term_idf, tfidf in zip(ids[order].tolist(), row_idf[order].tolist(), weights[order].tolist())]
+
+
+def format_row(tf, idf, vocab, row):
+    # строки "термин idf tf-idf"
+    return [f"{term} {term_idf:.6f} {tfidf:.6f}\n" for term, term_idf, tfidf in row_entries(tf, idf, vocab, row)]
+
+
+def format_tf_row(tf, vocab, row):
+    # строки "термин tf" по алфавиту: содержимое не зависит от номеров столбцов во всем корпусе
+    start, end = tf.indptr[row], tf.indptr[row + 1]
+    return [f"{term} {n}\n" for term, n in
+            sorted(zip((vocab[i] for i in tf.indices[start:end].tolist()), tf.data[start:end].tolist()))]
+
+
+def format_idf(idf, vocab):
+    # строки "термин idf" по алфавиту, repr -- без потери точности; терминов без документов нет
+    return "".join(f"{term} {value!r}\n" for term, value in sorted(zip(vocab, idf.tolist())) if value > 0)
+
+
+def write_if_changed(path, content):
+    if path.exists() and path.read_bytes() == content:
+        return False
+    path.write_bytes(content)
+    return True
+
+
+def write_rows(out_dir, doc_ids, suffix, lines, kind='tfidf'):
+    """Пишет файлы, содержимое которых изменилось, и удаляет файлы пропавших документов."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    written = 0
+    for row, doc_id in enumerate(doc_ids):
+        if write_if_changed(out_dir / f"{doc_id}_{suffix}_{kind}.txt", "".join(lines[row]).encode('utf-8')):
+            written += 1
+    return written, remove_rows(out_dir, suffix, kind, keep=doc_ids)
+
+
+def remove_rows(out_dir, suffix, kind, keep=()):
+    # файлы документов не из keep; папка удаляется, если опустела
+    if not out_dir.exists():
+        return 0
+    current = set(keep)
+    removed = 0
+    for path in out_dir.glob(f"*_{suffix}_{kind}.txt"):
+        if path.name.split('_')[0] not in current:
+            path.unlink()
+            removed += 1
+    if not current and not any(out_dir.iterdir()):
+        out_dir.rmdir()
+    return removed
+
+
+def update_tfidf(cleaned_dir=CLEANED_DIR, lemma_dir=LEMMA_DIR, stats_path=STATS_FILE, full=False, separate_idf=False):
+    doc_ids = discover_doc_ids(cleaned_dir, lemma_dir)
+    previous = {} if full else load_stats(stats_path)
+
+    doc_stats = {}
+    changed = []
     for doc_id in doc_ids:
-        if lemma_doc_tf[doc_id].get(lemma, 0) > 0:
-            lemma_df[lemma] += 1
-
-# IDF для лемм
-
-lemma_idf = {lemma: (math.log(N / df) + 1.0) for lemma, df in lemma_df.items() if df > 0}
-
-# Запись токенов
-
-for doc_id in doc_ids:
-    cnt = doc_token_counts[doc_id]
-    entries = []
-    for term, tf in cnt.items():
-        idf = term_idf.get(term, 0.0)
-        tfidf = tf * idf
-        entries.append((term, idf, tfidf))
-    entries.sort(key=lambda x: x[2], reverse=True)
-    out_path = OUT_TERMS_DIR / f"{doc_id}_terms_tfidf.txt"
-    with out_path.open('w', encoding='utf-8') as f:
-        for term, idf, tfidf in entries:
-            f.write(f"{term} {idf:.6f} {tfidf:.6f}\n")
-
-# Запись лемм
-
-for doc_id in doc_ids:
-    counter = lemma_doc_tf[doc_id]
-    entries = []
-    for lemma, tf in counter.items():
-        idf = lemma_idf.get(lemma, 0.0)
-        tfidf = tf * idf
-        entries.append((lemma, idf, tfidf))
-    entries.sort(key=lambda x: x[2], reverse=True)
-    out_path = OUT_LEMMAS_DIR / f"{doc_id}_lemmas_tfidf.txt"
-    with out_path.open('w', encoding='utf-8') as f:
-        for lemma, idf, tfidf in entries:
-            f.write(f"{lemma} {idf:.6f} {tfidf:.6f}\n")
-
-print("Done")
+        doc_stats[doc_id], is_changed = read_doc(doc_id, lemma_dir, cleaned_dir, previous.get(doc_id))
+        if is_changed:
+            changed.append(doc_id)
+    print(f"Документов: {len(doc_ids)}, новых или измененных: {len(changed)}, "
+          f"удаленных: {len(set(previous) - set(doc_ids))}")
+
+    terms, lemmas = compute_from_stats(doc_ids, doc_stats)
+    views = ((OUT_TERMS_DIR, OUT_TERMS_TF_DIR, OUT_TERMS_IDF, OUT_TERMS_MATRIX, 'terms', terms),
+             (OUT_LEMMAS_DIR, OUT_LEMMAS_TF_DIR, OUT_LEMMAS_IDF, OUT_LEMMAS_MATRIX, 'lemmas', lemmas))
+    for out_dir, tf_dir, idf_path, matrix_path, suffix, view in views:
+        lines = [format_row(*view, row) for row in range(len(doc_ids))]
+        if separate_idf:
+            tf, idf, vocab = view
+            written, removed = write_rows(tf_dir, doc_ids, suffix, [format_tf_row(tf, vocab, row)
+                                                                    for row in range(len(doc_ids))], kind='tf')
+            print(f"{tf_dir}: перезаписано {written}, удалено {removed}")
+            if write_if_changed(idf_path, format_idf(idf, vocab).encode('utf-8')):
+                print(f"{idf_path}: перезаписан")
+            remove_rows(out_dir, suffix, 'tfidf')
+        else:
+            written, removed = write_rows(out_dir, doc_ids, suffix, lines)
+            print(f"{out_dir}: перезаписано {written}, удалено {removed}")
+            remove_rows(tf_dir, suffix, 'tf')
+            idf_path.unlink(missing_ok=True)
+
+        # в матрицу идут значения в том виде, в каком они записаны в файлы
+        rows = [[(term, float(term_idf), float(tfidf)) for term, term_idf, tfidf in map(str.split, doc_lines)]
+                for doc_lines in lines]
+        if write_matrix(matrix_path, doc_ids, rows):
+            print(f"{matrix_path}: перезаписан")
+
+    # версия пишется после матриц, когда они уже на месте
+    print(f"{VERSION_FILE}: {write_version(VERSION_FILE, (OUT_TERMS_MATRIX, OUT_LEMMAS_MATRIX))}")
+
+    if changed or set(previous) != set(doc_ids):
+        stats_path.parent.mkdir(parents=True, exist_ok=True)
+        save_stats(doc_stats, stats_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Подсчет tf-idf для терминов и лемм")
+    parser.add_argument("--full", action="store_true", help=f"не использовать {STATS_FILE}, разобрать все документы заново")
+    parser.add_argument("--separate-idf", action="store_true",
+                        help="писать по документам tf без idf и отдельную таблицу idf: добавление документа "
+                             "не перезаписывает файлы остальных")
+    args = parser.parse_args()
+
+    update_tfidf(full=args.full, separate_idf=args.separate_idf)
+    print("Done")
@@ -0,0 +1,71 @@
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from bench_vector_search import random_queries, synthetic_corpus
+from lsa import DIMENSIONS, LsaIndex, build_index
+from vector_search import load_matrix, search_taat
+from common.tfidf_matrix import write_matrix  # корень репозитория в sys.path добавил vector_search
+
+# Полнота и задержка IVF по проекциям LSA: recall@10 -- доля точного топа (косинус в том же
+# пространстве LSA перебором по всем документам), которую нашел IVF при разном n_probe.
+# Для сравнения -- перебор в LSA и term-at-a-time по разреженному tf-idf, и сколько
+# документов топа LSA совпадает с лексическим топом.
+
+
+def timed(run, queries):
+    start = time.perf_counter()
+    results = [run(query) for query in queries]
+    return results, (time.perf_counter() - start) / len(queries) * 1000
+
+
+def overlap(results, references):
+    total = found = 0
+    for result, reference in zip(results, references):
+        expected = {doc_id for _, doc_id in reference}
+        total += len(expected)
+        found += len(expected & {doc_id for _, doc_id in result})
+    return found / total if total else 1.0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[1, 2, 3, 5])
+    parser.add_argument("--dims", type=int, default=DIMENSIONS)
+    parser.add_argument("--lists", type=int, default=None)
+    parser.add_argument("--n-probe", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--synthetic", type=int, default=0, help="число документов случайного корпуса")
+    parser.add_argument("--vocab", type=int, default=20000)
+    parser.add_argument("--doc-length", type=int, default=300)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.synthetic:
+            doc_vectors, _, lemma_idf, rows = synthetic_corpus(args.synthetic, args.vocab, args.doc_length, args.seed)
+            matrix_path = Path(tmp) / "synthetic_tfidf.bin"
+            write_matrix(matrix_path, [str(doc_id) for doc_id in doc_vectors], rows)
+            matrix, lemma_idf_table = load_matrix(matrix_path)
+        else:
+            matrix, lemma_idf_table = load_matrix()
+            lemma_idf = {matrix.term(i): float(matrix.idf[i]) for i in range(matrix.n_terms)}
+
+        start = time.perf_counter()
+        index = LsaIndex(build_index(matrix, args.dims, args.lists, args.seed), matrix)
+        print(f"Документов: {matrix.n_docs}, измерений: {index.doc_vectors.shape[1]}, "
+              f"списков: {len(index.centroids)}, построение {time.perf_counter() - start:.2f} s")
+
+        queries = random_queries(lemma_idf, args.queries, args.lengths, args.seed)
+        lexical, elapsed = timed(lambda query: search_taat(query, matrix), queries)
+        print(f"tf-idf taat          {elapsed:8.3f} ms/query")
+        exact, elapsed = timed(lambda query: index.search(query, n_probe=None), queries)
+        print(f"lsa exact            {elapsed:8.3f} ms/query  совпадение с tf-idf топом {overlap(exact, lexical):.3f}")
+
+        for n_probe in args.n_probe:
+            if n_probe > len(index.centroids):
+                continue
+            results, elapsed = timed(lambda query: index.search(query, n_probe=n_probe), queries)
+            print(f"lsa ivf n_probe={n_probe:<4} {elapsed:8.3f} ms/query  recall@10 {overlap(results, exact):.3f}")
+        matrix.close()
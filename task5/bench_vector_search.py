@@ -0,0 +1,98 @@
+import argparse
+import math
+import random
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+from vector_search import load_doc_vectors, load_matrix, search, search_taat
+from common.tfidf_matrix import write_matrix  # корень репозитория в sys.path добавил vector_search
+
+# Сравнение полного перебора (search по словарям) с term-at-a-time по упакованной матрице,
+# с MaxScore и без. Запросы -- случайные наборы лемм из словаря; проверяется, что топ
+# и расстояния совпадают с перебором, и считается, сколько постингов просмотрено.
+# --synthetic N -- вместо корпуса из task4 случайный корпус из N документов с частотами
+# слов по закону Ципфа, чтобы видеть, как поиск растет с размером корпуса.
+
+
+def synthetic_corpus(n_docs, vocab_size, doc_length, seed):
+    # (doc_vectors, doc_norms, lemma_idf) как у load_doc_vectors и строки для write_matrix
+    rng = np.random.default_rng(seed)
+    ranks = np.arange(1, vocab_size + 1)
+    probabilities = 1.0 / ranks / np.sum(1.0 / ranks)
+    counts = [Counter(rng.choice(vocab_size, size=doc_length, p=probabilities).tolist()) for _ in range(n_docs)]
+    df = Counter(term for doc in counts for term in doc)
+    idf = {term: math.log(n_docs / df[term]) + 1.0 for term in df}
+
+    rows = []
+    doc_vectors = {}
+    doc_norms = {}
+    for doc_id, doc in enumerate(counts, start=1):
+        row = sorted(((f"w{term}", round(idf[term], 6), round(tf * idf[term], 6)) for term, tf in doc.items()),
+                     key=lambda entry: entry[2], reverse=True)
+        rows.append(row)
+        doc_vectors[doc_id] = {term: weight for term, _, weight in row}
+        norm_square = 0.0
+        for _, _, weight in row:
+            norm_square += weight * weight
+        doc_norms[doc_id] = math.sqrt(norm_square)
+    lemma_idf = {f"w{term}": round(value, 6) for term, value in idf.items()}
+    return doc_vectors, doc_norms, lemma_idf, rows
+
+
+def random_queries(lemma_idf, count, lengths, seed):
+    rng = random.Random(seed)
+    lemmas = sorted(lemma_idf)
+    # половина лемм запроса -- частые (много постингов), как в реальных запросах
+    frequent = sorted(lemmas, key=lambda lemma: lemma_idf[lemma])[:500]
+    queries = []
+    for _ in range(count):
+        length = rng.choice(lengths)
+        words = [rng.choice(frequent if rng.random() < 0.5 else lemmas) for _ in range(length)]
+        queries.append({lemma: tf * lemma_idf[lemma] for lemma, tf in Counter(words).items()})
+    return queries
+
+
+def timed(run, queries):
+    start = time.perf_counter()
+    results = [run(query) for query in queries]
+    return results, (time.perf_counter() - start) / len(queries) * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[1, 2, 3, 5, 8])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--synthetic", type=int, default=0, help="число документов случайного корпуса")
+    parser.add_argument("--vocab", type=int, default=50000, help="словарь случайного корпуса")
+    parser.add_argument("--doc-length", type=int, default=300, help="слов в документе случайного корпуса")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.synthetic:
+            doc_vectors, doc_norms, lemma_idf, rows = synthetic_corpus(args.synthetic, args.vocab, args.doc_length,
+                                                                       args.seed)
+            matrix_path = Path(tmp) / "synthetic_tfidf.bin"
+            write_matrix(matrix_path, [str(doc_id) for doc_id in doc_vectors], rows)
+            matrix, _ = load_matrix(matrix_path)
+        else:
+            doc_vectors, doc_norms, lemma_idf = load_doc_vectors()
+            matrix, _ = load_matrix()
+        queries = random_queries(lemma_idf, args.queries, args.lengths, args.seed)
+        print(f"Документов: {matrix.n_docs}, лемм: {matrix.n_terms}, запросов: {len(queries)}")
+
+        expected, elapsed = timed(lambda query: search(query, doc_vectors, doc_norms), queries)
+        print(f"brute force        {elapsed:8.3f} ms/query")
+
+        for name, max_score in (("taat", False), ("taat + max_score", True)):
+            stats = {}
+            results, elapsed = timed(lambda query: search_taat(query, matrix, max_score=max_score, stats=stats),
+                                     queries)
+            same = sum(result == reference for result, reference in zip(results, expected))
+            print(f"{name:<18} {elapsed:8.3f} ms/query  {stats.get('postings', 0) / len(queries):9.1f} postings/query  "
+                  f"{stats.get('lookups', 0) / len(queries):8.1f} lookups/query  совпало {same}/{len(queries)}")
+        matrix.close()
@@ -0,0 +1,195 @@
+import argparse
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+sys.path.append(str(Path(__file__).resolve().parent.parent / "task2"))
+from common.spacy_model import load_nlp  # noqa: E402
+from text_processing import normalize_text  # noqa: E402
+
+# BM25F по полям очищенного документа (task1/cleaning.py пишет их блоками):
+# название, описание, авторы, info-slice (жанр, лейбл, год) и текст рецензии.
+#
+# При сборке (python bm25.py) для каждой леммы сохраняется постинг: строки документов и tf
+# леммы в каждом поле, а для каждого документа -- длины полей. Токены полей получаются тем же
+# токенизатором spaCy, что в task2, и переводятся в леммы по файлу лемм документа; длина
+# поля -- число таких токенов. Каждое вхождение токена дает tf ровно одной лемме: если токен
+# встречался с несколькими леммами, берется самая частая по <doc_id>_counts.txt (без него --
+# первая по файлу лемм), поэтому сумма tf по полю равна его длине.
+#
+# При поиске считается только по постингам лемм запроса:
+#   tf~(d, t) = sum_f boost_f * tf_f(d, t) / (1 - b_f + b_f * len_f(d) / avglen_f)
+#   score(d)  = sum_t qtf_t * idf(t) * tf~ / (k1 + tf~),  idf = log(1 + (N - df + 0.5) / (df + 0.5))
+# Нормы полей документов считаются один раз при загрузке, поэтому boost и b можно менять без пересборки.
+
+BASE_DIR = Path(__file__).resolve().parent
+CLEANED_DIR = BASE_DIR / '../task1/cleaned'
+LEMMA_DIR = BASE_DIR / '../task2/processed_txts'
+BM25_FILE = BASE_DIR / 'bm25_index.npz'
+FIELDS = ("name", "description", "authors", "info", "body")
+BOOSTS = {"name": 5.0, "description": 2.0, "authors": 1.5, "info": 2.0, "body": 1.0}
+B = {"name": 0.3, "description": 0.6, "authors": 0.3, "info": 0.3, "body": 0.75}
+K1 = 1.2
+RESULTS_COUNT = 10
+
+
+def split_fields(text):
+    """Поля файла из task1/cleaned в порядке FIELDS, как их записал write_single_cleaned_file."""
+    name, _, rest = text.partition("\n\n")
+    description, _, rest = rest.partition("\n\n")
+    lines = rest.split("\n")
+    blocks = []
+    start = 0
+    for _ in range(2):  # авторы и info-slice -- по строке на значение, блок кончается пустой строкой
+        end = lines.index("", start) if "" in lines[start:] else len(lines)
+        blocks.append("\n".join(lines[start:end]))
+        start = min(end + 1, len(lines))
+    return name, description, blocks[0], blocks[1], "\n".join(lines[start:])
+
+
+def token_lemmas(lemma_path, counts_path=None):
+    # токен -> лемма по файлу лемм документа ("лемма токен токен ..."); у неоднозначного токена --
+    # самая частая лемма по файлу счетчиков ("токен номер_леммы:вхождений ..."), иначе первая
+    lemma_lines = []
+    with open(lemma_path, "r", encoding="utf-8") as f:
+        for line in f:
+            parts = line.split()
+            if parts:
+                lemma_lines.append(parts)
+
+    mapping = {}
+    for parts in lemma_lines:
+        for token in parts[1:]:
+            mapping.setdefault(token, parts[0])
+
+    if counts_path is not None and Path(counts_path).exists():
+        with open(counts_path, "r", encoding="utf-8") as f:
+            for line in f:
+                token, *pairs = line.split()
+                if len(pairs) > 1:
+                    best = max(pairs, key=lambda pair: int(pair.split(":")[1]))  # при равенстве -- первая
+                    mapping[token] = lemma_lines[int(best.split(":")[0])][0]
+    return mapping
+
+
+def field_counts(fields, mapping, tokenizer):
+    # по полю: Counter лемм и длина (число токенов, у которых есть лемма)
+    counts = []
+    for doc in tokenizer.pipe(normalize_text(field) for field in fields):
+        lemma_counts = Counter()
+        length = 0
+        for token in doc:
+            lemma = mapping.get(token.text)
+            if lemma:
+                length += 1
+                lemma_counts[lemma] += 1
+        counts.append((lemma_counts, length))
+    return counts
+
+
+def build_index(cleaned_dir=CLEANED_DIR, lemma_dir=LEMMA_DIR, tokenizer=None):
+    tokenizer = tokenizer or load_nlp().tokenizer
+    doc_ids = sorted(int(path.stem) for path in Path(cleaned_dir).glob("*.txt")
+                     if path.stem.isdigit() and (Path(lemma_dir) / f"{path.stem}_lemmas.txt").exists())
+
+    postings = {}  # лемма -> [(строка документа, tf по полям)]
+    lengths = np.zeros((len(doc_ids), len(FIELDS)), dtype=np.int32)
+    for row, doc_id in enumerate(doc_ids):
+        text = (Path(cleaned_dir) / f"{doc_id}.txt").read_text(encoding="utf-8")
+        mapping = token_lemmas(Path(lemma_dir) / f"{doc_id}_lemmas.txt", Path(lemma_dir) / f"{doc_id}_counts.txt")
+        doc_tf = {}
+        for f, (lemma_counts, length) in enumerate(field_counts(split_fields(text), mapping, tokenizer)):
+            lengths[row, f] = length
+            for lemma, tf in lemma_counts.items():
+                doc_tf.setdefault(lemma, [0] * len(FIELDS))[f] = tf
+        for lemma, tf in doc_tf.items():
+            postings.setdefault(lemma, []).append((row, tf))
+
+    vocab = sorted(postings)
+    col_ptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+    col_ptr[1:] = np.cumsum([len(postings[lemma]) for lemma in vocab])
+    col_rows = np.array([row for lemma in vocab for row, _ in postings[lemma]], dtype=np.int32)
+    field_tf = np.array([tf for lemma in vocab for _, tf in postings[lemma]], dtype=np.float32)
+    return {
+        "fields": np.array(FIELDS),
+        "doc_ids": np.array(doc_ids, dtype=np.int64),
+        "lengths": lengths,
+        "vocab": np.array(vocab),
+        "col_ptr": col_ptr,
+        "col_rows": col_rows,
+        "field_tf": field_tf.reshape(len(col_rows), len(FIELDS)),
+    }
+
+
+class Bm25Index:
+
+    def __init__(self, arrays, boosts=None, b=None, k1=K1):
+        self.fields = [str(name) for name in arrays["fields"]]
+        self.doc_ids = arrays["doc_ids"]
+        self.col_ptr = arrays["col_ptr"]
+        self.col_rows = arrays["col_rows"]
+        self.field_tf = arrays["field_tf"]
+        self.term_ids = {str(lemma): i for i, lemma in enumerate(arrays["vocab"])}
+        self.k1 = k1
+        boosts = {**BOOSTS, **(boosts or {})}
+        b = {**B, **(b or {})}
+        self.boosts = np.array([boosts[name] for name in self.fields])
+
+        lengths = arrays["lengths"].astype(np.float64)
+        avg = lengths.mean(axis=0) if len(lengths) else np.ones(len(self.fields))
+        slopes = np.array([b[name] for name in self.fields])
+        # 1 - b + b * len / avglen для каждого документа и поля
+        self.norms = 1.0 - slopes + slopes * lengths / np.where(avg > 0, avg, 1.0)
+
+        n_docs = len(self.doc_ids)
+        df = np.diff(self.col_ptr)
+        self.idf = np.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+
+    @classmethod
+    def load(cls, path=BM25_FILE, **params):
+        with np.load(path) as arrays:
+            return cls({name: arrays[name] for name in arrays.files}, **params)
+
+    def __contains__(self, lemma):
+        return lemma in self.term_ids
+
+    def term_weights(self, term_id):
+        """(строки документов, вклад термина в score) по постингу."""
+        start, end = self.col_ptr[term_id], self.col_ptr[term_id + 1]
+        rows = self.col_rows[start:end]
+        tf = (self.field_tf[start:end] / self.norms[rows]) @ self.boosts
+        return rows, self.idf[term_id] * tf / (self.k1 + tf)
+
+    def search(self, query_counts, k=RESULTS_COUNT):
+        """Топ-k (score, doc_id) по убыванию score, при равенстве -- меньший doc_id; query_counts -- лемма -> tf."""
+        parts = [(self.term_weights(self.term_ids[lemma]), qtf) for lemma, qtf in query_counts.items()
+                 if lemma in self.term_ids]
+        if not parts:
+            return []
+        rows = np.concatenate([term_rows for (term_rows, _), _ in parts])
+        weights = np.concatenate([qtf * term_weights for (_, term_weights), qtf in parts])
+        rows, inverse = np.unique(rows, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights)
+        if len(rows) > k:
+            kth = np.partition(-scores, k - 1)[k - 1]
+            keep = -scores <= kth  # вместе с равными k-му, чтобы решал doc_id
+            rows, scores = rows[keep], scores[keep]
+        order = np.lexsort((self.doc_ids[rows], -scores))[:k]
+        return [(float(scores[i]), int(self.doc_ids[rows[i]])) for i in order]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сборка BM25F-индекса по полям очищенных документов")
+    parser.parse_args()
+
+    start = time.perf_counter()
+    arrays = build_index()
+    np.savez(BM25_FILE, **arrays)
+    print(f"{BM25_FILE.name}: {len(arrays['doc_ids'])} документов, {len(arrays['vocab'])} лемм, "
+          f"{len(arrays['col_rows'])} постингов, {time.perf_counter() - start:.2f} s")
+    print("Средние длины полей: " + ", ".join(
+        f"{name} {value:.1f}" for name, value in zip(FIELDS, arrays["lengths"].mean(axis=0))))
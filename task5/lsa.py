@@ -0,0 +1,157 @@
+import argparse
+import hashlib
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.tfidf_matrix import TfidfMatrix  # noqa: E402
+
+# LSA: матрица tf-idf лемм из task4 проецируется усеченным SVD в несколько сотен измерений,
+# документы -- нормированные строки X V, запрос -- q V, близость -- косинус.
+#
+# Поиск по проекциям -- IVF: документы разбиты сферическим k-means на n_lists кластеров,
+# запрос сравнивается с центроидами и просматривает только n_probe ближайших списков.
+# Все на NumPy, без GPU и сети; SVD -- рандомизированный (Halko и др.) с фиксированным seed.
+
+BASE_DIR = Path(__file__).resolve().parent
+TFIDF_MATRIX = BASE_DIR / '../task4/tfidf_outputs/lemmas_tfidf.bin'
+LSA_FILE = BASE_DIR / 'lsa_index.npz'
+DIMENSIONS = 256
+N_PROBE = 8
+SEED = 0
+
+
+def randomized_svd(X, dims, oversamples=10, power_iterations=4, seed=SEED):
+    """Первые dims сингулярных троек разреженной X: (U, S, Vt)."""
+    rng = np.random.default_rng(seed)
+    rank = min(dims + oversamples, min(X.shape))
+    Q, _ = np.linalg.qr(X @ rng.standard_normal((X.shape[1], rank)))
+    for _ in range(power_iterations):  # степенные итерации уточняют подпространство
+        Z, _ = np.linalg.qr(X.T @ Q)
+        Q, _ = np.linalg.qr(X @ Z)
+    U, S, Vt = np.linalg.svd((X.T @ Q).T, full_matrices=False)
+    dims = min(dims, len(S))
+    return (Q @ U)[:, :dims], S[:dims], Vt[:dims]
+
+
+def normalize_rows(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+def spherical_kmeans(vectors, n_lists, iterations=20, seed=SEED):
+    """Центроиды (нормированные) и номер кластера для каждой строки; инициализация k-means++."""
+    rng = np.random.default_rng(seed)
+    n_lists = min(n_lists, len(vectors))
+    centroids = [vectors[rng.integers(len(vectors))]]
+    distances = 2.0 - 2.0 * vectors @ centroids[0]
+    for _ in range(1, n_lists):
+        weights = np.maximum(distances, 0.0)
+        total = weights.sum()
+        choice = rng.choice(len(vectors), p=weights / total) if total > 0 else rng.integers(len(vectors))
+        centroids.append(vectors[choice])
+        distances = np.minimum(distances, 2.0 - 2.0 * vectors @ vectors[choice])
+    centroids = np.array(centroids)
+
+    assignment = np.argmax(vectors @ centroids.T, axis=1)
+    for _ in range(iterations):
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        nonempty = np.linalg.norm(sums, axis=1) > 0
+        centroids[nonempty] = normalize_rows(sums[nonempty])  # пустой кластер сохраняет старый центроид
+        updated = np.argmax(vectors @ centroids.T, axis=1)
+        if np.array_equal(updated, assignment):
+            break
+        assignment = updated
+    return centroids, assignment
+
+
+def vocab_hash(matrix):
+    # проекция годится только для того словаря, по которому строилась
+    return hashlib.sha256(bytes(matrix.vocab)).hexdigest()
+
+
+def build_index(matrix, dims=DIMENSIONS, n_lists=None, seed=SEED):
+    X = matrix.csr()
+    U, S, Vt = randomized_svd(X, dims, seed=seed)
+    doc_vectors = normalize_rows(U * S)  # = X V
+    n_lists = n_lists or max(1, int(round(np.sqrt(matrix.n_docs))))
+    centroids, assignment = spherical_kmeans(doc_vectors, n_lists, seed=seed)
+
+    list_rows = np.argsort(assignment, kind='stable')
+    list_ptr = np.zeros(len(centroids) + 1, dtype=np.int64)
+    list_ptr[1:] = np.cumsum(np.bincount(assignment, minlength=len(centroids)))
+    return {
+        "components": Vt.T.astype(np.float32),  # леммы x измерения
+        "singular_values": S,
+        "doc_vectors": doc_vectors.astype(np.float32),
+        "doc_ids": np.array(matrix.doc_ids),
+        "centroids": centroids.astype(np.float32),
+        "list_ptr": list_ptr,
+        "list_rows": list_rows,
+        "vocab_hash": np.array(vocab_hash(matrix)),
+    }
+
+
+class LsaIndex:
+
+    def __init__(self, arrays, matrix):
+        if str(arrays["vocab_hash"]) != vocab_hash(matrix):
+            raise ValueError("LSA-индекс построен по другой матрице tf-idf, пересоберите его: python lsa.py")
+        self.matrix = matrix
+        self.components = arrays["components"]
+        self.doc_vectors = arrays["doc_vectors"]
+        self.doc_ids = arrays["doc_ids"]
+        self.centroids = arrays["centroids"]
+        self.list_ptr = arrays["list_ptr"]
+        self.list_rows = arrays["list_rows"]
+
+    @classmethod
+    def load(cls, matrix, path=LSA_FILE):
+        with np.load(path) as arrays:
+            return cls({name: arrays[name] for name in arrays.files}, matrix)
+
+    def project(self, query_vector):
+        """Вектор запроса (лемма -> вес) в пространстве LSA, нормированный; None, если он нулевой."""
+        projected = np.zeros(self.components.shape[1], dtype=np.float32)
+        for lemma, weight in query_vector.items():
+            term_id = self.matrix.term_id(lemma)
+            if term_id is not None:
+                projected += weight * self.components[term_id]
+        norm = np.linalg.norm(projected)
+        return projected / norm if norm > 0 else None
+
+    def search(self, query_vector, k=10, n_probe=N_PROBE):
+        """Топ-k (расстояние, doc_id) по n_probe ближайшим спискам; n_probe=None -- точный перебор."""
+        query = self.project(query_vector)
+        if query is None:
+            return []
+        if n_probe is None or n_probe >= len(self.centroids):
+            rows = np.arange(len(self.doc_vectors))
+        else:
+            probes = np.argpartition(-(self.centroids @ query), n_probe - 1)[:n_probe]
+            rows = np.concatenate([self.list_rows[self.list_ptr[c]:self.list_ptr[c + 1]] for c in probes])
+        scores = self.doc_vectors[rows] @ query
+        if len(rows) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            rows, scores = rows[top], scores[top]
+        order = np.lexsort((self.doc_ids[rows], -scores))
+        return [(1.0 - float(scores[i]), int(self.doc_ids[rows[i]])) for i in order]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Построение LSA-проекции и IVF-индекса по tf-idf лемм")
+    parser.add_argument("--dims", type=int, default=DIMENSIONS, help="число измерений LSA")
+    parser.add_argument("--lists", type=int, default=None, help="число списков IVF (по умолчанию ~sqrt(N))")
+    parser.add_argument("--seed", type=int, default=SEED)
+    args = parser.parse_args()
+
+    matrix = TfidfMatrix(TFIDF_MATRIX)
+    start = time.perf_counter()
+    arrays = build_index(matrix, args.dims, args.lists, args.seed)
+    np.savez(LSA_FILE, **arrays)
+    print(f"{LSA_FILE.name}: {matrix.n_docs} документов, {arrays['doc_vectors'].shape[1]} измерений, "
+          f"{len(arrays['centroids'])} списков, {time.perf_counter() - start:.2f} s")
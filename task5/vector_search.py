@@ -1,21 +1,41 @@
 from pathlib import Path
 from collections import Counter
+import argparse
+import heapq
 import math
 import re
-
-import spacy
-from spacy.cli import download
+import sys
+import time
+
+import numpy as np
+from scipy import sparse
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.spacy_model import load_nlp  # noqa: E402
+from common.lemma_cache import get_lemma_cache  # noqa: E402
+from common.tfidf_matrix import TfidfMatrix, IdfTable  # noqa: E402
+from common.index_version import content_hash, read_version  # noqa: E402
+from common.result_cache import ResultCache  # noqa: E402
+from common import instrumentation  # noqa: E402
+from lsa import LSA_FILE, N_PROBE, LsaIndex  # noqa: E402
+from bm25 import BM25_FILE, Bm25Index  # noqa: E402
 
 BASE_DIR = Path(__file__).resolve().parent
 TFIDF_DIR = BASE_DIR / '../task4/tfidf_outputs/lemmas'
+TF_DIR = BASE_DIR / '../task4/tfidf_outputs/lemmas_tf'  # tf_idf_count.py --separate-idf: tf без idf
+IDF_FILE = BASE_DIR / '../task4/tfidf_outputs/lemmas_idf.txt'  # и idf одной таблицей
+TFIDF_MATRIX = BASE_DIR / '../task4/tfidf_outputs/lemmas_tfidf.bin'  # если есть -- вместо TFIDF_DIR
+TFIDF_VERSION_FILE = BASE_DIR / '../task4/tfidf_outputs/version.txt'  # хэш матриц, пишет tf_idf_count.py
 URL_FILE = BASE_DIR / '../task1/urls.txt'
 RESULTS_COUNT = 10
+BATCH_SIZE = 256  # запросов в одной пачке nlp.pipe и в одном умножении матриц
 
 
-# download("en_core_web_sm")  # скачиваем модель, если она не установлена
-
-
+@instrumentation.timed("load.doc_vectors")
 def load_doc_vectors():
+    if IDF_FILE.exists():
+        return load_tf_vectors()
+
     doc_vectors = {}
     doc_norms = {}
     lemma_idf = {}
@@ -48,7 +68,48 @@ def load_doc_vectors():
     return doc_vectors, doc_norms, lemma_idf
 
 
+def load_tf_vectors():
+    # то же по tf документов и общей таблице idf: веса округляются так же, как в файлах tf-idf,
+    # поэтому векторы и ранжирование совпадают
+    exact_idf = {}
+    with IDF_FILE.open('r', encoding='utf-8') as f:
+        for line in f:
+            lemma, idf = line.split()
+            exact_idf[lemma] = float(idf)
+
+    doc_vectors = {}
+    doc_norms = {}
+    for path in sorted(TF_DIR.glob('*_lemmas_tf.txt'), key=lambda current_path: int(current_path.stem.split('_')[0])):
+        doc_id = int(path.stem.split('_')[0])
+        vector = {}
+        with path.open('r', encoding='utf-8') as f:
+            for line in f:
+                lemma, tf = line.split()
+                vector[lemma] = float(f"{int(tf) * exact_idf[lemma]:.6f}")
+        # квадраты складываются по убыванию веса, как строки файла tf-idf, -- норма та же до бита
+        norm_square = 0.0
+        for tfidf in sorted(vector.values(), reverse=True):
+            norm_square += tfidf * tfidf
+        doc_vectors[doc_id] = vector
+        doc_norms[doc_id] = math.sqrt(norm_square)
+
+    lemma_idf = {lemma: float(f"{idf:.6f}") for lemma, idf in exact_idf.items()}
+    return doc_vectors, doc_norms, lemma_idf
+
+
+@instrumentation.timed("load.matrix")
+def load_matrix(path=TFIDF_MATRIX):
+    # упакованная матрица открывается через mmap: ничего не разбирается, idf ищется в словаре файла
+    matrix = TfidfMatrix(path)
+    return matrix, IdfTable(matrix)
+
+
+def load_tfidf_version():
+    return read_version(TFIDF_VERSION_FILE, (TFIDF_MATRIX,))
+
+
 # загружаем doc_id -> url
+@instrumentation.timed("load.urls")
 def load_doc_urls():
     doc_urls = {}
 
@@ -59,24 +120,62 @@ def load_doc_urls():
     return doc_urls
 
 
-def build_query_vector(query, nlp, lemma_idf):
-    # обрабатываем запрос
+def cached_lemmatizer(nlp, lemma_cache):
+    # лемматизатор spaCy, если леммы берутся из кэша, иначе None
+    if lemma_cache is None or "lemmatizer" not in nlp.pipe_names:
+        return None
+    return nlp.get_pipe("lemmatizer")
+
+
+def analyze_doc(doc, nlp, lemma_cache=None):
+    # (текст, is_stop, is_space, tag_, lemma_) для каждого токена запроса.
+    # С кэшем запрос, как и документы в task2, разбирается целиком без лемматизатора: теги и части
+    # речи ставятся по контексту запроса, а лемма берется из кэша по (токен, часть речи, морфология) --
+    # результат тот же, что у nlp(query), пропускается только сам лемматизатор
+    lemmatizer = cached_lemmatizer(nlp, lemma_cache)
+    if lemmatizer is None:
+        return [(t.text, t.is_stop, t.is_space, t.tag_, t.lemma_) for t in doc]
+    return [(t.text, t.is_stop, t.is_space, t.tag_, lemma_cache.token_lemma(t, lemmatizer)) for t in doc]
+
+
+def analyze_query(query, nlp, lemma_cache=None):
+    disable = ["lemmatizer"] if cached_lemmatizer(nlp, lemma_cache) is not None else []
+    return analyze_doc(nlp(query, disable=disable), nlp, lemma_cache)
+
+
+def analyze_queries(queries, nlp, lemma_cache=None, batch_size=BATCH_SIZE):
+    # то же для многих запросов: через nlp.pipe пачками
+    disable = ["lemmatizer"] if cached_lemmatizer(nlp, lemma_cache) is not None else []
+    for doc in nlp.pipe(queries, batch_size=batch_size, disable=disable):
+        yield analyze_doc(doc, nlp, lemma_cache)
+
+
+def normalize_query(query):
     query = query.replace("’", "'").replace("‘", "'")  # нормализуем апострофы
     query = query.lower()
     query = re.sub(r"[^a-zA-Z'\s]", " ", query)
     query = re.sub(r"\s+", " ", query).strip()
+    return query
+
 
-    doc = nlp(query)
+def query_lemma_counts(analyzed, vocabulary):
+    # tf лемм запроса, которые есть в словаре (lemma_idf, Bm25Index -- все, что поддерживает in)
     query_counts = Counter()
 
-    for token in doc:
-        if token.is_stop or token.is_space or token.tag_ == "POS" or token.text in ("'", ""):
+    for text, is_stop, is_space, tag, lemma in analyzed:
+        if is_stop or is_space or tag == "POS" or text in ("'", ""):
             continue
 
-        lemma = token.lemma_.strip()
-        if lemma and lemma in lemma_idf:
+        lemma = lemma.strip()
+        if lemma and lemma in vocabulary:
             query_counts[lemma] += 1
 
+    return query_counts
+
+
+def query_vector_from_tokens(analyzed, lemma_idf):
+    query_counts = query_lemma_counts(analyzed, lemma_idf)
+
     # собираем вектор запроса
     query_vector = {}
     for lemma, tf in query_counts.items():
@@ -85,6 +184,32 @@ def build_query_vector(query, nlp, lemma_idf):
     return query_vector
 
 
+def build_query_vector(query, nlp, lemma_idf, lemma_cache=None):
+    with instrumentation.span("lemmatize"):
+        analyzed = analyze_query(normalize_query(query), nlp, lemma_cache)
+    with instrumentation.span("query_vector"):
+        return query_vector_from_tokens(analyzed, lemma_idf)
+
+
+def build_query_counts(query, nlp, vocabulary, lemma_cache=None):
+    with instrumentation.span("lemmatize"):
+        analyzed = analyze_query(normalize_query(query), nlp, lemma_cache)
+    with instrumentation.span("query_vector"):
+        return query_lemma_counts(analyzed, vocabulary)
+
+
+def build_query_vectors(queries, nlp, lemma_idf, lemma_cache=None, batch_size=BATCH_SIZE):
+    normalized = [normalize_query(query) for query in queries]
+    return [query_vector_from_tokens(analyzed, lemma_idf)
+            for analyzed in analyze_queries(normalized, nlp, lemma_cache, batch_size)]
+
+
+def query_key(query_vector, *options):
+    # ключ кэша результатов -- леммы запроса с весами, без учета порядка: запросы, которые
+    # лемматизируются одинаково, делят запись (расстояния -- с точностью до последнего знака)
+    return (tuple(sorted(query_vector.items())), *options)
+
+
 # косинусное расстояние
 def cosine_similarity(query_vector, doc_vector, query_norm, doc_norm):
     if query_norm == 0 or doc_norm == 0:
@@ -100,7 +225,7 @@ def cosine_similarity(query_vector, doc_vector, query_norm, doc_norm):
     return dot_product / (query_norm * doc_norm)
 
 
-def search(query_vector, doc_vectors, doc_norms):
+def search(query_vector, doc_vectors, doc_norms, k=RESULTS_COUNT):
     query_norm = math.sqrt(sum(weight * weight for weight in query_vector.values()))
     ranked_docs = []
 
@@ -114,34 +239,322 @@ def search(query_vector, doc_vectors, doc_norms):
         ranked_docs.append((distance, doc_id))
 
     ranked_docs.sort()
-    return ranked_docs[:RESULTS_COUNT]
-
-
-print("Loading TF-IDF vectors...")
-doc_vectors, doc_norms, lemma_idf = load_doc_vectors()
-print("TF-IDF vectors loaded.")
-
-print("Loading URLs...")
-doc_urls = load_doc_urls()
-print("URLs loaded.")
-
-print("Loading spaCy model...")
-nlp = spacy.load("en_core_web_sm")
-print("Model loaded.\n")
-
-while True:
-    query = input("Query (type 'exit' to quit): ").strip()
-
-    if query == "exit" or query == "":
-        print("Session finished.")
-        break
-
-    query_vector = build_query_vector(query, nlp, lemma_idf)
-    top_docs = search(query_vector, doc_vectors, doc_norms)
-
-    print("Doc IDs:", [doc_id for _, doc_id in top_docs])
-    print("URLs:")
-    for _, doc_id in top_docs:
-        print(doc_urls[doc_id])
-
-    print()
+    return ranked_docs[:k]
+
+
+# Term-at-a-time: проходятся только постинги лемм запроса из упакованной матрицы,
+# скалярные произведения копятся по затронутым документам, k лучших выбираются ограниченной
+# кучей (heapq.nsmallest). Произведения складываются в порядке лемм запроса, как в
+# cosine_similarity, поэтому результат совпадает с search до последнего бита.
+#
+# С max_score термины сначала обходятся по убыванию верхней оценки вклада (term_max).
+# Как только k-й лучший частичный косинус больше суммы оценок оставшихся терминов, новые
+# документы перестают добавляться, а кандидаты, которые уже не догонят k-й, отбрасываются.
+# Для оставшихся кандидатов произведения затем досчитываются точно.
+
+def search_taat(query_vector, matrix, k=RESULTS_COUNT, max_score=False, stats=None, query_norm=None):
+    """
+    Топ-k (расстояние, doc_id) как у search.
+    stats -- словарь, куда добавляется число просмотренных постингов (postings) и точечных поисков в них (lookups).
+    query_norm -- норма всего запроса, если матрица -- шард: леммы, которых в шарде нет, пропускаются,
+    а косинус считается с нормой полного вектора.
+    """
+    if query_norm is None:
+        query_norm = math.sqrt(sum(weight * weight for weight in query_vector.values()))
+    if query_norm == 0:
+        return []
+
+    terms = []
+    for lemma, query_weight in query_vector.items():
+        term_id = matrix.term_id(lemma)
+        if term_id is not None:
+            terms.append((term_id, query_weight))
+    if max_score:
+        candidates = max_score_candidates(terms, matrix, query_norm, k, stats)
+        dot_products = candidate_dot_products(candidates, terms, matrix, stats)
+    else:
+        dot_products = {}
+        for term_id, query_weight in terms:
+            rows, weights = matrix.postings(term_id)
+            for row, weight in zip(rows.tolist(), weights.tolist()):
+                dot_products[row] = dot_products.get(row, 0.0) + query_weight * weight
+            if stats is not None:
+                stats["postings"] = stats.get("postings", 0) + len(rows)
+
+    return top_k(dot_products, matrix, query_norm, k)
+
+
+def top_k(dot_products, matrix, query_norm, k=RESULTS_COUNT):
+    norms = matrix.norms
+    doc_ids = matrix.doc_ids
+
+    def ranked():
+        for row, dot_product in dot_products.items():
+            doc_norm = float(norms[row])
+            if dot_product == 0 or doc_norm == 0:
+                continue
+            similarity = dot_product / (query_norm * doc_norm)
+            if similarity == 0:
+                continue
+            yield 1.0 - similarity, int(doc_ids[row])
+
+    return heapq.nsmallest(k, ranked())
+
+
+def max_score_candidates(terms, matrix, query_norm, k, stats=None):
+    # верхняя оценка вклада термина в косинус: вес запроса * max(вес / норма документа) / норма запроса
+    bounds = sorted(((query_weight * float(matrix.term_max[term_id]) / query_norm, term_id, query_weight)
+                     for term_id, query_weight in terms), reverse=True)
+    remaining = sum(bound for bound, _, _ in bounds)
+    partial = {}  # строка -> частичный косинус
+    accepting = True
+    scanned = lookups = 0
+
+    for bound, term_id, query_weight in bounds:
+        remaining -= bound
+        rows, weights = matrix.postings(term_id)
+        if accepting:
+            contributions = query_weight * weights / (query_norm * matrix.norms[rows])
+            for row, contribution in zip(rows.tolist(), contributions.tolist()):
+                partial[row] = partial.get(row, 0.0) + contribution
+            scanned += len(rows)
+        elif partial and len(rows):
+            # только уже найденные кандидаты: бинарный поиск по постингу вместо прохода по нему
+            candidates = np.fromiter(partial, dtype=np.int64, count=len(partial))
+            positions = np.minimum(np.searchsorted(rows, candidates), len(rows) - 1)
+            found = rows[positions] == candidates
+            contributions = query_weight * weights[positions[found]] / (query_norm * matrix.norms[candidates[found]])
+            for row, contribution in zip(candidates[found].tolist(), contributions.tolist()):
+                partial[row] += contribution
+            lookups += len(candidates)
+
+        if len(partial) >= k:
+            threshold = heapq.nlargest(k, partial.values())[-1]
+            slack = 1e-9 * threshold  # запас на ошибки округления в оценках
+            if accepting and threshold - slack > remaining:
+                accepting = False  # документ, которого еще нет, в топ уже не попадет
+            if not accepting:
+                partial = {row: score for row, score in partial.items() if score + remaining >= threshold - slack}
+
+    if stats is not None:
+        stats["postings"] = stats.get("postings", 0) + scanned
+        stats["lookups"] = stats.get("lookups", 0) + lookups
+    return partial
+
+
+def candidate_dot_products(candidates, terms, matrix, stats=None):
+    # точные скалярные произведения кандидатов, в порядке лемм запроса
+    rows_needed = np.array(sorted(candidates), dtype=np.int64)
+    dot_products = np.zeros(len(rows_needed))
+    for term_id, query_weight in terms:
+        rows, weights = matrix.postings(term_id)
+        if not len(rows) or not len(rows_needed):
+            continue
+        positions = np.minimum(np.searchsorted(rows, rows_needed), len(rows) - 1)
+        found = rows[positions] == rows_needed
+        dot_products[found] += query_weight * weights[positions[found]]
+    if stats is not None:
+        stats["lookups"] = stats.get("lookups", 0) + len(rows_needed) * len(terms)
+    return dict(zip(rows_needed.tolist(), dot_products.tolist()))
+
+
+# Пакетный поиск: векторы запросов собираются в разреженную матрицу (запросы x леммы) и
+# умножаются на транспонированную матрицу документов -- одно умножение на пачку запросов
+# вместо цикла по документам. k лучших в каждой строке выбираются через argpartition.
+# Скалярные произведения складываются в другом порядке, чем в search, поэтому расстояния
+# могут отличаться в последнем знаке; при равных расстояниях, как и в search, выше меньший doc_id.
+
+def query_matrix(query_vectors, matrix):
+    indptr = [0]
+    indices = []
+    data = []
+    for query_vector in query_vectors:
+        for lemma, weight in query_vector.items():
+            indices.append(matrix.term_id(lemma))
+            data.append(weight)
+        indptr.append(len(indices))
+    return sparse.csr_matrix((data, indices, indptr), shape=(len(query_vectors), matrix.n_terms))
+
+
+def top_k_row(distances, doc_ids, k=RESULTS_COUNT):
+    # distances -- расстояния до всех документов, inf -- документ не подходит
+    found = np.count_nonzero(np.isfinite(distances))
+    if found == 0:
+        return []
+    k = min(k, found)
+    kth = distances[np.argpartition(distances, k - 1)[:k]].max()
+    candidates = np.flatnonzero(distances <= kth)  # вместе с равными k-му, чтобы решал doc_id
+    order = np.lexsort((doc_ids[candidates], distances[candidates]))[:k]
+    return [(float(distances[row]), int(doc_ids[row])) for row in candidates[order]]
+
+
+def search_batch(query_vectors, matrix, k=RESULTS_COUNT, batch_size=BATCH_SIZE):
+    """Топ-k (расстояние, doc_id) для каждого вектора запроса, как у search."""
+    documents = matrix.csr().T  # леммы x документы, без копирования
+    doc_norms = matrix.norms
+    results = []
+    for start in range(0, len(query_vectors), batch_size):
+        chunk = query_vectors[start:start + batch_size]
+        dot_products = (query_matrix(chunk, matrix) @ documents).toarray()
+        query_norms = np.array([math.sqrt(sum(weight * weight for weight in query_vector.values()))
+                                for query_vector in chunk])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            similarity = dot_products / (query_norms[:, None] * doc_norms[None, :])
+        distances = np.where((dot_products != 0) & (doc_norms != 0)[None, :], 1.0 - similarity, np.inf)
+        for row in distances:
+            results.append(top_k_row(row, matrix.doc_ids, k))
+    return results
+
+
+def replay_queries(queries, nlp, matrix, lemma_idf, lemma_cache=None, check=False):
+    """Пакетный прогон журнала запросов с выводом пропускной способности; check -- сверить со скалярным путем."""
+    start = time.perf_counter()
+    query_vectors = build_query_vectors(queries, nlp, lemma_idf, lemma_cache)
+    analyzed = time.perf_counter()
+    results = search_batch(query_vectors, matrix)
+    finished = time.perf_counter()
+
+    scoring = finished - analyzed
+    print(f"Запросов: {len(queries)}, документов: {matrix.n_docs}")
+    print(f"analyze {analyzed - start:7.3f} s  {len(queries) / max(analyzed - start, 1e-9):10.1f} queries/s")
+    print(f"score   {scoring:7.3f} s  {len(queries) / max(scoring, 1e-9):10.1f} queries/s  "
+          f"{len(queries) * matrix.n_docs / max(scoring, 1e-9):14.1f} docs/s")
+
+    if check:
+        start = time.perf_counter()
+        scalar_vectors = [build_query_vector(query, nlp, lemma_idf, lemma_cache) for query in queries]
+        expected = [search_taat(query_vector, matrix) for query_vector in scalar_vectors]
+        elapsed = time.perf_counter() - start
+        print(f"scalar  {elapsed:7.3f} s  {len(queries) / max(elapsed, 1e-9):10.1f} queries/s (analyze + score)")
+
+        same = 0
+        for query_vector, scalar_vector, result, reference in zip(query_vectors, scalar_vectors, results, expected):
+            if (query_vector == scalar_vector
+                    and [doc_id for _, doc_id in result] == [doc_id for _, doc_id in reference]
+                    and all(abs(a - b) <= 1e-12 for (a, _), (b, _) in zip(result, reference))):
+                same += 1
+        print(f"Совпало со скалярным поиском: {same}/{len(queries)}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Векторный поиск по tf-idf лемм")
+    parser.add_argument("--max-score", action="store_true",
+                        help="отсекать документы, которые уже не попадут в топ (MaxScore), результат тот же")
+    parser.add_argument("--lsa", action="store_true", help=f"искать по LSA-проекции ({LSA_FILE.name}, см. lsa.py)")
+    parser.add_argument("--bm25", action="store_true",
+                        help=f"ранжировать BM25F по полям документа ({BM25_FILE.name}, см. bm25.py)")
+    parser.add_argument("--n-probe", type=int, default=N_PROBE, help="сколько списков IVF просматривать, 0 -- все")
+    parser.add_argument("--batch", type=Path, help="файл с запросами (по строке): прогнать пакетом и выйти")
+    parser.add_argument("--output", type=Path, help="куда записать результаты --batch: запрос<TAB>doc_id ...")
+    parser.add_argument("--check", action="store_true", help="сверить результаты --batch со скалярным поиском")
+    parser.add_argument("--replay", type=Path,
+                        help="файл с запросами (по строке): выполнить по одному, как в диалоге, без вывода и выйти")
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    instrumentation.configure(args)
+
+    print("Loading TF-IDF vectors...")
+    if TFIDF_MATRIX.exists():
+        matrix, lemma_idf = load_matrix()
+    else:
+        matrix = None
+        doc_vectors, doc_norms, lemma_idf = load_doc_vectors()
+    print("TF-IDF vectors loaded.")
+
+    lsa_index = None
+    if args.lsa:
+        if matrix is None or not LSA_FILE.exists():
+            sys.exit(f"Для --lsa нужны {TFIDF_MATRIX} и {LSA_FILE} (python lsa.py)")
+        lsa_index = LsaIndex.load(matrix)
+    bm25_index = None
+    if args.bm25:
+        if not BM25_FILE.exists():
+            sys.exit(f"Для --bm25 нужен {BM25_FILE} (python bm25.py)")
+        bm25_index = Bm25Index.load()
+        bm25_version = content_hash((BM25_FILE,))
+    if matrix is not None:
+        # с разметкой чтение постингов идет в свой этап; без нее матрица не оборачивается
+        matrix = instrumentation.traced(matrix, "postings")
+    tfidf_version = load_tfidf_version()
+    result_cache = ResultCache()  # повторные запросы не вычисляются заново
+
+    print("Loading URLs...")
+    doc_urls = load_doc_urls()
+    print("URLs loaded.")
+
+    print("Loading spaCy model...")
+    nlp = load_nlp()
+    lemma_cache = get_lemma_cache(nlp)  # леммы слов запросов кэшируются между запусками
+    print("Model loaded.\n")
+
+    if args.batch:
+        if matrix is None:
+            sys.exit(f"Для --batch нужна упакованная матрица {TFIDF_MATRIX}")
+        with args.batch.open('r', encoding='utf-8') as f:
+            queries = [line.strip() for line in f if line.strip()]
+        results = replay_queries(queries, nlp, matrix, lemma_idf, lemma_cache, args.check)
+        if args.output:
+            with args.output.open('w', encoding='utf-8') as f:
+                for query, top_docs in zip(queries, results):
+                    f.write(query + "\t" + " ".join(str(doc_id) for _, doc_id in top_docs) + "\n")
+        print(lemma_cache.report())
+        sys.exit()
+
+    def ranked(query_vector):
+        with instrumentation.span("scoring"):
+            if lsa_index is not None:
+                return lsa_index.search(query_vector, RESULTS_COUNT, args.n_probe or None)
+            if matrix is not None:
+                return search_taat(query_vector, matrix, max_score=args.max_score)
+            return search(query_vector, doc_vectors, doc_norms)
+
+    def bm25_ranked(query_counts):
+        with instrumentation.span("scoring"):
+            return bm25_index.search(query_counts, RESULTS_COUNT)
+
+    def run_query(query):
+        with instrumentation.query(query):
+            if bm25_index is not None:
+                query_counts = build_query_counts(query, nlp, bm25_index, lemma_cache)
+                top_docs = result_cache.lookup(query_key(query_counts, "bm25"), bm25_version,
+                                               lambda: bm25_ranked(query_counts))
+            else:
+                query_vector = build_query_vector(query, nlp, lemma_idf, lemma_cache)
+                top_docs = result_cache.lookup(query_key(query_vector), tfidf_version, lambda: ranked(query_vector))
+            with instrumentation.span("urls"):
+                urls = [doc_urls[doc_id] for _, doc_id in top_docs]
+        return top_docs, urls
+
+    def interactive():
+        while True:
+            query = input("Query (type 'exit' to quit): ").strip()
+
+            if query == "exit" or query == "":
+                break
+
+            top_docs, urls = run_query(query)
+            print("Doc IDs:", [doc_id for _, doc_id in top_docs])
+            print("URLs:")
+            for url in urls:
+                print(url)
+
+            print()
+
+    def replay():
+        # журнал по одному запросу через тот же путь, что и диалог (в отличие от --batch)
+        start = time.perf_counter()
+        for query in queries:
+            run_query(query)
+        elapsed = time.perf_counter() - start
+        print(f"Запросов: {len(queries)}, {elapsed:.3f} s, {len(queries) / max(elapsed, 1e-9):.1f} queries/s")
+
+    if args.replay:
+        with args.replay.open('r', encoding='utf-8') as f:
+            queries = [line.strip() for line in f if line.strip()]
+        instrumentation.run_session(replay, args)
+    else:
+        instrumentation.run_session(interactive, args)
+    print(lemma_cache.report())
+    print(result_cache.report())
+    print("Session finished.")
@@ -0,0 +1,9 @@
+import sys
+from pathlib import Path
+
+# Скрипты заданий импортируют соседей по простому имени (from index_format import ...),
+# поэтому в sys.path кладутся корень репозитория и папки заданий.
+ROOT = Path(__file__).resolve().parent.parent
+for path in (ROOT, ROOT / "task1", ROOT / "task2", ROOT / "task3", ROOT / "task4", ROOT / "task5"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+spacy = pytest.importorskip("spacy")
+
+import bm25
+
+
+def write_doc(tmp_path, doc_id, text, lemma_lines, counts_lines=None):
+    cleaned = tmp_path / "cleaned"
+    lemmas = tmp_path / "processed_txts"
+    cleaned.mkdir(exist_ok=True)
+    lemmas.mkdir(exist_ok=True)
+    (cleaned / f"{doc_id}.txt").write_text(text, encoding="utf-8")
+    (lemmas / f"{doc_id}_lemmas.txt").write_text("".join(line + "\n" for line in lemma_lines), encoding="utf-8")
+    if counts_lines is not None:
+        (lemmas / f"{doc_id}_counts.txt").write_text("".join(line + "\n" for line in counts_lines), encoding="utf-8")
+    return cleaned, lemmas
+
+
+def field_tf_sums(arrays):
+    sums = np.zeros(arrays["lengths"].shape)
+    np.add.at(sums, arrays["col_rows"], arrays["field_tf"])
+    return sums
+
+
+def test_ambiguous_token_counts_once(tmp_path):
+    # "saw" встречается с леммами "saw" и "see": каждое вхождение дает tf одной, самой частой, лемме
+    text = "Saw\n\nshe saw the saw\n\nSomeone\n\nRock\n\nthey saw a band and saw it again\n"
+    cleaned, lemmas = write_doc(
+        tmp_path, 1, text,
+        ["again again", "band band", "rock rock", "saw saw", "see saw", "someone someone"],
+        ["again 0:1", "band 1:1", "rock 2:1", "saw 3:1 4:4", "someone 5:1"])
+    arrays = bm25.build_index(cleaned, lemmas, spacy.blank("en").tokenizer)
+
+    assert (field_tf_sums(arrays) == arrays["lengths"]).all()
+    vocab = [str(lemma) for lemma in arrays["vocab"]]
+    see = arrays["field_tf"][arrays["col_ptr"][vocab.index("see")]]
+    assert see.tolist() == [1, 2, 0, 0, 2]  # поля приводятся к нижнему регистру, как в task2
+    assert "saw" not in vocab
+
+
+def test_without_counts_file_first_lemma(tmp_path):
+    cleaned, lemmas = write_doc(tmp_path, 1, "Saw\n\nsaw\n\n\n\n\n\nsaw saw\n", ["saw saw", "see saw"])
+    arrays = bm25.build_index(cleaned, lemmas, spacy.blank("en").tokenizer)
+    assert (field_tf_sums(arrays) == arrays["lengths"]).all()
+    assert [str(lemma) for lemma in arrays["vocab"]] == ["saw"]
@@ -0,0 +1,74 @@
+import random
+import re
+
+import pytest
+
+from boolean_query import Evaluator, QuerySyntaxError, canonical, parse
+from index_format import open_index, write_binary_index
+
+WORDS = [f"w{i}" for i in range(12)] + ["missing"]  # missing -- слова нет в индексе
+
+
+def old_eval(query, index, all_docs):
+    # прежний bool_search.py: запрос переводился в выражение над множествами и вычислялся eval()
+    expression = []
+    for token in re.findall(r"\w+|\(|\)", query):
+        if token == "and":
+            expression.append("&")
+        elif token == "or":
+            expression.append("|")
+        elif token == "not":
+            expression.append("all_docs -")
+        elif token in ("(", ")"):
+            expression.append(token)
+        else:
+            expression.append(f"set({list(index.get(token, set()))})")
+    return eval(" ".join(expression), {"all_docs": all_docs})
+
+
+def random_query(rng, depth=0):
+    # явные операторы и без двойного NOT: на таких запросах старая и новая грамматики совпадают
+    if depth > 2 or rng.random() < 0.4:
+        operand = rng.choice(WORDS)
+    else:
+        operand = "(" + random_query(rng, depth + 1) + ")"
+    if rng.random() < 0.3:
+        operand = "not " + operand
+    if depth > 3 or rng.random() < 0.35:
+        return operand
+    return operand + rng.choice([" and ", " or "]) + random_query(rng, depth + 1)
+
+
+@pytest.fixture(scope="module")
+def indexes(tmp_path_factory):
+    rng = random.Random(7)
+    inverted_index = {word: set(rng.sample(range(1, 60), rng.randint(1, 30))) for word in WORDS[:-1]}
+    path = tmp_path_factory.mktemp("index") / "inverted_index.bin"
+    write_binary_index(path, inverted_index)
+    return inverted_index, open_index(path)
+
+
+def test_parser_matches_old_eval(indexes):
+    inverted_index, index = indexes
+    all_docs = set().union(*inverted_index.values())
+    evaluator = Evaluator(index)
+    rng = random.Random(8)
+    for _ in range(2000):
+        query = random_query(rng)
+        result = evaluator.evaluate(parse(query, lambda word: word))
+        assert result == sorted(result), query
+        assert set(result) == old_eval(query, inverted_index, all_docs), query
+
+
+def test_implicit_and_and_canonical_form(indexes):
+    _, index = indexes
+    evaluator = Evaluator(index)
+    lemmatize = lambda word: word  # noqa: E731
+    assert evaluator.evaluate(parse("w1 w2", lemmatize)) == evaluator.evaluate(parse("w1 and w2", lemmatize))
+    assert canonical(parse("w1 and (w2 and w1)", lemmatize)) == canonical(parse("w2 and w1", lemmatize))
+
+
+@pytest.mark.parametrize("query", ["", "w1 and", "(w1 or w2", "w1 )", "and w1"])
+def test_syntax_errors(query):
+    with pytest.raises(QuerySyntaxError):
+        parse(query, lambda word: word)
@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+pytest.importorskip("bs4")
+
+import fetch_and_clean
+
+URLS = [f"https://example.com/page{i}" for i in range(1, 4)]
+
+
+class Response:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, text):
+        self.text = text
+
+
+def run(monkeypatch, tmp_path, pages):
+    # pages: url -> HTML; страница с "broken" падает при очистке
+    def iter_pages(urls, *args, **kwargs):
+        for file_id, url in enumerate(urls, start=1):
+            yield file_id, url, Response(pages[url]), None
+
+    extract = fetch_and_clean.extract_fields_from_html
+
+    def extract_fields_from_html(html, parser):
+        if "broken" in html:
+            raise ValueError("не разобрать")
+        return extract(html, parser)
+
+    monkeypatch.setattr(fetch_and_clean, "iter_pages", iter_pages)
+    monkeypatch.setattr(fetch_and_clean, "extract_fields_from_html", extract_fields_from_html)
+    fetch_and_clean.run_pipeline(URLS, str(tmp_path / "pages"), tmp_path / "cleaned", clean_workers=1)
+    pages_dir = tmp_path / "pages"
+    index = (pages_dir / "index.txt").read_text(encoding="utf-8").split("\n")
+    failed = (pages_dir / "failed.txt").read_text(encoding="utf-8") if (pages_dir / "failed.txt").exists() else ""
+    manifest = json.loads((pages_dir / "manifest.json").read_text(encoding="utf-8"))
+    return index, failed, manifest
+
+
+def html(text):
+    return f"<html><head><title>{text}</title></head><body><p>{text}</p></body></html>"
+
+
+def test_failed_clean_is_not_recorded(tmp_path, monkeypatch):
+    pages = {URLS[0]: html("one"), URLS[1]: html("broken"), URLS[2]: html("three")}
+    index, failed, manifest = run(monkeypatch, tmp_path, pages)
+
+    assert index == [f"1 {URLS[0]}", f"3 {URLS[2]}"]  # без очищенного файла страницы нет и в index.txt
+    assert failed.startswith(f"2 {URLS[1]} clean failed: ValueError")
+    assert set(manifest) == {URLS[0], URLS[2]}
+    assert sorted(path.name for path in (tmp_path / "cleaned").iterdir()) == ["1.txt", "3.txt"]
+
+
+def test_failed_clean_keeps_previous_version(tmp_path, monkeypatch):
+    pages = {URLS[0]: html("one"), URLS[1]: html("two"), URLS[2]: html("three")}
+    run(monkeypatch, tmp_path, pages)
+    previous = (tmp_path / "cleaned" / "2.txt").read_bytes()
+
+    pages[URLS[1]] = html("two broken")
+    index, failed, manifest = run(monkeypatch, tmp_path, pages)
+
+    assert index == [f"1 {URLS[0]}", f"2 {URLS[1]}", f"3 {URLS[2]}"]  # прошлая версия страницы осталась
+    assert (tmp_path / "cleaned" / "2.txt").read_bytes() == previous
+    assert failed.startswith(f"2 {URLS[1]} clean failed")
+    assert URLS[1] not in manifest  # следующий запуск обработает страницу заново
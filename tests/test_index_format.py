@@ -0,0 +1,37 @@
+import random
+
+import pytest
+
+from index_format import decode_postings, encode_postings, open_index, write_binary_index, write_text_index
+
+
+def random_index(seed, n_terms=300, n_docs=500):
+    rng = random.Random(seed)
+    terms = {f"lemma{i}" for i in range(n_terms)} | {"ёлка", "ülke", "a", "ab"}  # не-ASCII и префиксы
+    return {term: set(rng.sample(range(1, n_docs), rng.randint(1, 40))) for term in terms}
+
+
+def test_postings_round_trip():
+    rng = random.Random(1)
+    for _ in range(200):
+        docs = sorted(rng.sample(range(1, 2 ** 40, rng.randint(1, 2 ** 20)), rng.randint(0, 50)))
+        assert decode_postings(encode_postings(docs)) == docs
+
+
+@pytest.mark.parametrize("writer", [write_binary_index, write_text_index])
+def test_index_round_trip(tmp_path, writer):
+    inverted_index = random_index(2)
+    path = tmp_path / "index"
+    writer(path, inverted_index)
+    index = open_index(path)
+
+    assert index.all_docs == set().union(*inverted_index.values())
+    for term, docs in inverted_index.items():
+        assert term in index
+        assert index.postings(term) == sorted(docs)
+        assert index.get(term) == docs
+        assert index.df(term) == len(docs)
+    assert "нет такой" not in index
+    assert index.postings("нет такой") == []
+    assert index.get("нет такой") is None
+    assert {term: set(docs) for term, docs in index.items()} == inverted_index
@@ -0,0 +1,75 @@
+import random
+
+import pytest
+
+from boolean_query import Evaluator, PositionalIndexMissing, parse
+from index_format import open_index, write_binary_index, write_positional_index
+
+WORDS = [f"w{i}" for i in range(6)]
+
+
+def test_positional_round_trip(tmp_path):
+    rng = random.Random(3)
+    terms = {f"lemma{i}" for i in range(300)} | {"ёлка", "a", "ab"}  # не-ASCII и префиксы
+    positional_index = {term: {doc_id: sorted(rng.sample(range(2000), rng.randint(1, 20)))
+                               for doc_id in rng.sample(range(1, 500), rng.randint(1, 40))}
+                        for term in terms}
+    path = tmp_path / "positional_index.bin"
+    write_positional_index(path, positional_index)
+    index = open_index(path)
+
+    for term, docs in positional_index.items():
+        assert index.postings(term) == sorted(docs)
+        assert index.positions(term) == docs
+        candidates = set(rng.sample(sorted(docs), len(docs) // 2))
+        assert index.positions(term, candidates) == {doc_id: docs[doc_id] for doc_id in candidates}
+    assert dict(index.items()) == positional_index
+
+
+@pytest.fixture(scope="module")
+def corpus(tmp_path_factory):
+    rng = random.Random(4)
+    docs = {doc_id: rng.choices(WORDS, k=rng.randint(1, 15)) for doc_id in range(1, 80)}
+    inverted_index = {}
+    positional_index = {}
+    for doc_id, words in docs.items():
+        for position, word in enumerate(words):
+            inverted_index.setdefault(word, set()).add(doc_id)
+            positional_index.setdefault(word, {}).setdefault(doc_id, []).append(position)
+    tmp = tmp_path_factory.mktemp("index")
+    write_binary_index(tmp / "inverted_index.bin", inverted_index)
+    write_positional_index(tmp / "positional_index.bin", positional_index)
+    return docs, open_index(tmp / "inverted_index.bin"), open_index(tmp / "positional_index.bin")
+
+
+def has_phrase(words, phrase):
+    return any(words[i:i + len(phrase)] == phrase for i in range(len(words)))
+
+
+def has_near(words, left, right, distance):
+    return any(a == left and b == right and abs(i - j) <= distance
+               for i, a in enumerate(words) for j, b in enumerate(words))
+
+
+def test_phrase_and_near_match_brute_force(corpus):
+    docs, index, positional = corpus
+    evaluator = Evaluator(index, positional)
+    search = lambda query: evaluator.evaluate(parse(query, lambda word: word))  # noqa: E731
+    for left in WORDS:
+        for right in WORDS:
+            assert search(f'"{left} {right}"') == [doc_id for doc_id, words in docs.items()
+                                                   if has_phrase(words, [left, right])]
+            assert search(f'"{left} {right} {left}"') == [doc_id for doc_id, words in docs.items()
+                                                          if has_phrase(words, [left, right, left])]
+            for distance in (1, 3):
+                assert search(f"{left} near/{distance} {right}") == [
+                    doc_id for doc_id, words in docs.items() if has_near(words, left, right, distance)]
+            # внутри AND фраза проверяется только на уже найденных документах
+            assert search(f'w0 and "{left} {right}"') == [doc_id for doc_id, words in docs.items()
+                                                          if "w0" in words and has_phrase(words, [left, right])]
+
+
+def test_phrase_without_positional_index(corpus):
+    _, index, _ = corpus
+    with pytest.raises(PositionalIndexMissing):
+        Evaluator(index).evaluate(parse('"w0 w1"', lambda word: word))
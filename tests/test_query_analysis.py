@@ -0,0 +1,64 @@
+import pytest
+
+from common.lemma_cache import LemmaCache
+from common.spacy_model import is_installed, load_nlp
+
+import vector_search
+
+pytestmark = pytest.mark.skipif(not is_installed(), reason="модель spaCy не установлена")
+
+QUERIES = [
+    "pop punk",
+    "The band was recording their best songs",
+    "she saw the saw on the table",
+    "Kid A by Radiohead: an album that left guitars behind",
+    "running runs ran",
+    "don’t stop believing",
+    "  Loud   GUITARS and quiet drums ",
+]
+
+
+@pytest.fixture(scope="module")
+def nlp():
+    return load_nlp()
+
+
+def test_cached_analysis_equals_uncached(nlp, tmp_path):
+    # с кэшем лемм запрос анализируется так же, как nlp(query): теги и леммы в контексте запроса
+    lemma_cache = LemmaCache(tmp_path / "lemma_cache.json", model="test")
+    for _ in range(2):  # второй проход -- уже из заполненного кэша
+        for query in QUERIES:
+            query = vector_search.normalize_query(query)
+            assert vector_search.analyze_query(query, nlp, lemma_cache) == vector_search.analyze_query(query, nlp)
+    assert lemma_cache.hits > 0
+
+
+def test_batch_analysis_equals_scalar(nlp, tmp_path):
+    lemma_cache = LemmaCache(tmp_path / "lemma_cache.json", model="test")
+    queries = [vector_search.normalize_query(query) for query in QUERIES]
+    expected = [vector_search.analyze_query(query, nlp) for query in queries]
+    assert list(vector_search.analyze_queries(queries, nlp, lemma_cache, batch_size=3)) == expected
+    assert list(vector_search.analyze_queries(queries, nlp, batch_size=3)) == expected
+
+
+def test_token_lemma_depends_on_morphology(tmp_path):
+    # лемматизатор по правилам: "saw" с VerbForm=Inf -- базовая форма, в прошедшем времени -- "see"
+    spacy = pytest.importorskip("spacy")
+    from spacy.lookups import Lookups
+    from spacy.tokens import Doc
+
+    nlp = spacy.blank("en")
+    lemmatizer = nlp.add_pipe("lemmatizer", config={"mode": "rule"})
+    lookups = Lookups()
+    lookups.add_table("lemma_rules", {"verb": [["ed", "e"], ["ed", ""]], "noun": [["s", ""]]})
+    lookups.add_table("lemma_index", {"verb": ["see"], "noun": ["saw"]})
+    lookups.add_table("lemma_exc", {"verb": {"saw": ["see"]}})
+    lemmatizer.initialize(lookups=lookups)
+    doc = Doc(nlp.vocab, words=["saw", "saw", "saw", "Saw"], pos=["VERB", "VERB", "NOUN", "VERB"],
+              tags=["VB", "VBD", "NN", "VBD"],
+              morphs=["VerbForm=Inf", "Tense=Past|VerbForm=Fin", "Number=Sing", "Tense=Past|VerbForm=Fin"])
+
+    lemma_cache = LemmaCache(tmp_path / "lemma_cache.json", model="test")
+    for _ in range(2):
+        assert [lemma_cache.token_lemma(token, lemmatizer) for token in doc] == \
+            [lemmatizer.lemmatize(token)[0] for token in doc] == ["saw", "see", "saw", "see"]
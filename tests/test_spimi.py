@@ -0,0 +1,38 @@
+import random
+
+import pytest
+
+from build_inverted_index import collect_postings
+from index_format import write_binary_index, write_text_index
+from spimi import MAX_FAN_IN, build_spimi
+
+
+@pytest.fixture
+def terms_dir(tmp_path):
+    rng = random.Random(5)
+    vocab = [f"lemma{i}" for i in range(400)] + ["ёлка", "a", "ab"]
+    terms_dir = tmp_path / "processed_txts"
+    terms_dir.mkdir()
+    for doc_id in rng.sample(range(1, 1000), MAX_FAN_IN + 20):
+        lemmas = sorted(rng.sample(vocab, rng.randint(1, 60)))
+        (terms_dir / f"{doc_id}_lemmas.txt").write_text("".join(f"{lemma} {lemma}\n" for lemma in lemmas),
+                                                        encoding="utf-8")
+        (terms_dir / f"{doc_id}_tokens.txt").write_text("не леммы\n", encoding="utf-8")
+    return terms_dir
+
+
+@pytest.mark.parametrize("budget", [1, 20000, 2 ** 30])  # run на документ (с многопроходным слиянием), несколько, один
+def test_spimi_matches_in_memory_build(tmp_path, terms_dir, budget):
+    inverted_index = collect_postings(str(terms_dir), verbose=False)
+    write_binary_index(tmp_path / "memory.bin", inverted_index)
+    write_text_index(tmp_path / "memory.txt", inverted_index)
+
+    n_runs, n_terms = build_spimi(str(terms_dir), budget, tmp_path / "spimi.bin", tmp_path / "spimi.txt",
+                                  str(tmp_path))
+
+    assert n_terms == len(inverted_index)
+    assert (n_runs > MAX_FAN_IN) if budget == 1 else (n_runs >= 1)
+    assert (tmp_path / "spimi.bin").read_bytes() == (tmp_path / "memory.bin").read_bytes()
+    assert (tmp_path / "spimi.txt").read_bytes() == (tmp_path / "memory.txt").read_bytes()
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "memory.bin", "memory.txt", "processed_txts", "spimi.bin", "spimi.txt"]  # runs удалены
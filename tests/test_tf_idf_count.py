@@ -0,0 +1,94 @@
+import os
+import random
+
+import pytest
+
+import tf_idf_count
+
+WORDS = ["cat", "cats", "dog", "dogs", "ran", "run", "runs", "the", "a", "saw", "see"]
+LEMMAS = {"cat": "cat", "cats": "cat", "dog": "dog", "dogs": "dog", "ran": "run", "run": "run", "runs": "run",
+          "the": "the", "a": "a", "saw": "see", "see": "see"}
+
+
+def write_doc(root, doc_id, rng, counts=False):
+    words = rng.choices(WORDS, k=rng.randint(3, 30))
+    lemma2tokens = {}
+    for word in words:
+        lemma2tokens.setdefault(LEMMAS[word], set()).add(word)
+    lemmas = sorted(lemma2tokens)
+    (root / "cleaned" / f"{doc_id}.txt").write_text(" ".join(words) + "\n", encoding="utf-8")
+    (root / "processed_txts" / f"{doc_id}_lemmas.txt").write_text(
+        "".join(f"{lemma} {' '.join(sorted(lemma2tokens[lemma]))}\n" for lemma in lemmas), encoding="utf-8")
+    counts_path = root / "processed_txts" / f"{doc_id}_counts.txt"
+    if counts:  # новый task2: вхождения токенов по леммам
+        counts_path.write_text("".join(f"{word} {lemmas.index(LEMMAS[word])}:{words.count(word)}\n"
+                                       for word in sorted(set(words))), encoding="utf-8")
+    else:
+        counts_path.unlink(missing_ok=True)
+
+
+def snapshot(root):
+    out = root / "tfidf_outputs"
+    return {str(path.relative_to(out)): path.read_bytes() for path in sorted(out.rglob("*")) if path.is_file()}
+
+
+def run(monkeypatch, root, **kwargs):
+    monkeypatch.chdir(root)
+    tf_idf_count.update_tfidf(root / "cleaned", root / "processed_txts", tf_idf_count.STATS_FILE, **kwargs)
+    return snapshot(root)
+
+
+@pytest.mark.parametrize("separate_idf", [False, True])
+def test_incremental_matches_full_rebuild(tmp_path, monkeypatch, separate_idf):
+    rng = random.Random(21)
+    work = tmp_path / "work"
+    for root in (work, tmp_path / "full"):
+        (root / "cleaned").mkdir(parents=True)
+        (root / "processed_txts").mkdir()
+    for doc_id in range(1, 16):
+        write_doc(work, doc_id, rng, counts=doc_id % 3 == 0)
+    run(monkeypatch, work)  # прошлый запуск -- всегда в обычном режиме, затем смена режима
+
+    write_doc(work, 16, rng)  # новый документ
+    write_doc(work, 17, rng, counts=True)
+    write_doc(work, 4, rng)  # измененные
+    write_doc(work, 6, rng, counts=True)
+    write_doc(work, 9, rng)  # был с counts, стал без
+    (work / "cleaned" / "2.txt").unlink()  # удаленный
+    (work / "processed_txts" / "2_lemmas.txt").unlink()
+    incremental = run(monkeypatch, work, separate_idf=separate_idf)
+
+    for path in (work / "cleaned").iterdir():
+        (tmp_path / "full" / "cleaned" / path.name).write_bytes(path.read_bytes())
+    for path in (work / "processed_txts").iterdir():
+        (tmp_path / "full" / "processed_txts" / path.name).write_bytes(path.read_bytes())
+    full = run(monkeypatch, tmp_path / "full", full=True, separate_idf=separate_idf)
+
+    assert incremental == full
+    assert ("lemmas_idf.txt" in full) == separate_idf
+    assert not any(name.startswith("lemmas/2_") or name.startswith("lemmas_tf/2_") for name in full)
+
+
+def test_separate_idf_add_rewrites_only_new_doc(tmp_path, monkeypatch):
+    rng = random.Random(22)
+    (tmp_path / "cleaned").mkdir()
+    (tmp_path / "processed_txts").mkdir()
+    for doc_id in range(1, 6):
+        write_doc(tmp_path, doc_id, rng, counts=doc_id % 2 == 0)
+    run(monkeypatch, tmp_path, separate_idf=True)
+    out = tmp_path / "tfidf_outputs"
+    mtimes = {}
+    for path in out.rglob("*"):
+        if path.is_file():
+            os.utime(path, ns=(0, 0))  # любая запись сдвинет время, даже в пределах одного тика часов
+            mtimes[path] = 0
+
+    write_doc(tmp_path, 6, rng, counts=True)
+    run(monkeypatch, tmp_path, separate_idf=True)
+    rewritten = {str(path.relative_to(out)) for path, mtime in mtimes.items() if path.stat().st_mtime_ns != mtime}
+    added = {str(path.relative_to(out)) for path in out.rglob("*") if path.is_file() and path not in mtimes}
+    assert added == {"terms_tf/6_terms_tf.txt", "lemmas_tf/6_lemmas_tf.txt"}
+    # idf меняется у всех терминов, но пишется одной таблицей; файлы tf старых документов не трогаются
+    assert rewritten <= {"terms_idf.txt", "lemmas_idf.txt", "terms_tfidf.bin", "lemmas_tfidf.bin",
+                         "version.txt", "stats.json"}
+    assert "lemmas_idf.txt" in rewritten
@@ -0,0 +1,71 @@
+import math
+import random
+
+import pytest
+
+pytest.importorskip("spacy")
+
+from common.tfidf_matrix import TfidfMatrix, write_matrix
+from vector_search import search, search_batch, search_taat
+
+K = 10  # search отдает столько же (RESULTS_COUNT)
+
+
+@pytest.fixture(scope="module")
+def corpus(tmp_path_factory):
+    rng = random.Random(11)
+    vocab = [f"lemma{i}" for i in range(150)]
+    idf = {lemma: float(f"{rng.uniform(0.1, 5):.6f}") for lemma in vocab}
+    doc_ids = sorted(rng.sample(range(1, 2000), 300))
+    rows = []
+    for _ in doc_ids:
+        # веса с 6 знаками, как в файлах tf-idf: среди расстояний бывают равные
+        rows.append([(lemma, idf[lemma], float(f"{idf[lemma] * rng.choice([0.01, 0.02, 0.05, 0.1]):.6f}"))
+                     for lemma in rng.sample(vocab, rng.randint(1, 25))])
+    path = tmp_path_factory.mktemp("tfidf") / "lemmas_tfidf.bin"
+    write_matrix(path, doc_ids, rows)
+
+    # то же, что load_doc_vectors: нормы в порядке строк файла
+    doc_vectors = {doc_id: {lemma: weight for lemma, _, weight in row} for doc_id, row in zip(doc_ids, rows)}
+    doc_norms = {doc_id: math.sqrt(sum(weight * weight for _, _, weight in row)) for doc_id, row in zip(doc_ids, rows)}
+    return vocab, idf, TfidfMatrix(path), doc_vectors, doc_norms
+
+
+def query_vectors(vocab, idf, n=300):
+    rng = random.Random(12)
+    return [{lemma: rng.randint(1, 3) / 4 * idf[lemma] for lemma in rng.sample(vocab, rng.randint(1, 8))}
+            for _ in range(n)]
+
+
+@pytest.mark.parametrize("max_score", [False, True])
+def test_taat_matches_brute_force(corpus, max_score):
+    vocab, idf, matrix, doc_vectors, doc_norms = corpus
+    for query_vector in query_vectors(vocab, idf):
+        assert search_taat(query_vector, matrix, K, max_score=max_score) == search(query_vector, doc_vectors, doc_norms)
+
+
+def test_empty_query(corpus):
+    _, _, matrix, _, _ = corpus
+    assert search_taat({}, matrix, K) == []
+    assert search_taat({}, matrix, K, max_score=True) == []
+
+
+def test_batch_matches_brute_force(corpus):
+    vocab, idf, matrix, doc_vectors, doc_norms = corpus
+    vectors = query_vectors(vocab, idf)
+    for query_vector, batch in zip(vectors, search_batch(vectors, matrix, K, batch_size=64)):
+        expected = search(query_vector, doc_vectors, doc_norms)
+        # произведения складываются в другом порядке: расстояния -- с точностью до округления
+        assert [doc_id for _, doc_id in batch] == [doc_id for _, doc_id in expected]
+        assert [distance for distance, _ in batch] == pytest.approx([distance for distance, _ in expected], abs=1e-12)
+
+
+def test_brute_force_returns_k(corpus):
+    # k больше RESULTS_COUNT: перебор (путь сервера без упакованной матрицы) отдает столько же, сколько TAAT
+    vocab, idf, matrix, doc_vectors, doc_norms = corpus
+    sizes = []
+    for query_vector in query_vectors(vocab, idf, n=50):
+        expected = search_taat(query_vector, matrix, 50)
+        assert search(query_vector, doc_vectors, doc_norms, 50) == expected
+        sizes.append(len(expected))
+    assert max(sizes) > K